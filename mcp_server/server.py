@@ -13,6 +13,21 @@ from .tools.stats import register_stats_tools
 from .tools.visual import register_visual_tools
 from .tools.annotation import register_annotation_tools
 from .tools.data import register_data_tools
+from .tools.pseudobulk import register_pseudobulk_tools
+from .tools.summary import register_summary_tools
+from .tools.sketch import register_sketch_tools
+from .tools.genes import register_gene_tools
+from .tools.markers import register_marker_tools
+from .tools.scoring import register_scoring_tools
+from .tools.similarity import register_similarity_tools
+from .tools.specificity import register_specificity_tools
+from .tools.cells import register_cell_tools
+from .tools.program_index import register_index_tools
+from .tools.vocab import register_vocab_tools
+from .tools.preload import register_preload_tools, preloader
+from .tools.lazy import start_background_warmup
+from .tools.executor import ToolRegistrar, register_executor_tools
+from .tools.jobs import register_job_tools
 
 
 mcp = FastMCP("eoe-tools", stateless_http=True, json_response=True)
@@ -30,11 +45,31 @@ def echo(message: str) -> str:
 
     return f"echo: {message}"
 
-#init tools
-register_stats_tools(mcp)
-register_visual_tools(mcp)
-register_annotation_tools(mcp)
-register_data_tools(mcp)
+#init tools (blocking tools run on a bounded thread pool, see tools/executor.py)
+tools = ToolRegistrar(mcp)
+register_stats_tools(tools)
+register_visual_tools(tools)
+register_annotation_tools(tools)
+register_data_tools(tools)
+register_pseudobulk_tools(tools)
+register_summary_tools(tools)
+register_sketch_tools(tools)
+register_gene_tools(tools)
+register_marker_tools(tools)
+register_scoring_tools(tools)
+register_similarity_tools(tools)
+register_specificity_tools(tools)
+register_cell_tools(tools)
+register_index_tools(tools)
+register_vocab_tools(tools)
+register_preload_tools(tools)
+register_executor_tools(tools)
+register_job_tools(tools)
 
 if __name__ == "__main__":
+    # heavy libraries (anndata, scipy, plotly, openai) load on first use;
+    # warm them up in the background once the server is listening
+    start_background_warmup()
+    # warm recently used datasets and any new uploads on a worker thread
+    preloader.start()
     mcp.run(transport="streamable-http")
@@ -0,0 +1,72 @@
+"""
+Checks the out-of-core CSC copy of adata.X (tools/expression.py) against anndata / scipy.
+Run from the repository root:
+    python -m pytest -q mcp_server/test_expression.py
+"""
+
+import functools
+import sys
+from pathlib import Path
+
+import anndata as ad
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from tools import expression
+from tools.expression import ExpressionStore, write_csc_store
+
+
+def write_h5ad(path, x):
+    n_obs, n_vars = x.shape
+    adata = ad.AnnData(
+        X=x,
+        obs=pd.DataFrame(index=[f"c{i}" for i in range(n_obs)]),
+        var=pd.DataFrame(index=[f"GENE{j}" for j in range(n_vars)]),
+    )
+    adata.write_h5ad(path)
+
+
+def random_x(seed=0, shape=(300, 40)):
+    rng = np.random.default_rng(seed)
+    x = sparse.random(*shape, density=0.1, format="csr", random_state=rng, dtype=np.float32)
+    x.data = np.round(x.data * 10)  # some exact repeats
+    x.eliminate_zeros()  # a dense X has no explicit zeros to keep
+    return x
+
+
+@pytest.mark.parametrize("layout", ["csr", "csc", "dense"])
+def test_write_csc_store_matches_tocsc(tmp_path, monkeypatch, layout):
+    x = random_x()
+    stored = {"csr": x, "csc": x.tocsc(), "dense": x.toarray()}[layout]
+    src = tmp_path / "test.h5ad"
+    write_h5ad(src, stored)
+
+    # small chunks, so the transpose runs over many passes
+    monkeypatch.setattr(expression, "_row_chunks", functools.partial(expression._row_chunks, chunk_nnz=37))
+    store = ExpressionStore(write_csc_store(src, tmp_path / "X_csc"))
+
+    expected = x.tocsc()
+    expected.sort_indices()
+    assert (store.n_obs, store.n_vars) == x.shape
+    assert np.array_equal(store.indptr, expected.indptr)
+    assert np.array_equal(store.indices, expected.indices)
+    assert np.array_equal(store.data, expected.data)
+    assert store.var_names == [f"GENE{j}" for j in range(x.shape[1])]
+
+
+def test_expression_store_queries(tmp_path):
+    x = random_x(seed=1)
+    src = tmp_path / "test.h5ad"
+    write_h5ad(src, x)
+    store = ExpressionStore(write_csc_store(src, tmp_path / "X_csc"))
+    dense = x.toarray()
+
+    assert store.find("gene3") == 3
+    assert np.array_equal(store.dense(5), dense[:, 5])
+    assert np.allclose(store.gene_means(), dense.mean(axis=0))
+    genes, weights = np.array([1, 4, 7]), np.array([0.5, -1.0, 2.0])
+    assert np.allclose(store.matvec(genes, weights), dense[:, genes] @ weights)
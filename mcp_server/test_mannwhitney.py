@@ -0,0 +1,105 @@
+"""
+Checks the Mann-Whitney implementations in tools/parallel.py against scipy.
+Run from the repository root:
+    python -m pytest -q mcp_server/test_mannwhitney.py
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from scipy import stats
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from tools.parallel import REST, mannwhitney_all_pairs, mannwhitney_columns
+
+
+def tied_column(rng, n):
+    """Rounded values, so most of them are tied"""
+    return np.round(rng.normal(size=n), 1)
+
+
+@pytest.mark.parametrize("alternative", ["two-sided", "greater", "less"])
+def test_mannwhitney_columns_matches_scipy(alternative):
+    rng = np.random.default_rng(0)
+    n = 2000
+    x = tied_column(rng, n)
+    codes = rng.integers(0, 4, n)
+    codes[:6] = 4  # a group of 6 cells: scipy may use the exact distribution
+    comparisons = [(g, REST) for g in range(5)] + [(0, 1), (2, 4)]
+
+    (results,) = mannwhitney_columns([x], codes, comparisons, alternative, 3)
+    for (a, b), (u, p, med_diff, n_a, n_b) in zip(comparisons, results):
+        xa = x[codes == a]
+        xb = x[codes != a] if b == REST else x[codes == b]
+        expected = stats.mannwhitneyu(xa, xb, alternative=alternative)
+        assert (n_a, n_b) == (len(xa), len(xb))
+        assert u == pytest.approx(expected.statistic)
+        assert p == pytest.approx(expected.pvalue, rel=1e-9, abs=1e-15)
+        assert med_diff == pytest.approx(np.median(xa) - np.median(xb))
+
+
+def test_mannwhitney_columns_precomputed_order():
+    rng = np.random.default_rng(1)
+    x = tied_column(rng, 500)
+    codes = rng.integers(0, 3, 500)
+    comparisons = [(0, REST), (1, 2)]
+    order = np.argsort(x, kind="stable")
+
+    plain = mannwhitney_columns([x], codes, comparisons, "two-sided", 3)
+    ordered = mannwhitney_columns([x], codes, comparisons, "two-sided", 3, orders=[order])
+    assert np.allclose(plain, ordered)
+
+
+def test_mannwhitney_columns_small_and_nan_groups():
+    rng = np.random.default_rng(2)
+    x = rng.normal(size=200)
+    codes = np.repeat([0, 1], 100)
+    codes[:2] = 2  # below min_cells
+    x[150] = np.nan  # scipy propagates NaN
+
+    (results,) = mannwhitney_columns([x], codes, [(2, REST), (0, 1)], "two-sided", 3)
+    assert results[0][:2] == (0.0, 1.0)
+    assert np.isnan(results[1][1])
+
+
+@pytest.mark.parametrize("alternative", ["two-sided", "greater", "less"])
+def test_mannwhitney_all_pairs_matches_scipy(alternative):
+    rng = np.random.default_rng(3)
+    n = 1500
+    x = tied_column(rng, n)
+    x[::97] = np.nan  # dropped
+    codes = rng.integers(0, 3, n)
+    codes[:7] = 3  # a group of 7 cells: scipy may use the exact distribution
+    codes[7:20] = -1  # ignored
+
+    ((u, p, med, counts),) = mannwhitney_all_pairs([x], codes, 4, alternative, 3)
+    groups = [x[(codes == g) & ~np.isnan(x)] for g in range(4)]
+    assert counts.tolist() == [len(g) for g in groups]
+    for a in range(4):
+        for b in range(4):
+            if a == b:
+                continue
+            expected = stats.mannwhitneyu(groups[a], groups[b], alternative=alternative)
+            assert u[a, b] == pytest.approx(stats.mannwhitneyu(groups[a], groups[b]).statistic)
+            assert p[a, b] == pytest.approx(expected.pvalue, rel=1e-9, abs=1e-15)
+            assert med[a, b] == pytest.approx(np.median(groups[a]) - np.median(groups[b]))
+
+
+def test_mannwhitney_all_pairs_precomputed_order_and_small_groups():
+    rng = np.random.default_rng(4)
+    x = tied_column(rng, 600)
+    x[5] = np.nan
+    codes = rng.integers(0, 3, 600)
+    codes[:2] = 3  # below min_cells
+    order = np.argsort(x, kind="stable")  # NaNs last, as in the cached sort orders
+
+    plain = mannwhitney_all_pairs([x], codes, 4, "two-sided", 3)
+    ordered = mannwhitney_all_pairs([x], codes, 4, "two-sided", 3, orders=[order])
+    for a, b in zip(plain[0], ordered[0]):
+        assert np.allclose(a, b, equal_nan=True)
+
+    u, p, med, _ = plain[0]
+    assert (u[3] == 0).all() and (p[3] == 1).all() and np.isnan(med[3]).all()
@@ -0,0 +1,67 @@
+"""
+Checks the sparse rank sums behind rank_marker_genes(method='wilcoxon')
+(tools/markers.py) against scipy.
+Run from the repository root:
+    python -m pytest -q mcp_server/test_markers.py
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from scipy import sparse, stats
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from tools.markers import _rank_sums
+
+
+def sparse_block(rng, n, n_genes):
+    """Mostly zeros, with tied positives and some negatives (e.g. scaled data)"""
+    x = np.round(rng.normal(size=(n, n_genes)), 1)
+    x[rng.random((n, n_genes)) < 0.7] = 0
+    x[:, 0] = 0  # an all-zero gene
+    x[:, 1] = np.abs(x[:, 1])  # no negatives
+    return sparse.csc_matrix(x)
+
+
+def test_rank_sums_match_rankdata():
+    rng = np.random.default_rng(0)
+    block = sparse_block(rng, 300, 6)
+    codes = rng.integers(0, 3, 300)
+
+    rank_sums, ties = _rank_sums(block, codes, 3)
+    dense = block.toarray()
+    for j in range(dense.shape[1]):
+        ranks = stats.rankdata(dense[:, j])
+        assert np.allclose(rank_sums[:, j], np.bincount(codes, weights=ranks, minlength=3))
+        _, t = np.unique(dense[:, j], return_counts=True)
+        assert ties[j] == pytest.approx(np.sum(t.astype(float) ** 3 - t))
+
+
+def test_rank_sums_match_mannwhitneyu():
+    rng = np.random.default_rng(1)
+    n = 400
+    block = sparse_block(rng, n, 5)
+    codes = rng.integers(0, 3, n)
+    codes[:6] = 3  # a small group
+    n_groups = 4
+
+    rank_sums, ties = _rank_sums(block, codes, n_groups)
+    dense = block.toarray()
+    for g in range(n_groups):
+        n_in = np.count_nonzero(codes == g)
+        n_out = n - n_in
+        u = rank_sums[g] - n_in * (n_in + 1) / 2
+        # the normal approximation rank_marker_genes uses
+        sigma = np.sqrt(n_in * n_out / 12 * ((n + 1) - ties / (n * (n - 1))))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            p = 2 * stats.norm.sf(np.abs((u - n_in * n_out / 2) / sigma))
+        for j in range(1, dense.shape[1]):
+            expected = stats.mannwhitneyu(
+                dense[codes == g, j], dense[codes != g, j], method="asymptotic", use_continuity=False
+            )
+            assert u[j] == pytest.approx(expected.statistic)
+            assert p[j] == pytest.approx(expected.pvalue, rel=1e-9)
+        assert np.isnan(p[0])  # all-zero gene: no variance
@@ -0,0 +1,68 @@
+"""
+Checks the batched permutation test and Beta-sampled bootstrap medians in
+tools/resampling.py against scipy and a direct bootstrap.
+Run from the repository root:
+    python -m pytest -q mcp_server/test_resampling.py
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from scipy import stats
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from tools.resampling import bootstrap_medians, permutation_pvalues
+
+
+@pytest.mark.parametrize("alternative", ["two-sided", "greater", "less"])
+def test_permutation_pvalues_match_scipy(alternative):
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(400, 2)).astype(np.float32)
+    x[:60, 0] += 0.3  # group a shifted in the first column only
+    in_a = np.arange(400) < 60
+
+    observed, pvals, used = permutation_pvalues(x, in_a, 4000, alternative, np.random.default_rng(1))
+    for j in range(2):
+        expected = stats.permutation_test(
+            (x[in_a, j], x[~in_a, j]),
+            lambda a, b: a.mean() - b.mean(),
+            n_resamples=20000,
+            alternative=alternative,
+            random_state=2,
+        )
+        assert observed[j] == pytest.approx(expected.statistic, abs=1e-5)
+        # Monte Carlo error of both estimates (early stopping only ends clear non-significance)
+        assert pvals[j] == pytest.approx(expected.pvalue, abs=0.02 + 0.3 * expected.pvalue)
+
+
+def test_permutation_draws_exactly_k_cells():
+    class TiedKeys:
+        """A generator whose keys all tie, so a threshold on the k-th key would select every cell"""
+
+        def random(self, shape, dtype=np.float64):
+            return np.zeros(shape, dtype=dtype)
+
+    # two cells, one per group: every one-cell draw is as extreme as the observed split
+    x = np.array([[0.0], [1.0]], dtype=np.float32)
+    in_a = np.array([True, False])
+    observed, pvals, used = permutation_pvalues(x, in_a, 50, "two-sided", TiedKeys())
+    assert observed[0] == pytest.approx(-1.0)
+    assert pvals[0] == pytest.approx(1.0)
+
+
+def test_bootstrap_medians_match_direct_resampling():
+    rng = np.random.default_rng(3)
+    x = rng.exponential(size=(301, 1))
+    x[::50] = np.nan
+
+    fast = bootstrap_medians(x, 20000, np.random.default_rng(4))[:, 0]
+
+    values = x[~np.isnan(x[:, 0]), 0]
+    draws = rng.choice(values, size=(20000, len(values)))
+    direct = np.median(draws, axis=1)
+
+    for q in (0.025, 0.5, 0.975):
+        assert np.quantile(fast, q) == pytest.approx(np.quantile(direct, q), rel=0.03)
@@ -0,0 +1,73 @@
+"""
+Checks which subset expressions tools/subset.py accepts and rejects.
+Run from the repository root:
+    python -m pytest -q mcp_server/test_subset.py
+"""
+
+import ast
+import sys
+from pathlib import Path
+
+import anndata as ad
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from tools import data
+from tools.subset import SubsetError, _subset_bitmap, parse_subset
+
+
+@pytest.mark.parametrize("expr", [
+    "cell_type == 'Epi'",
+    "'Epi' == cell_type",
+    "cell_type != 'Epi'",
+    "disease_status in ['Active', 'Remission']",
+    "disease_status not in ('Ctrl',)",
+    "n_counts >= 500",
+    "-1.5 < score <= 2",
+    "cell_type == 'Epi' and (n_counts > 500 or not disease_status == 'Ctrl')",
+    "  donor == 'd0'  ",
+])
+def test_parse_subset_accepts(expr):
+    tree, columns = parse_subset(expr)
+    assert columns == {}
+    assert isinstance(tree, (ast.BoolOp, ast.Compare, ast.UnaryOp))
+
+
+def test_parse_subset_backtick_columns():
+    tree, columns = parse_subset("`cell type` == 'B' and `n.genes` > 10")
+    assert sorted(columns.values()) == ["cell type", "n.genes"]
+    names = {n.id for n in ast.walk(tree) if isinstance(n, ast.Name)}
+    assert names == set(columns)
+
+
+@pytest.mark.parametrize("expr, message", [
+    ("cell_type ==", "Invalid subset expression"),
+    ("cell_type = 'Epi'", "Invalid subset expression"),
+    ("len(cell_type) > 2", "Comparisons need one column and one value"),
+    ("cell_type.str.startswith('E')", "Unsupported subset syntax"),
+    ("n_counts + 1 > 5", "Comparisons need one column and one value"),
+    ("n_counts > 2 * 5", "Not a literal value"),
+    ("cell_type in {[1]}", "Not a literal value"),
+    ("n_counts > other_column", "Comparisons need one column and one value"),
+    ("1 < 2", "Comparisons need one column and one value"),
+    ("cell_type is None", "Unsupported comparison"),
+    ("cell_type", "Unsupported subset syntax"),
+    ("__import__('os').system('true')", "Unsupported subset syntax"),
+])
+def test_parse_subset_rejects(expr, message):
+    with pytest.raises(SubsetError, match=message):
+        parse_subset(expr)
+
+
+def test_flag_column_equality(tmp_path, monkeypatch):
+    monkeypatch.setattr(data, "UPLOADS_DIR", tmp_path)
+    monkeypatch.setattr(data, "COLUMNAR_DIR", tmp_path / "columnar")
+    flags = np.arange(10) % 3 == 0
+    obs = pd.DataFrame({"is_doublet": flags}, index=[f"c{i}" for i in range(10)])
+    ad.AnnData(X=np.zeros((10, 2), dtype=np.float32), obs=obs).write_h5ad(tmp_path / "ds_flags_test.h5ad")
+
+    for expr, expected in [("is_doublet == True", flags), ("not is_doublet == True", ~flags), ("is_doublet != False", flags)]:
+        assert np.array_equal(np.unpackbits(_subset_bitmap("ds_flags", expr))[:10].astype(bool), expected)
@@ -3,11 +3,29 @@ from __future__ import annotations
 import os
 import json
 from typing import Optional
-from openai import OpenAI
+from .data import _obs_columns
+from .jobs import report_progress
+from .lazy import lazy_import
+from .specificity import _load_specificity
+from .stats import _resolve_programs
+
+openai = lazy_import("openai")
 
 # Global in-memory cache for annotations
 _annotation_cache: dict[str, dict] = {}
 
+
+def _specific_cell_types(h5ad_id: str, cell_type_col: str, program_name: str) -> Optional[list[str]]:
+    """Cell types where a program is most active, from the cached specificity metrics"""
+    spec = _load_specificity(h5ad_id, cell_type_col)
+    if spec is None or len(spec.groups) < 2:
+        return None
+    columns, missing = _resolve_programs([program_name], spec.program_cols)
+    if missing:
+        return None
+    return spec.top_groups(columns[0])
+
+
 def register_annotation_tools(mcp):
     """Initialize program annotation tools"""
 
@@ -17,7 +35,9 @@ def register_annotation_tools(mcp):
         genes: list[str],
         activity_stats: Optional[dict] = None,
         top_cell_types: Optional[list[str]] = None,
-        force_refresh: bool = False
+        force_refresh: bool = False,
+        h5ad_id: Optional[str] = None,
+        cell_type_col: str = "cell_type"
     ) -> dict:
         """
         Annotate a gene program with a human-readable name, description, and category.
@@ -29,6 +49,9 @@ def register_annotation_tools(mcp):
             activity_stats: Optional dict with stats like {"mean": 0.5, "std": 0.2, "median": 0.4}
             top_cell_types: Optional list of cell types where this program is highly active
             force_refresh: If True, bypass cache and regenerate annotation (default: False)
+            h5ad_id: Optional H5AD dataset; when top_cell_types is not given, they are taken
+                     from program_specificity (groups with the highest z-scored mean activity)
+            cell_type_col: Obs column with the cell types used with h5ad_id (default: "cell_type")
 
         Returns:
             dict with fields: program, name, description, category, confidence, cached
@@ -54,6 +77,14 @@ def register_annotation_tools(mcp):
                 "program": program_name
             }
 
+        if top_cell_types is None and h5ad_id:
+            obs_cols = _obs_columns(h5ad_id)
+            if obs_cols is None:
+                return {"error": f"Dataset {h5ad_id} not found", "program": program_name}
+            if cell_type_col not in obs_cols:
+                return {"error": f"Column {cell_type_col} not found", "program": program_name}
+            top_cell_types = _specific_cell_types(h5ad_id, cell_type_col, program_name)
+
         # Build the prompt
         gene_list = ", ".join(genes[:50])  # Limit to first 50 genes for token efficiency
         if len(genes) > 50:
@@ -87,7 +118,7 @@ Return ONLY a valid JSON object with these exact fields (no markdown, no extra t
 {"name": "...", "description": "...", "category": "...", "confidence": "..."}"""
 
         try:
-            client = OpenAI(api_key=api_key)
+            client = openai.OpenAI(api_key=api_key)
 
             response = client.chat.completions.create(
                 model=os.getenv("OPENAI_MODEL", "gpt-5.1"),
@@ -149,20 +180,23 @@ Return ONLY a valid JSON object with these exact fields (no markdown, no extra t
 
         Args:
             programs: List of dicts, each with keys: program_name, genes,
-                     and optionally activity_stats and top_cell_types
+                     and optionally activity_stats, top_cell_types, h5ad_id and cell_type_col
             force_refresh: If True, bypass cache for all programs (default: False)
 
         Returns:
             list of annotation dicts
         """
         results = []
-        for prog in programs:
+        for i, prog in enumerate(programs):
+            report_progress(i, len(programs), prog.get("program_name", ""))
             result = annotate_program(
                 program_name=prog.get("program_name"),
                 genes=prog.get("genes", []),
                 activity_stats=prog.get("activity_stats"),
                 top_cell_types=prog.get("top_cell_types"),
-                force_refresh=force_refresh
+                force_refresh=force_refresh,
+                h5ad_id=prog.get("h5ad_id"),
+                cell_type_col=prog.get("cell_type_col", "cell_type")
             )
             results.append(result)
 
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from typing import Literal, Optional
+
+import numpy as np
+from .data import _load_obs, _obs_columns, _obs_names, _virtual_columns
+from .lazy import lazy_import
+from .ordering import _cell_order, extreme_rows
+from .stats import _parse_program_number, _resolve_programs
+from .subset import SubsetError, _select_cells
+
+pd = lazy_import("pandas")
+
+# Most cells a single top_cells call returns
+MAX_CELLS = 1000
+
+# Columns queried before: the next query builds (and caches) the full sort order
+_queried: set[tuple[str, str]] = set()
+
+
+def _compact(values) -> list:
+    """Column values as JSON-friendly scalars (categories as strings, NaN as None)"""
+    if not pd.api.types.is_numeric_dtype(values) or isinstance(values.dtype, pd.CategoricalDtype):
+        return [None if pd.isna(v) else str(v) for v in values]
+    values = np.asarray(values)
+    if values.dtype.kind in "iub":
+        return values.tolist()
+    return [None if np.isnan(v) else float(v) for v in values.astype(np.float64)]
+
+
+def register_cell_tools(mcp):
+
+    @mcp.tool()
+    def top_cells(
+        h5ad_id: str,
+        program: str,
+        n_cells: int = 20,
+        direction: Literal["top", "bottom"] = "top",
+        threshold: Optional[float] = None,
+        columns: Optional[list[str]] = None,
+        subset: Optional[str] = None,
+        approximate: bool = False,
+    ) -> dict:
+        """
+        Cells with the highest (or lowest) activity of a program, with their metadata.
+        With threshold, only cells at or above it (at or below for direction='bottom')
+        are returned and all of them are counted.
+
+        Args:
+            h5ad_id: Dataset ID of the H5AD file
+            program: Program ('5' or 'new_program_5_activity_scaled') or numeric obs column (e.g. a score column)
+            n_cells: Number of cells to return (at most 1000), most extreme first
+            direction: 'top' for the highest values, 'bottom' for the lowest
+            threshold: Only cells with activity >= threshold ('top') or <= threshold ('bottom')
+            columns: Obs columns to return per cell (default: all non-program columns)
+            subset: Restrict the cells, e.g. "cell_type == 'Epi' and disease_status != 'Ctrl'"
+            approximate: Search a stratified subsample (see build_sketches)
+        """
+        obs_cols = _obs_columns(h5ad_id)
+        if obs_cols is None:
+            return {"error": f"Dataset {h5ad_id} not found"}
+
+        program_cols = [c for c in obs_cols if c.startswith("new_program_")]
+        found, missing = _resolve_programs([program], program_cols, obs_cols)
+        if missing:
+            return {"error": f"Program {program} not found"}
+        column = found[0]
+        if columns is None:
+            columns = [c for c in obs_cols if not c.startswith("new_program_") and c != column]
+        else:
+            missing = [c for c in columns if c not in obs_cols]
+            if missing:
+                return {"error": f"Columns not found: {missing}"}
+
+        try:
+            cells = _select_cells(h5ad_id, approximate, subset)
+        except SubsetError as e:
+            return {"error": str(e)}
+        series = _load_obs(h5ad_id, [column], cells.rows)[column]
+        if not pd.api.types.is_numeric_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype):
+            return {"error": f"Column {column} is not numeric"}
+        values = np.asarray(series, dtype=np.float64)
+
+        # one-off queries use argpartition; repeated ones share the cached argsort
+        key = (h5ad_id, column)
+        repeat = key in _queried and column not in _virtual_columns.get(h5ad_id, {})
+        _queried.add(key)
+        order = _cell_order(h5ad_id, column, cells.rows, build=repeat)
+
+        largest = direction == "top"
+        n_valid = int(np.count_nonzero(~np.isnan(values)))
+        n_matching = n_valid
+        if threshold is not None:
+            n_matching = int(np.count_nonzero(values >= threshold if largest else values <= threshold))
+        picked = extreme_rows(values, min(n_cells, MAX_CELLS, n_matching), largest, order)
+
+        rows = cells.rows[picked] if cells.rows is not None else picked
+        meta = _load_obs(h5ad_id, columns, rows) if columns else None
+        result = {
+            "program_column": column,
+            "program_number": _parse_program_number(column) if column in program_cols else None,
+            "direction": direction,
+            "threshold": threshold,
+            "n_cells_considered": n_valid,
+            "n_matching": n_matching,
+            "n_returned": int(len(picked)),
+            "cells": {
+                "cell_id": _obs_names(h5ad_id, rows).tolist(),
+                "row": rows.tolist(),
+                "activity": values[picked].tolist(),
+                **{c: _compact(meta[c]) for c in columns},
+            },
+        }
+        result.update(cells.info)
+        return result
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+from .lazy import lazy_import
+
+pd = lazy_import("pandas")
+h5py = lazy_import("h5py")
+
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 1
+
+
+def _read_elem(node):
+    """anndata's element reader (moved from anndata.experimental to anndata.io in 0.11)"""
+    try:
+        from anndata.io import read_elem
+    except ImportError:
+        from anndata.experimental import read_elem
+    return read_elem(node)
+
+
+def source_stamp(src: Path) -> dict:
+    st = src.stat()
+    return {"source": src.name, "source_size": st.st_size, "source_mtime": st.st_mtime}
+
+
+def is_current(src: Path, out_dir: Path, version: int = FORMAT_VERSION) -> bool:
+    """True if out_dir holds a store built from the current version of src"""
+    try:
+        with open(out_dir / MANIFEST) as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return False
+    stamp = source_stamp(src)
+    return manifest.get("version") == version and all(manifest.get(k) == v for k, v in stamp.items())
+
+
+def write_obs_store(src: Path, out_dir: Path) -> Path:
+    """
+    Extract adata.obs from an H5AD file into one .npy file per column.
+    Numeric columns are stored as-is; categorical and string columns as integer
+    codes plus a category list in the manifest. Only the obs group is read.
+    """
+    tmp_dir = out_dir.with_name(f"{out_dir.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    columns = {}
+    with h5py.File(src, "r") as h5:
+        obs = h5["obs"]
+        column_order = list(obs.attrs.get("column-order", []))
+        index_key = obs.attrs.get("_index", "_index")
+        obs_names = np.asarray(_read_elem(obs[index_key])).astype(str)
+        n_obs = len(obs_names)
+        np.save(tmp_dir / "obs_names.npy", obs_names)
+
+        for i, col in enumerate(column_order):
+            values = _read_elem(obs[col])
+            fname = f"col_{i:04d}.npy"
+
+            if isinstance(values, pd.Categorical):
+                np.save(tmp_dir / fname, np.asarray(values.codes))
+                columns[col] = {"file": fname, "kind": "categorical", "categories": [str(c) for c in values.categories]}
+                continue
+
+            values = np.asarray(values)
+            if values.dtype.kind in "biuf":
+                np.save(tmp_dir / fname, values)
+                columns[col] = {"file": fname, "kind": "numeric"}
+            else:
+                cat = pd.Categorical(values.astype(str))
+                np.save(tmp_dir / fname, np.asarray(cat.codes))
+                columns[col] = {"file": fname, "kind": "categorical", "categories": [str(c) for c in cat.categories]}
+
+        var = h5["var"]
+        n_vars = len(var[var.attrs.get("_index", "_index")])
+        obsm_keys = list(h5["obsm"].keys()) if "obsm" in h5 else []
+
+    manifest = {
+        "version": FORMAT_VERSION,
+        **source_stamp(src),
+        "n_obs": n_obs,
+        "n_vars": n_vars,
+        "obsm_keys": obsm_keys,
+        "columns": columns,
+    }
+    with open(tmp_dir / MANIFEST, "w") as f:
+        json.dump(manifest, f)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return out_dir
+
+
+class ObsStore:
+    """
+    Read-only view of a columnar obs store. Columns are memory-mapped on first
+    access, so reading 2 columns out of 80 only touches those two files.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path / MANIFEST) as f:
+            self.manifest = json.load(f)
+        self.n_obs: int = self.manifest["n_obs"]
+        self.n_vars: int = self.manifest["n_vars"]
+        self.columns: list[str] = list(self.manifest["columns"].keys())
+        self._arrays: dict[str, np.ndarray] = {}
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.manifest["columns"]
+
+    def raw(self, column: str) -> np.ndarray:
+        """Memory-mapped values (numeric) or integer codes (categorical)"""
+        if column not in self._arrays:
+            info = self.manifest["columns"][column]
+            self._arrays[column] = np.load(self.path / info["file"], mmap_mode="r")
+        return self._arrays[column]
+
+    def column_path(self, column: str) -> Path:
+        return self.path / self.manifest["columns"][column]["file"]
+
+    def categories(self, column: str) -> list[str] | None:
+        return self.manifest["columns"][column].get("categories")
+
+    def column(self, column: str, rows: np.ndarray | None = None):
+        """A column (optionally only the given rows) as a numpy array or pandas Categorical"""
+        values = self.raw(column)
+        if rows is not None:
+            values = values[rows]
+        categories = self.categories(column)
+        if categories is None:
+            return values
+        return pd.Categorical.from_codes(np.asarray(values), categories=categories)
+
+    def obs_names(self) -> np.ndarray:
+        return np.load(self.path / "obs_names.npy", mmap_mode="r")
+
+    def frame(self, columns: list[str], rows: np.ndarray | None = None):
+        """Selected columns (and rows) as a DataFrame (positional index)"""
+        return pd.DataFrame({c: self.column(c, rows) for c in columns})
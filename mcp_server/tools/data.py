@@ -1,16 +1,41 @@
 from __future__ import annotations
 
 import json
+import threading
+import time
 from pathlib import Path
-import anndata as ad
+import numpy as np
+from .columnar import ObsStore, _read_elem, is_current, write_obs_store
+from .expression import ExpressionStore, is_csc_current, write_csc_store
+from .loadings import CompiledLoadings, compile_loadings, compiled_dir, is_compiled
+from .lazy import lazy_import
+
+ad = lazy_import("anndata")
+h5py = lazy_import("h5py")
+pd = lazy_import("pandas")
 
 DATA_DIR = Path(__file__).parent.parent.parent / "data"
 UPLOADS_DIR = DATA_DIR / "uploads"
 DATASETS_DIR = DATA_DIR / "datasets"
+CACHE_DIR = DATA_DIR / "cache"
+RECENT_FILE = CACHE_DIR / "recent_datasets.json"
+# Column-per-file copies of adata.obs, written after upload (see columnar.py)
+COLUMNAR_DIR = DATA_DIR / "columnar"
 
 # In-memory cache for loaded datasets (prevents re-reading large files)
 _h5ad_cache: dict[str, ad.AnnData] = {}
 _json_cache: dict[str, dict] = {}
+_obsm_cache: dict[tuple[str, str], np.ndarray] = {}
+_obs_store_cache: dict[str, ObsStore] = {}
+_loadings_cache: dict[str, CompiledLoadings] = {}
+_expression_cache: dict[str, ExpressionStore] = {}
+# Per-cell columns computed at runtime (e.g. gene-set scores), served like obs columns
+_virtual_columns: dict[str, dict[str, np.ndarray]] = {}
+
+# One lock per (kind, dataset) so concurrent callers share a single in-flight load
+_load_locks: dict[tuple, threading.RLock] = {}
+_load_locks_guard = threading.Lock()
+_recent_lock = threading.Lock()
 
 
 def register_data_tools(mcp):
@@ -68,21 +93,22 @@ def register_data_tools(mcp):
     @mcp.tool()
     def load_h5ad_summary(dataset_id: str) -> dict:
         """Load H5AD file and return summary of contents"""
-        adata = _load_h5ad(dataset_id)
-        if adata is None:
+        obs_cols = _obs_columns(dataset_id)
+        if obs_cols is None:
             return {"error": f"Dataset {dataset_id} not found"}
         
-        obs_cols = list(adata.obs.columns)
         metadata_cols = [c for c in obs_cols if not c.startswith('new_program_')]
         program_cols = [c for c in obs_cols if c.startswith('new_program_')]
+        summary_cols = [c for c in ('cell_type', 'disease_status') if c in obs_cols]
+        obs = _load_obs(dataset_id, summary_cols)
         
         return {
-            "n_cells": adata.n_obs,
+            "n_cells": _dataset_shape(dataset_id)[0],
             "n_programs": len(program_cols),
             "metadata_columns": metadata_cols,
             "program_columns": program_cols[:10],
-            "cell_types": list(adata.obs['cell_type'].unique()) if 'cell_type' in adata.obs else [],
-            "disease_status": list(adata.obs['disease_status'].unique()) if 'disease_status' in adata.obs else []
+            "cell_types": list(obs['cell_type'].unique()) if 'cell_type' in obs else [],
+            "disease_status": list(obs['disease_status'].unique()) if 'disease_status' in obs else []
         }
 
     @mcp.tool()
@@ -104,33 +130,34 @@ def register_data_tools(mcp):
     @mcp.tool()
     def get_h5ad_schema(dataset_id: str) -> dict:
         """Get complete schema of H5AD file with exact column names and values"""
-        adata = _load_h5ad(dataset_id)
-        if adata is None:
+        obs_cols = _obs_columns(dataset_id)
+        if obs_cols is None:
             return {"error": f"Dataset {dataset_id} not found"}
         
-        obs_cols = list(adata.obs.columns)
         metadata_cols = [c for c in obs_cols if not c.startswith('new_program_')]
         program_cols = [c for c in obs_cols if c.startswith('new_program_')]
+        obs = _load_obs(dataset_id, metadata_cols)
+        n_cells, n_genes = _dataset_shape(dataset_id)
         
         metadata_info = {}
         for col in metadata_cols:
-            unique_vals = adata.obs[col].unique()
+            unique_vals = obs[col].unique()
             if len(unique_vals) < 100:
                 metadata_info[col] = {
-                    "type": str(adata.obs[col].dtype),
+                    "type": str(obs[col].dtype),
                     "unique_values": list(unique_vals)[:20],
                     "n_unique": len(unique_vals)
                 }
             else:
                 metadata_info[col] = {
-                    "type": str(adata.obs[col].dtype),
+                    "type": str(obs[col].dtype),
                     "n_unique": len(unique_vals)
                 }
         
         return {
             "dataset_id": dataset_id,
-            "n_cells": adata.n_obs,
-            "n_genes": adata.n_vars,
+            "n_cells": n_cells,
+            "n_genes": n_genes,
             "metadata_columns": metadata_info,
             "program_columns": program_cols,
             "n_programs": len(program_cols)
@@ -199,28 +226,329 @@ def register_data_tools(mcp):
         }
 
 
+def _key_lock(key: tuple) -> threading.RLock:
+    with _load_locks_guard:
+        if key not in _load_locks:
+            _load_locks[key] = threading.RLock()
+        return _load_locks[key]
+
+
+def _load_once(cache: dict, key, kind: str, loader):
+    """
+    Return cache[key], calling loader() at most once across concurrent callers.
+    Threads that arrive while a load is in flight wait for it instead of starting
+    their own; the result is published to the cache only once fully built.
+    """
+    if key in cache:
+        return cache[key]
+
+    with _key_lock((kind, key)):
+        if key in cache:
+            return cache[key]
+        value = loader()
+        if value is not None:
+            cache[key] = value
+        return value
+
+
+def _h5ad_path(dataset_id: str) -> Path | None:
+    """Find the uploaded H5AD file for a dataset ID"""
+    for f in UPLOADS_DIR.glob(f"{dataset_id}_*.h5ad"):
+        return f
+    return None
+
+
 def _load_h5ad(dataset_id: str) -> ad.AnnData | None:
     """Load and cache an H5AD file"""
-    if dataset_id in _h5ad_cache:
-        return _h5ad_cache[dataset_id]
-    
-    for f in UPLOADS_DIR.glob(f"{dataset_id}_*.h5ad"):
+    def load():
+        f = _h5ad_path(dataset_id)
+        if f is None:
+            return None
         adata = ad.read_h5ad(f)
-        _h5ad_cache[dataset_id] = adata
+        _record_use(dataset_id)
         return adata
-    
+
+    return _load_once(_h5ad_cache, dataset_id, "h5ad", load)
+
+
+def _ingest_h5ad(dataset_id: str, force: bool = False) -> ObsStore | None:
+    """
+    Convert an uploaded H5AD's obs into the columnar store (reads only the obs group).
+    No-op if an up-to-date store already exists.
+    """
+    src = _h5ad_path(dataset_id)
+    if src is None:
+        return None
+
+    out_dir = COLUMNAR_DIR / dataset_id
+    with _key_lock(("ingest", dataset_id)):
+        if force or not is_current(src, out_dir):
+            _obs_store_cache.pop(dataset_id, None)
+            write_obs_store(src, out_dir)
+
+    return _load_obs_store(dataset_id)
+
+
+def _load_obs_store(dataset_id: str) -> ObsStore | None:
+    """Open the columnar obs store for a dataset if one exists and is up to date"""
+    def load():
+        src = _h5ad_path(dataset_id)
+        out_dir = COLUMNAR_DIR / dataset_id
+        with _key_lock(("ingest", dataset_id)):
+            if src is None or not is_current(src, out_dir):
+                return None
+            return ObsStore(out_dir)
+
+    return _load_once(_obs_store_cache, dataset_id, "obs_store", load)
+
+
+def _load_expression(dataset_id: str) -> ExpressionStore | None:
+    """
+    Memory-mapped CSC copy of adata.X (see expression.py), written beside the
+    columnar obs store on first use.
+    """
+    def load():
+        src = _h5ad_path(dataset_id)
+        if src is None:
+            return None
+        out_dir = COLUMNAR_DIR / f"{dataset_id}.X_csc"
+        with _key_lock(("csc", dataset_id)):
+            if not is_csc_current(src, out_dir):
+                write_csc_store(src, out_dir)
+        return ExpressionStore(out_dir)
+
+    return _load_once(_expression_cache, dataset_id, "expression", load)
+
+
+def _var_names(dataset_id: str) -> list[str] | None:
+    """Gene names (adata.var_names) without loading X"""
+    if dataset_id in _expression_cache:
+        return _expression_cache[dataset_id].var_names
+    if dataset_id in _h5ad_cache:
+        return _h5ad_cache[dataset_id].var_names.astype(str).tolist()
+    f = _h5ad_path(dataset_id)
+    if f is None:
+        return None
+    with h5py.File(f, "r") as h5:
+        var = h5["var"]
+        return np.asarray(_read_elem(var[var.attrs.get("_index", "_index")])).astype(str).tolist()
+
+
+def _obs_source(dataset_id: str) -> ObsStore | ad.AnnData | None:
+    """
+    Prefer the columnar store; otherwise use the cached AnnData; otherwise build
+    the store (cheaper than ad.read_h5ad since X is never touched).
+    """
+    store = _load_obs_store(dataset_id)
+    if store is not None:
+        return store
+    if dataset_id in _h5ad_cache:
+        return _h5ad_cache[dataset_id]
+    try:
+        store = _ingest_h5ad(dataset_id)
+    except (OSError, KeyError, ValueError):
+        store = None
+    return store if store is not None else _load_h5ad(dataset_id)
+
+
+def _obs_columns(dataset_id: str) -> list[str] | None:
+    """All obs column names, or None if the dataset doesn't exist"""
+    src = _obs_source(dataset_id)
+    if src is None:
+        return None
+    columns = list(src.columns) if isinstance(src, ObsStore) else list(src.obs.columns)
+    return columns + [c for c in _virtual_columns.get(dataset_id, {}) if c not in columns]
+
+
+def _obs_names(dataset_id: str, rows: np.ndarray | None = None) -> np.ndarray | None:
+    """Cell IDs (adata.obs_names), optionally only the given row positions"""
+    src = _obs_source(dataset_id)
+    if src is None:
+        return None
+    names = src.obs_names() if isinstance(src, ObsStore) else np.asarray(src.obs_names)
+    return np.asarray(names if rows is None else names[rows]).astype(str)
+
+
+def _dataset_shape(dataset_id: str) -> tuple[int, int] | None:
+    """(n_cells, n_genes) without loading X"""
+    src = _obs_source(dataset_id)
+    if src is None:
+        return None
+    return (src.n_obs, src.n_vars)
+
+
+def _load_obs(dataset_id: str, columns: list[str], rows: np.ndarray | None = None) -> pd.DataFrame | None:
+    """
+    Selected obs columns as a DataFrame, optionally restricted to row positions
+    (e.g. a sketch). Reads from the memory-mapped columnar store when present,
+    so only the requested columns are touched on disk.
+    """
+    src = _obs_source(dataset_id)
+    if src is None:
+        return None
+    virtual = _virtual_columns.get(dataset_id, {})
+    stored = [c for c in columns if c not in virtual]
+    if isinstance(src, ObsStore):
+        frame = src.frame(stored, rows)
+    else:
+        frame = src.obs[stored] if rows is None else src.obs[stored].iloc[rows]
+    if len(stored) == len(columns):
+        return frame
+
+    frame = frame.copy()
+    for c in dict.fromkeys(columns):
+        if c in virtual:
+            frame[c] = virtual[c] if rows is None else virtual[c][rows]
+    return frame[columns]
+
+
+def _set_virtual_column(dataset_id: str, name: str, values: np.ndarray) -> None:
+    """Expose a per-cell array as an obs column of a dataset (for this server process)"""
+    _virtual_columns.setdefault(dataset_id, {})[name] = values
+
+
+def _program_columns(dataset_id: str) -> list[str] | None:
+    """Program activity columns (obs columns starting with 'new_program_')"""
+    obs_cols = _obs_columns(dataset_id)
+    if obs_cols is None:
+        return None
+    return [c for c in obs_cols if c.startswith("new_program_")]
+
+
+def _load_obs_matrix(dataset_id: str, columns: list[str], rows: np.ndarray | None = None) -> np.ndarray | None:
+    """Numeric obs columns stacked into a cells x columns float32 matrix"""
+    obs = _load_obs(dataset_id, columns, rows)
+    if obs is None:
+        return None
+    matrix = np.empty((len(obs), len(columns)), dtype=np.float32)
+    for i, c in enumerate(columns):
+        matrix[:, i] = obs[c].values
+    return matrix
+
+
+def _resolve_obsm_key(keys, basis: str) -> str | None:
+    """Match 'umap' / 'X_umap' style names against available obsm keys"""
+    if basis in keys:
+        return basis
+    if f"X_{basis}" in keys:
+        return f"X_{basis}"
+    lowered = {k.lower(): k for k in keys}
+    return lowered.get(basis.lower()) or lowered.get(f"x_{basis.lower()}")
+
+
+def _list_obsm_keys(dataset_id: str) -> list[str]:
+    """List obsm keys without loading the dataset if it is not cached yet"""
+    if dataset_id in _h5ad_cache:
+        return list(_h5ad_cache[dataset_id].obsm.keys())
+
+    store = _load_obs_store(dataset_id)
+    if store is not None:
+        return list(store.manifest["obsm_keys"])
+
+    f = _h5ad_path(dataset_id)
+    if f is None:
+        return []
+    with h5py.File(f, "r") as h5:
+        return list(h5["obsm"].keys()) if "obsm" in h5 else []
+
+
+def _load_obsm(dataset_id: str, basis: str) -> np.ndarray | None:
+    """
+    Load a single obsm embedding (e.g. 'X_umap').
+    Uses the cached AnnData when available; otherwise reads only that key from disk.
+    """
+    key = _resolve_obsm_key(_list_obsm_keys(dataset_id), basis)
+    if key is None:
+        return None
+
+    def load():
+        if dataset_id in _h5ad_cache:
+            return np.asarray(_h5ad_cache[dataset_id].obsm[key])
+        with h5py.File(_h5ad_path(dataset_id), "r") as h5:
+            node = h5["obsm"][key]
+            return node[()] if isinstance(node, h5py.Dataset) else None
+
+    return _load_once(_obsm_cache, (dataset_id, key), "obsm", load)
+
+
+def _json_path(dataset_id: str) -> Path | None:
+    """Find the uploaded JSON file for a dataset ID"""
+    for f in UPLOADS_DIR.glob(f"{dataset_id}_*.json"):
+        return f
     return None
 
 
 def _load_json(dataset_id: str) -> dict | None:
     """Load and cache a JSON file"""
-    if dataset_id in _json_cache:
-        return _json_cache[dataset_id]
-    
-    for f in UPLOADS_DIR.glob(f"{dataset_id}_*.json"):
+    def load():
+        f = _json_path(dataset_id)
+        if f is None:
+            return None
         with open(f) as fp:
             data = json.load(fp)
-        _json_cache[dataset_id] = data
+        _record_use(dataset_id)
         return data
-    
-    return None
+
+    return _load_once(_json_cache, dataset_id, "json", load)
+
+
+def _ensure_compiled(dataset_id: str, src: Path, force: bool = False) -> None:
+    with _key_lock(("compile", dataset_id)):
+        if force or not is_compiled(src):
+            _loadings_cache.pop(dataset_id, None)
+            data = _json_cache.get(dataset_id)
+            if data is None:
+                with open(src) as fp:
+                    data = json.load(fp)
+            compile_loadings(data, src, compiled_dir(src))
+
+
+def _compile_json(dataset_id: str, force: bool = False) -> CompiledLoadings | None:
+    """Compile a loadings JSON to binary arrays beside the upload (no-op if up to date)"""
+    src = _json_path(dataset_id)
+    if src is None:
+        return None
+
+    _ensure_compiled(dataset_id, src, force)
+    return _load_loadings(dataset_id)
+
+
+def _load_loadings(dataset_id: str) -> CompiledLoadings | None:
+    """
+    Load the compiled (memory-mapped) program x gene loadings for a JSON dataset,
+    compiling it on first use if the upload hasn't been compiled yet.
+    """
+    def load():
+        src = _json_path(dataset_id)
+        if src is None:
+            return None
+        _ensure_compiled(dataset_id, src)
+        loadings = CompiledLoadings(compiled_dir(src))
+        _record_use(dataset_id)
+        return loadings
+
+    return _load_once(_loadings_cache, dataset_id, "loadings", load)
+
+
+def _recent_datasets() -> dict[str, float]:
+    """Dataset ID -> last time it was loaded (persists across restarts for preloading)"""
+    try:
+        with open(RECENT_FILE) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _record_use(dataset_id: str) -> None:
+    """Remember that a dataset was just loaded"""
+    with _recent_lock:
+        recent = _recent_datasets()
+        recent[dataset_id] = time.time()
+        try:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = RECENT_FILE.with_suffix(".tmp")
+            with open(tmp, "w") as f:
+                json.dump(recent, f)
+            tmp.replace(RECENT_FILE)
+        except OSError:
+            pass
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+# Threads shared by all blocking tools
+MAX_BLOCKING_THREADS = int(os.getenv("MCP_BLOCKING_THREADS", "16"))
+# Concurrent runs allowed per tool unless listed in TOOL_CONCURRENCY
+DEFAULT_TOOL_CONCURRENCY = int(os.getenv("MCP_TOOL_CONCURRENCY", "4"))
+
+# Heavy tools get tighter limits so they can't take every thread
+TOOL_CONCURRENCY = {
+    "program_celltype_enrichment": 2,
+    "program_pairwise_enrichment": 2,
+    "annotate_programs_batch": 2,
+}
+
+# Cheap lookups that stay inline on the event loop
+FAST_TOOLS = {
+    "list_datasets",
+    "get_dataset_id_by_name",
+    "find_paired_datasets",
+    "get_cached_annotation",
+    "get_annotation_cache_stats",
+    "clear_annotation_cache",
+    "warm_dataset",
+    "preload_status",
+    "tool_queue_status",
+    "submit_job",
+    "job_status",
+    "job_result",
+    "list_jobs",
+    "cancel_job",
+}
+
+
+class _ToolStats:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_seconds = 0.0
+        self.semaphore = asyncio.Semaphore(limit)
+
+    def snapshot(self) -> dict:
+        done = self.completed + self.failed
+        return {
+            "limit": self.limit,
+            "waiting": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_seconds": round(self.total_seconds / done, 3) if done else None,
+        }
+
+
+class ToolRegistrar:
+    """
+    Stand-in for the MCP server passed to register_*_tools().
+
+    Blocking (sync) tools are registered as async wrappers that run the tool on
+    a bounded thread pool, with a per-tool concurrency limit, so a slow
+    enrichment or ad.read_h5ad never blocks ping or other requests. Tools in
+    FAST_TOOLS and async tools are registered unchanged. The decorator returns
+    the original function, so tools can still call each other directly.
+    """
+
+    def __init__(self, mcp, fast_tools: set[str] = FAST_TOOLS, limits: dict[str, int] = TOOL_CONCURRENCY):
+        self.mcp = mcp
+        self.fast_tools = fast_tools
+        self.limits = limits
+        self.stats: dict[str, _ToolStats] = {}
+        self.functions: dict[str, Callable] = {}
+        self.executor = ThreadPoolExecutor(max_workers=MAX_BLOCKING_THREADS, thread_name_prefix="mcp-tool")
+
+    def tool(self, *args, **kwargs):
+        def decorator(fn):
+            self.functions[fn.__name__] = fn
+            if fn.__name__ in self.fast_tools or inspect.iscoroutinefunction(fn):
+                self.mcp.tool(*args, **kwargs)(fn)
+            else:
+                self.mcp.tool(*args, **kwargs)(self._offload(fn))
+            return fn
+        return decorator
+
+    def _offload(self, fn):
+        stats = _ToolStats(self.limits.get(fn.__name__, DEFAULT_TOOL_CONCURRENCY))
+        self.stats[fn.__name__] = stats
+
+        @functools.wraps(fn)
+        async def run_in_thread(**kwargs):
+            stats.waiting += 1
+            try:
+                await stats.semaphore.acquire()
+            finally:
+                stats.waiting -= 1
+
+            stats.running += 1
+            start = time.perf_counter()
+            try:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self.executor, functools.partial(fn, **kwargs))
+                stats.completed += 1
+                return result
+            except BaseException:
+                stats.failed += 1
+                raise
+            finally:
+                stats.running -= 1
+                stats.total_seconds += time.perf_counter() - start
+                stats.semaphore.release()
+
+        return run_in_thread
+
+    def snapshot(self) -> dict:
+        tools = {name: s.snapshot() for name, s in self.stats.items() if s.waiting or s.running or s.completed or s.failed}
+        return {
+            "max_threads": MAX_BLOCKING_THREADS,
+            "running": sum(s.running for s in self.stats.values()),
+            "waiting": sum(s.waiting for s in self.stats.values()),
+            "tools": tools,
+        }
+
+
+def register_executor_tools(registrar: ToolRegistrar):
+    """Register queue-depth reporting for the blocking tool executor"""
+
+    @registrar.tool()
+    def tool_queue_status() -> dict:
+        """
+        Show how many tool calls are running or waiting, per tool.
+        Useful for checking server load before starting a heavy analysis.
+        """
+        return registrar.snapshot()
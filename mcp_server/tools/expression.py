@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+from .columnar import MANIFEST, _read_elem, is_current, source_stamp
+from .lazy import lazy_import
+
+h5py = lazy_import("h5py")
+
+FORMAT_VERSION = 1
+# Non-zeros (or dense values) handled per pass over X
+CHUNK_NNZ = 1 << 24
+
+
+def _row_chunks(x, chunk_nnz: int = CHUNK_NNZ):
+    """
+    Yield (rows, cols, values) of the non-zeros of an H5AD X node in row order,
+    a bounded number at a time, for CSR groups or dense datasets.
+    """
+    if isinstance(x, h5py.Dataset):
+        n_rows, n_cols = x.shape
+        step = max(1, chunk_nnz // max(n_cols, 1))
+        for start in range(0, n_rows, step):
+            block = x[start:start + step]
+            r, c = np.nonzero(block)
+            yield r + start, c, block[r, c]
+        return
+
+    indptr = x["indptr"][()]
+    n_rows = len(indptr) - 1
+    start = 0
+    while start < n_rows:
+        end = int(np.searchsorted(indptr, indptr[start] + chunk_nnz, side="right")) - 1
+        end = min(max(end, start + 1), n_rows)
+        lo, hi = int(indptr[start]), int(indptr[end])
+        rows = np.repeat(np.arange(start, end), np.diff(indptr[start:end + 1]))
+        yield rows, x["indices"][lo:hi], x["data"][lo:hi]
+        start = end
+
+
+def write_csc_store(src: Path, out_dir: Path) -> Path:
+    """
+    Write adata.X as a column-compressed (CSC) sparse matrix: data.npy,
+    indices.npy (row of each value) and indptr.npy, plus var_names.npy.
+    CSR input is transposed out of core in two passes (count non-zeros per
+    gene, then scatter each chunk into memory-mapped output), so X is never
+    fully loaded.
+    """
+    tmp_dir = out_dir.with_name(f"{out_dir.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    with h5py.File(src, "r") as h5:
+        var = h5["var"]
+        var_names = np.asarray(_read_elem(var[var.attrs.get("_index", "_index")])).astype(str)
+        x = h5["X"]
+        encoding = x.attrs.get("encoding-type", "array")
+        if isinstance(encoding, bytes):
+            encoding = encoding.decode()
+        n_obs, n_vars = (x.attrs["shape"] if encoding != "array" else x.shape)
+        n_obs, n_vars = int(n_obs), int(n_vars)
+
+        if encoding == "csc_matrix":
+            np.save(tmp_dir / "data.npy", x["data"][()].astype(np.float32))
+            np.save(tmp_dir / "indices.npy", x["indices"][()].astype(np.int64))
+            np.save(tmp_dir / "indptr.npy", x["indptr"][()].astype(np.int64))
+        else:
+            # pass 1: non-zeros per gene
+            counts = np.zeros(n_vars, dtype=np.int64)
+            for _, cols, _ in _row_chunks(x):
+                counts += np.bincount(cols, minlength=n_vars)
+            indptr = np.concatenate([[0], np.cumsum(counts)])
+            np.save(tmp_dir / "indptr.npy", indptr)
+
+            # pass 2: scatter each chunk after the values already written per gene
+            nnz = int(indptr[-1])
+            data = np.lib.format.open_memmap(tmp_dir / "data.npy", mode="w+", dtype=np.float32, shape=(nnz,))
+            indices = np.lib.format.open_memmap(tmp_dir / "indices.npy", mode="w+", dtype=np.int64, shape=(nnz,))
+            cursor = indptr[:-1].copy()
+            for rows, cols, values in _row_chunks(x):
+                order = np.argsort(cols, kind="stable")
+                cols_sorted = cols[order]
+                chunk_counts = np.bincount(cols_sorted, minlength=n_vars)
+                starts = np.concatenate([[0], np.cumsum(chunk_counts)[:-1]])
+                rank = np.arange(len(cols_sorted)) - starts[cols_sorted]
+                pos = cursor[cols_sorted] + rank
+                data[pos] = values[order]
+                indices[pos] = rows[order]
+                cursor += chunk_counts
+            data.flush()
+            indices.flush()
+            del data, indices
+
+    np.save(tmp_dir / "var_names.npy", var_names)
+    with open(tmp_dir / MANIFEST, "w") as f:
+        json.dump({"version": FORMAT_VERSION, **source_stamp(src), "n_obs": n_obs, "n_vars": n_vars}, f)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return out_dir
+
+
+def is_csc_current(src: Path, out_dir: Path) -> bool:
+    return is_current(src, out_dir, version=FORMAT_VERSION)
+
+
+class ExpressionStore:
+    """
+    Memory-mapped CSC copy of adata.X. One gene's values are a contiguous
+    slice of data/indices, so per-gene queries never scan the full matrix.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path / MANIFEST) as f:
+            manifest = json.load(f)
+        self.n_obs: int = manifest["n_obs"]
+        self.n_vars: int = manifest["n_vars"]
+        self.data: np.ndarray = np.load(path / "data.npy", mmap_mode="r")
+        self.indices: np.ndarray = np.load(path / "indices.npy", mmap_mode="r")
+        self.indptr: np.ndarray = np.load(path / "indptr.npy")
+        self.var_names: list[str] = np.load(path / "var_names.npy").tolist()
+        self.var_index = {g: i for i, g in enumerate(self.var_names)}
+        self.upper_index: dict[str, int] = {}
+        for i, g in enumerate(self.var_names):
+            self.upper_index.setdefault(g.upper(), i)
+        self._means: np.ndarray | None = None
+
+    def find(self, gene: str) -> int | None:
+        """Gene position; exact match first, then case-insensitive"""
+        if gene in self.var_index:
+            return self.var_index[gene]
+        return self.upper_index.get(gene.upper())
+
+    def nonzeros(self, j: int) -> tuple[np.ndarray, np.ndarray]:
+        """(cell rows, values) of gene j's non-zero entries"""
+        lo, hi = int(self.indptr[j]), int(self.indptr[j + 1])
+        return np.asarray(self.indices[lo:hi]), np.asarray(self.data[lo:hi], dtype=np.float64)
+
+    def gene_means(self) -> np.ndarray:
+        """Mean of every gene over all cells (one chunked pass over data, then cached)"""
+        if self._means is None:
+            sums = np.zeros(self.n_vars)
+            for start in range(0, len(self.data), CHUNK_NNZ):
+                chunk = np.asarray(self.data[start:start + CHUNK_NNZ], dtype=np.float64)
+                # gene of each value: the CSC column whose indptr range holds it
+                genes = np.searchsorted(self.indptr, np.arange(start, start + len(chunk)), side="right") - 1
+                sums += np.bincount(genes, weights=chunk, minlength=self.n_vars)
+            self._means = sums / max(self.n_obs, 1)
+        return self._means
+
+    def matvec(self, genes: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """X[:, genes] @ weights for every cell, touching only those genes' non-zeros"""
+        rows, vals = [], []
+        for j, w in zip(genes.tolist(), weights.tolist()):
+            r, v = self.nonzeros(j)
+            rows.append(r)
+            vals.append(v * w)
+        if not rows:
+            return np.zeros(self.n_obs)
+        return np.bincount(np.concatenate(rows), weights=np.concatenate(vals), minlength=self.n_obs)
+
+    def dense(self, j: int) -> np.ndarray:
+        values = np.zeros(self.n_obs, dtype=np.float32)
+        rows, vals = self.nonzeros(j)
+        values[rows] = vals
+        return values
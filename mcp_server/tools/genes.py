@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import numpy as np
+from .data import _load_expression, _load_obs_matrix, _obs_columns
+from .grouping import _load_grouping
+from .moments import _load_moments
+from .stats import _parse_program_number
+from .vocab import _find_gene, _suggestions
+
+MAX_GENES = 50
+
+
+def register_gene_tools(mcp):
+
+    @mcp.tool()
+    def gene_expression_by_group(h5ad_id: str, genes: list[str], group_by: str) -> dict:
+        """
+        Expression of genes (from adata.X) summarised per group: mean expression,
+        fraction of cells expressing (> 0) and mean among expressing cells.
+
+        Args:
+            h5ad_id: Dataset ID of the H5AD file
+            genes: Gene symbols (max 50, matched case-insensitively; extra genes are returned in not_queried)
+            group_by: Obs column to group by (e.g., 'cell_type')
+        """
+        obs_cols = _obs_columns(h5ad_id)
+        if obs_cols is None:
+            return {"error": f"Dataset {h5ad_id} not found"}
+        if group_by not in obs_cols:
+            return {"error": f"Column {group_by} not found"}
+
+        expr = _load_expression(h5ad_id)
+        grouping = _load_grouping(h5ad_id, [group_by])
+        n_groups = grouping.n_groups
+
+        # genes past the limit are reported back, not silently dropped
+        not_queried = list(genes[MAX_GENES:])
+        results, not_found, resolved = [], [], {}
+        for gene in genes[:MAX_GENES]:
+            j, was_resolved = _find_gene(expr, h5ad_id, gene)
+            if j is None:
+                not_found.append(gene)
+                continue
+            if was_resolved:
+                resolved[gene] = expr.var_names[j]
+
+            # only non-zero entries are touched: a contiguous CSC slice
+            rows, vals = expr.nonzeros(j)
+            codes = grouping.codes[rows]
+            sums = np.bincount(codes, weights=vals, minlength=n_groups)
+            n_expr = np.bincount(codes, minlength=n_groups)
+
+            groups = []
+            for g, (level,) in enumerate(grouping.levels):
+                n = int(grouping.counts[g])
+                groups.append({
+                    "group": level,
+                    "n_cells": n,
+                    "mean": float(sums[g] / n),
+                    "fraction_expressing": float(n_expr[g] / n),
+                    "mean_expressing": float(sums[g] / n_expr[g]) if n_expr[g] else 0.0,
+                })
+            groups.sort(key=lambda r: r["mean"], reverse=True)
+            results.append({"gene": expr.var_names[j], "groups": groups})
+
+        if not results:
+            error = {"error": f"Genes not found: {not_found}", "suggestions": _suggestions(h5ad_id, not_found)}
+            if not_queried:
+                error["not_queried"] = not_queried
+            return error
+        result = {"group_by": group_by, "genes": results, "not_found": not_found}
+        if resolved:
+            result["resolved_from"] = resolved
+        if not_found:
+            result["suggestions"] = _suggestions(h5ad_id, not_found)
+        if not_queried:
+            result["truncated"] = True
+            result["not_queried"] = not_queried
+        return result
+
+    @mcp.tool()
+    def gene_program_correlation(h5ad_id: str, gene: str, top_k: int = 10) -> dict:
+        """
+        Pearson correlation between one gene's expression (adata.X) and every
+        program's activity across cells; returns the top_k programs by |r|.
+
+        Args:
+            h5ad_id: Dataset ID of the H5AD file
+            gene: Gene symbol (matched case-insensitively)
+            top_k: Number of programs to return
+        """
+        moments = _load_moments(h5ad_id)
+        if moments is None:
+            if _obs_columns(h5ad_id) is None:
+                return {"error": f"Dataset {h5ad_id} not found"}
+            return {"error": "No program columns found (expected obs columns starting with 'new_program_')"}
+
+        expr = _load_expression(h5ad_id)
+        j, was_resolved = _find_gene(expr, h5ad_id, gene)
+        if j is None:
+            return {"error": f"Gene {gene} not found", "suggestions": _suggestions(h5ad_id, [gene]).get(gene, [])}
+
+        rows, vals = expr.nonzeros(j)
+        n = expr.n_obs
+        g_mean = vals.sum() / n
+        g_var = (np.square(vals).sum() - n * g_mean ** 2) / max(n - 1, 1)
+        if rows.size == 0 or g_var <= 0:
+            return {"error": f"Gene {gene} has no variation in this dataset"}
+
+        # sum_i (g_i - g_mean)(x_i - x_mean) = sum_i g_i (x_i - x_mean): only expressing cells count
+        x = _load_obs_matrix(h5ad_id, moments.columns, rows).astype(np.float64) - moments.mean
+        x[np.isnan(x)] = 0.0
+        cov = (vals @ x) / max(n - 1, 1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            r = cov / (np.sqrt(g_var) * moments.std)
+
+        order = np.argsort(-np.abs(np.nan_to_num(r)), kind="stable")[:top_k]
+        return {
+            "gene": expr.var_names[j],
+            **({"resolved_from": gene} if was_resolved else {}),
+            "n_cells": n,
+            "n_expressing": int(rows.size),
+            "programs": [
+                {
+                    "program_number": _parse_program_number(moments.columns[i]),
+                    "program_column": moments.columns[i],
+                    "r": float(r[i]),
+                }
+                for i in order
+            ],
+        }
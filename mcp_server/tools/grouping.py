@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import numpy as np
+from .data import _load_obs, _load_obs_matrix, _load_once, _program_columns
+from .lazy import lazy_import
+
+pd = lazy_import("pandas")
+sparse = lazy_import("scipy.sparse")
+
+_grouping_cache: dict[tuple[str, tuple[str, ...]], "GroupIndex"] = {}
+
+
+def _categorical(values) -> tuple[np.ndarray, list[str]]:
+    """Integer codes and string categories for one obs column"""
+    if isinstance(values, pd.Categorical) and not (values.codes < 0).any():
+        return np.asarray(values.codes), [str(c) for c in values.categories]
+    cat = pd.Categorical(np.asarray(values).astype(str))
+    return np.asarray(cat.codes), cat.categories.tolist()
+
+
+class GroupIndex:
+    """
+    Cells grouped by one or more obs columns.
+    Each column is turned into categorical codes, and the codes are combined
+    with ravel_multi_index into one code per cell. Only combinations that occur
+    become groups (levels). Aggregates over the groups are then a single sparse
+    indicator product.
+    """
+
+    def __init__(self, columns: list[str], values: list):
+        self.columns = list(columns)
+        codes, categories = zip(*(_categorical(v) for v in values))
+        self.categories: list[list[str]] = list(categories)
+        dims = tuple(max(len(c), 1) for c in self.categories)
+
+        combined = np.ravel_multi_index(codes, dims)
+        uniq, self.codes, self.counts = np.unique(combined, return_inverse=True, return_counts=True)
+        self.codes = self.codes.ravel()
+        level_codes = np.unravel_index(uniq, dims)
+        self.levels: list[tuple[str, ...]] = [
+            tuple(self.categories[j][level_codes[j][i]] for j in range(len(columns)))
+            for i in range(len(uniq))
+        ]
+        self.level_index = {lv: i for i, lv in enumerate(self.levels)}
+        self._indicator = None
+
+    @property
+    def n_groups(self) -> int:
+        return len(self.levels)
+
+    def indicator(self):
+        """groups x cells sparse 0/1 matrix"""
+        if self._indicator is None:
+            n = len(self.codes)
+            self._indicator = sparse.csr_matrix(
+                (np.ones(n, dtype=np.float32), (self.codes, np.arange(n))),
+                shape=(self.n_groups, n),
+            )
+        return self._indicator
+
+    def sums(self, x: np.ndarray) -> np.ndarray:
+        """Per-group column sums of a cells x columns matrix"""
+        return np.asarray(self.indicator() @ np.asarray(x, dtype=np.float64))
+
+    def means(self, x: np.ndarray) -> np.ndarray:
+        return self.sums(x) / self.counts[:, None]
+
+
+def _load_grouping(dataset_id: str, columns: list[str]) -> GroupIndex | None:
+    """Cached GroupIndex over the given obs columns"""
+    key = (dataset_id, tuple(columns))
+
+    def load():
+        obs = _load_obs(dataset_id, list(columns))
+        if obs is None:
+            return None
+        return GroupIndex(list(columns), [obs[c].values for c in columns])
+
+    return _load_once(_grouping_cache, key, "grouping", load)
+
+
+_cube_cache: dict[tuple[str, tuple[str, ...]], "GroupCube"] = {}
+
+QUANTILES = (0.25, 0.5, 0.75)
+
+
+class GroupCube:
+    """
+    Per-group statistics of every program, for one grouping of the cells:
+    cell counts, plus mean, variance and quartiles (levels x programs). NaN
+    activities are ignored. Built in one pass and sliced by later queries.
+    """
+
+    def __init__(self, grouping: GroupIndex, program_cols: list[str], x: np.ndarray):
+        self.grouping = grouping
+        self.program_cols = program_cols
+        self.program_index = {p: i for i, p in enumerate(program_cols)}
+        self.counts = grouping.counts
+
+        valid = ~np.isnan(x)
+        filled = np.where(valid, x, 0)
+        n = grouping.sums(valid)
+        sums = grouping.sums(filled)
+        sq_sums = grouping.sums(filled.astype(np.float64) ** 2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean = sums / n
+            self.var = np.maximum(sq_sums - n * self.mean ** 2, 0) / (n - 1)
+        self.var[n < 2] = np.nan
+
+        # quartiles: cells sorted by group, then one contiguous block per group
+        order = np.argsort(grouping.codes, kind="stable")
+        bounds = np.concatenate([[0], np.cumsum(grouping.counts)])
+        self.quantiles = np.full((len(QUANTILES), grouping.n_groups, len(program_cols)), np.nan)
+        for g in range(grouping.n_groups):
+            block = x[order[bounds[g]:bounds[g + 1]]]
+            with np.errstate(all="ignore"):
+                self.quantiles[:, g] = np.nanquantile(block, QUANTILES, axis=0)
+
+    def stat(self, name: str) -> np.ndarray:
+        """levels x programs matrix for 'mean', 'std', 'var', 'q25', 'median' or 'q75'"""
+        if name == "mean":
+            return self.mean
+        if name == "var":
+            return self.var
+        if name == "std":
+            return np.sqrt(self.var)
+        return self.quantiles[{"q25": 0, "median": 1, "q75": 2}[name]]
+
+
+def _load_cube(dataset_id: str, group_cols: list[str]) -> GroupCube | None:
+    """Cached GroupCube per (dataset, group columns)"""
+    key = (dataset_id, tuple(group_cols))
+
+    def load():
+        program_cols = _program_columns(dataset_id)
+        grouping = _load_grouping(dataset_id, list(group_cols))
+        if not program_cols or grouping is None:
+            return None
+        return GroupCube(grouping, program_cols, _load_obs_matrix(dataset_id, program_cols))
+
+    return _load_once(_cube_cache, key, "cube", load)
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import inspect
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .data import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = DATA_DIR / "jobs"
+# Jobs that run at the same time (each may still use the stats process pool)
+JOB_WORKERS = int(os.getenv("MCP_JOB_WORKERS", "2"))
+
+JOB_TOOLS = {"submit_job", "job_status", "job_result", "list_jobs", "cancel_job"}
+# Finished jobs whose summaries list_jobs keeps in memory (results stay on disk)
+RECENT_JOBS = 200
+
+# Ids as generated by Job (anything else is never looked up on disk)
+JOB_ID = re.compile(r"job_\d+_[0-9a-f]{8}")
+
+_current = threading.local()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def report_progress(done: int, total: int, message: str = "") -> None:
+    """
+    Record progress for the job running on this thread (no-op outside jobs).
+    Long-running tools call this from their main loop; it also raises
+    JobCancelled once the job has been cancelled.
+    """
+    job = getattr(_current, "job", None)
+    if job is None:
+        return
+    job.progress = {
+        "done": int(done),
+        "total": int(total),
+        "fraction": round(done / total, 3) if total else None,
+        "message": message,
+    }
+    if job.cancel_requested:
+        raise JobCancelled()
+
+
+class Job:
+    def __init__(self, tool: str, arguments: dict):
+        self.job_id = f"job_{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+        self.tool = tool
+        self.arguments = arguments
+        self.state = "queued"
+        self.progress: dict | None = None
+        self.result = None
+        self.error: str | None = None
+        self.created = time.time()
+        self.started: float | None = None
+        self.finished: float | None = None
+        self.cancel_requested = False
+
+    def summary(self) -> dict:
+        end = self.finished or time.time()
+        return {
+            "job_id": self.job_id,
+            "tool": self.tool,
+            "state": self.state,
+            "progress": self.progress,
+            "error": self.error,
+            "elapsed_seconds": round(end - self.started, 2) if self.started else None,
+        }
+
+    def to_record(self) -> dict:
+        return {
+            **self.summary(),
+            "arguments": self.arguments,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "result": self.result,
+        }
+
+
+class JobManager:
+    """
+    Runs tool calls in the background and keeps their results.
+    Every job is persisted to data/jobs/<job_id>.json on submit and on
+    completion, so results survive restarts and can be fetched later.
+    Finished jobs leave memory once persisted; only their summaries are kept
+    (for list_jobs) and results are read back from disk.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.jobs: dict[str, Job] = {}
+        self.recent: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mcp-job")
+
+    def submit(self, fn, tool: str, arguments: dict) -> Job:
+        job = Job(tool, arguments)
+        with self._lock:
+            self.jobs[job.job_id] = job
+        self._persist(job)
+        self.executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id: str) -> Job | dict | None:
+        """Live job, or the persisted record of a finished job or one from an earlier run"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        if not isinstance(job_id, str) or not JOB_ID.fullmatch(job_id):
+            return None
+        try:
+            with open(JOBS_DIR / f"{job_id}.json") as f:
+                record = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if not isinstance(record, dict) or record.get("job_id") != job_id:
+            return None
+        if record.get("state") in ("queued", "running"):
+            record["state"] = "interrupted"
+            record["error"] = "Server restarted before the job finished; submit it again"
+        return record
+
+    def summaries(self) -> list[dict]:
+        """Summaries of live and recently finished jobs"""
+        with self._lock:
+            live = [{**j.summary(), "created": j.created} for j in self.jobs.values()]
+            return live + list(self.recent.values())
+
+    def cancel(self, job_id: str) -> Job | None:
+        """Cancel a queued job now; a running job stops at its next report_progress()"""
+        job = self.jobs.get(job_id)
+        if job is None or job.state in ("done", "failed", "cancelled"):
+            return job
+        job.cancel_requested = True
+        # under the lock, so _run cannot start the job while it is being cancelled
+        with self._lock:
+            queued = job.state == "queued"
+            if queued:
+                job.state = "cancelled"
+                job.finished = time.time()
+        if queued:
+            self._finish(job)
+        return job
+
+    def _finish(self, job: Job) -> None:
+        """Persist a finished job and drop it from memory (kept if it could not be written)"""
+        if not self._persist(job):
+            return
+        with self._lock:
+            self.jobs.pop(job.job_id, None)
+            self.recent[job.job_id] = {**job.summary(), "created": job.created}
+            while len(self.recent) > RECENT_JOBS:
+                self.recent.popitem(last=False)
+
+    def _run(self, job: Job, fn) -> None:
+        with self._lock:
+            if job.state != "queued":
+                return
+            job.state = "running"
+            job.started = time.time()
+        self._persist(job)
+        _current.job = job
+        try:
+            job.result = fn(**job.arguments)
+            job.state = "done"
+        except JobCancelled:
+            job.state = "cancelled"
+        except Exception as e:
+            logger.exception(f"Job {job.job_id} ({job.tool}) failed")
+            job.state = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+        finally:
+            _current.job = None
+            job.finished = time.time()
+            self._finish(job)
+
+    def _persist(self, job: Job) -> bool:
+        try:
+            JOBS_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = JOBS_DIR / f"{job.job_id}.json.tmp"
+            with open(tmp, "w") as f:
+                json.dump(job.to_record(), f, default=str)
+            tmp.replace(JOBS_DIR / f"{job.job_id}.json")
+            return True
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not persist job {job.job_id}: {e}")
+            return False
+
+
+jobs = JobManager()
+
+
+def register_job_tools(registrar):
+    """Register background job tools; any blocking tool on the registrar can be submitted"""
+
+    def submittable() -> dict:
+        return {
+            name: fn for name, fn in registrar.functions.items()
+            if name not in JOB_TOOLS and name not in registrar.fast_tools
+        }
+
+    @registrar.tool()
+    def submit_job(tool: str, arguments: dict | None = None) -> dict:
+        """
+        Start a long-running tool call in the background and return a job id immediately.
+        Use for slow analyses (e.g. program_celltype_enrichment on large datasets) that
+        could time out; poll job_status, then fetch the output with job_result.
+
+        Args:
+            tool: Name of the tool to run (e.g., 'program_pairwise_enrichment')
+            arguments: The tool's arguments, exactly as for a direct call
+        """
+        tools = submittable()
+        if tool not in tools:
+            return {"error": f"Tool {tool} cannot be run as a job", "available_tools": sorted(tools)}
+
+        arguments = arguments or {}
+        try:
+            inspect.signature(tools[tool]).bind(**arguments)
+        except TypeError as e:
+            return {"error": f"Invalid arguments for {tool}: {e}"}
+
+        job = jobs.submit(tools[tool], tool, arguments)
+        return job.summary()
+
+    @registrar.tool()
+    def job_status(job_id: str) -> dict:
+        """Check a background job's state (queued / running / done / failed / cancelled) and progress"""
+        job = jobs.get(job_id)
+        if job is None:
+            return {"error": f"Job {job_id} not found"}
+        if isinstance(job, dict):
+            return {k: v for k, v in job.items() if k not in ("result", "arguments")}
+        return job.summary()
+
+    @registrar.tool()
+    def job_result(job_id: str) -> dict:
+        """Fetch the result of a finished background job"""
+        job = jobs.get(job_id)
+        if job is None:
+            return {"error": f"Job {job_id} not found"}
+        record = job if isinstance(job, dict) else job.to_record()
+        state = record.get("state")
+        if state != "done":
+            return {"error": f"Job {job_id} is {state}", "job_id": job_id, "state": state, "progress": record.get("progress")}
+        return {"job_id": job_id, "tool": record.get("tool"), "state": "done", "result": record.get("result")}
+
+    @registrar.tool()
+    def list_jobs(limit: int = 20) -> list[dict]:
+        """List the most recent background jobs from this server run"""
+        recent = sorted(jobs.summaries(), key=lambda j: j.get("created", 0), reverse=True)
+        return [{k: v for k, v in j.items() if k != "created"} for j in recent[:limit]]
+
+    @registrar.tool()
+    def cancel_job(job_id: str) -> dict:
+        """Cancel a queued or running background job"""
+        job = jobs.cancel(job_id)
+        if job is None:
+            return {"error": f"Job {job_id} not found or no longer running"}
+        return job.summary()
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import importlib
+import logging
+import os
+import threading
+import time
+from types import ModuleType
+
+logger = logging.getLogger(__name__)
+
+# Every module created through lazy_import(), so warmup() can preload them all
+_lazy_modules: dict[str, "LazyModule"] = {}
+
+
+class LazyModule(ModuleType):
+    """
+    Module placeholder that imports the real module on first attribute access.
+    Lets tool modules be registered (schemas only) without paying for heavy
+    imports like anndata or scipy until a tool actually runs.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            with self.__dict__["_lazy_lock"]:
+                module = self.__dict__["_lazy_module"]
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    @property
+    def loaded(self) -> bool:
+        return self.__dict__["_lazy_module"] is not None
+
+
+def lazy_import(name: str) -> LazyModule:
+    """Return a lazily-imported module (e.g. ad = lazy_import("anndata"))"""
+    if name not in _lazy_modules:
+        _lazy_modules[name] = LazyModule(name)
+    return _lazy_modules[name]
+
+
+def warmup() -> dict:
+    """Import every lazily-registered module now and report timings (seconds)"""
+    timings = {}
+    for name, module in list(_lazy_modules.items()):
+        if module.loaded:
+            continue
+        start = time.perf_counter()
+        try:
+            module._load()
+            timings[name] = round(time.perf_counter() - start, 3)
+        except ImportError as e:
+            logger.warning(f"Warmup failed to import {name}: {e}")
+    return timings
+
+
+def start_background_warmup(delay: float | None = None) -> threading.Thread | None:
+    """
+    Preload heavy libraries on a daemon thread shortly after startup, so the
+    server answers ping immediately and the first real tool call is not cold.
+    Disable with MCP_WARMUP=0; MCP_WARMUP_DELAY sets the delay in seconds.
+    """
+    if os.getenv("MCP_WARMUP", "1").lower() in ("0", "false", "no"):
+        return None
+
+    if delay is None:
+        delay = float(os.getenv("MCP_WARMUP_DELAY", "1.0"))
+
+    def _run():
+        time.sleep(delay)
+        timings = warmup()
+        logger.info(f"Warmup imported {len(timings)} modules: {timings}")
+
+    thread = threading.Thread(target=_run, name="mcp-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+from .columnar import MANIFEST, is_current, source_stamp
+
+FORMAT_VERSION = 1
+
+
+def compiled_dir(src: Path) -> Path:
+    """Compiled loadings live beside the JSON upload"""
+    return src.with_name(f"{src.name}.compiled")
+
+
+def _program_loadings(prog_data) -> dict:
+    """Programs are either {"loadings": {gene: value}, ...} or a plain {gene: value} dict"""
+    if isinstance(prog_data, dict) and "loadings" in prog_data:
+        return prog_data["loadings"] or {}
+    return prog_data if isinstance(prog_data, dict) else {}
+
+
+def compile_loadings(data: dict, src: Path, out_dir: Path) -> Path:
+    """
+    Compile a programs-with-loadings JSON into a gene vocabulary plus a dense
+    float32 programs x genes matrix (NaN where a gene is absent from a program)
+    and a per-program gene order sorted by |loading|, all saved as .npy.
+    """
+    programs = [str(p) for p in data.keys()]
+    vocab: dict[str, int] = {}
+    entries = []
+    for p_idx, prog in enumerate(programs):
+        for gene, value in _program_loadings(data[prog]).items():
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            g_idx = vocab.setdefault(str(gene), len(vocab))
+            entries.append((p_idx, g_idx, value))
+
+    matrix = np.full((len(programs), len(vocab)), np.nan, dtype=np.float32)
+    if entries:
+        rows, cols, vals = (np.asarray(x) for x in zip(*entries))
+        matrix[rows, cols] = vals
+
+    # present genes first (descending |loading|), absent (NaN) genes last
+    sort_key = np.where(np.isnan(matrix), -1.0, np.abs(matrix))
+    order = np.argsort(-sort_key, axis=1, kind="stable").astype(np.int32)
+    n_genes = (~np.isnan(matrix)).sum(axis=1).astype(np.int32)
+
+    tmp_dir = out_dir.with_name(f"{out_dir.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    np.save(tmp_dir / "genes.npy", np.asarray(list(vocab.keys()), dtype=str))
+    np.save(tmp_dir / "loadings.npy", matrix)
+    np.save(tmp_dir / "order.npy", order)
+    np.save(tmp_dir / "n_genes.npy", n_genes)
+    with open(tmp_dir / MANIFEST, "w") as f:
+        json.dump({"version": FORMAT_VERSION, **source_stamp(src), "programs": programs}, f)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return out_dir
+
+
+def is_compiled(src: Path) -> bool:
+    return is_current(src, compiled_dir(src), version=FORMAT_VERSION)
+
+
+class CompiledLoadings:
+    """
+    Memory-mapped view of compiled loadings.
+    Top genes of a program are a slice of `order`; a gene's loadings across all
+    programs are a column of `matrix`.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path / MANIFEST) as f:
+            manifest = json.load(f)
+        self.programs: list[str] = manifest["programs"]
+        self.program_index = {p: i for i, p in enumerate(self.programs)}
+        self.genes: np.ndarray = np.load(path / "genes.npy", mmap_mode="r")
+        self.matrix: np.ndarray = np.load(path / "loadings.npy", mmap_mode="r")
+        self.order: np.ndarray = np.load(path / "order.npy", mmap_mode="r")
+        self.n_genes: np.ndarray = np.load(path / "n_genes.npy")
+
+        self.gene_index: dict[str, int] = {}
+        self.upper_index: dict[str, list[int]] = {}
+        for i, g in enumerate(self.genes.tolist()):
+            self.gene_index[g] = i
+            self.upper_index.setdefault(g.upper(), []).append(i)
+        self._upper_sets: np.ndarray | None = None
+        self._unit_rows: tuple[np.ndarray, np.ndarray] | None = None
+
+    def top_genes(self, program: str, top_k: int) -> list[tuple[str, float]]:
+        p = self.program_index[program]
+        idx = np.asarray(self.order[p, :min(top_k, int(self.n_genes[p]))])
+        return list(zip(self.genes[idx].tolist(), self.matrix[p, idx].astype(float).tolist()))
+
+    def gene_column(self, gene: str) -> np.ndarray | None:
+        """
+        Loadings of one gene across all programs (NaN where absent), matched
+        case-insensitively; an exact-case match wins where both exist.
+        """
+        candidates = self.upper_index.get(gene.upper())
+        if not candidates:
+            return None
+        col = np.full(len(self.programs), np.nan, dtype=np.float32)
+        preferred = [self.gene_index[g] for g in (gene, gene.upper()) if g in self.gene_index]
+        for g_idx in reversed(list(dict.fromkeys(preferred + candidates))):
+            values = self.matrix[:, g_idx]
+            col = np.where(np.isnan(values), col, values)
+        return col
+
+    def upper_gene_sets(self) -> np.ndarray:
+        """programs x upper-cased genes membership matrix (for overlap metrics)"""
+        if self._upper_sets is None:
+            present = ~np.isnan(np.asarray(self.matrix))
+            upper_of_gene = np.empty(len(self.genes), dtype=np.int64)
+            for u, members in enumerate(self.upper_index.values()):
+                upper_of_gene[members] = u
+            sets = np.zeros((len(self.upper_index), len(self.programs)), dtype=bool)
+            np.logical_or.at(sets, upper_of_gene, present.T)
+            self._upper_sets = sets.T
+        return self._upper_sets
+
+    def unit_rows(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (sorted upper-cased genes, programs x those genes loadings scaled to unit
+        L2 norm per program); absent genes are 0, so dot products are cosines.
+        """
+        if self._unit_rows is None:
+            upper = np.array(sorted(self.upper_index), dtype=str)
+            values = np.nan_to_num(np.asarray(self.matrix, dtype=np.float32))
+            unit = np.zeros((len(self.programs), len(upper)), dtype=np.float32)
+            cols = np.searchsorted(upper, np.char.upper(np.asarray(self.genes, dtype=str)))
+            np.add.at(unit.T, cols, values.T)
+            norms = np.linalg.norm(unit, axis=1, keepdims=True)
+            self._unit_rows = (upper, unit / np.where(norms > 0, norms, 1.0))
+        return self._unit_rows
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+from typing import Literal, Optional
+
+import numpy as np
+from .data import _load_expression, _load_once, _obs_columns
+from .expression import CHUNK_NNZ, ExpressionStore
+from .grouping import GroupIndex, _load_grouping
+from .lazy import lazy_import
+
+sparse = lazy_import("scipy.sparse")
+scipy_stats = lazy_import("scipy.stats")
+multitest = lazy_import("statsmodels.stats.multitest")
+
+_marker_cache: dict[tuple[str, str, str], "MarkerStats"] = {}
+
+
+def _gene_chunks(expr: ExpressionStore, chunk_nnz: int = CHUNK_NNZ):
+    """Yield (first gene, CSC block of consecutive genes) with about chunk_nnz non-zeros each"""
+    indptr = expr.indptr
+    j = 0
+    while j < expr.n_vars:
+        end = int(np.searchsorted(indptr, indptr[j] + chunk_nnz, side="right")) - 1
+        end = min(max(end, j + 1), expr.n_vars)
+        lo, hi = int(indptr[j]), int(indptr[end])
+        block = sparse.csc_matrix(
+            (np.asarray(expr.data[lo:hi], dtype=np.float64), np.asarray(expr.indices[lo:hi]), indptr[j:end + 1] - lo),
+            shape=(expr.n_obs, end - j),
+        )
+        yield j, block
+        j = end
+
+
+def _rank_sums(block, codes: np.ndarray, n_groups: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Per-group rank sums (groups x genes) and tie terms sum(t^3 - t) (genes) for
+    one CSC block, ranking each gene over all cells while only touching its
+    non-zeros: zeros share one tied rank, negatives rank below them and
+    positives above.
+    """
+    n = block.shape[0]
+    n_genes = block.shape[1]
+    counts = np.diff(block.indptr)
+    col = np.repeat(np.arange(n_genes), counts)
+    data, rows = block.data, block.indices
+
+    order = np.lexsort((data, col))
+    col_s, data_s, rows_s = col[order], data[order], rows[order]
+
+    # average rank among the gene's non-zeros (ties share the mean position)
+    pos = np.arange(len(data_s)) - block.indptr[col_s] + 1
+    new_tie = np.ones(len(data_s), dtype=bool)
+    new_tie[1:] = (col_s[1:] != col_s[:-1]) | (data_s[1:] != data_s[:-1])
+    tie_id = np.cumsum(new_tie) - 1
+    tie_size = np.bincount(tie_id)
+    avg_pos = (np.bincount(tie_id, weights=pos) / tie_size)[tie_id]
+
+    n_zero = n - counts
+    n_neg = np.bincount(col_s[data_s < 0], minlength=n_genes)
+    rank = np.where(data_s < 0, avg_pos, avg_pos + n_zero[col_s])
+    zero_rank = n_neg + (n_zero + 1) / 2
+
+    group = codes[rows_s]
+    nz_sums = np.bincount(group * n_genes + col_s, weights=rank, minlength=n_groups * n_genes)
+    nz_counts = np.bincount(group * n_genes + col_s, minlength=n_groups * n_genes)
+    nz_sums = nz_sums.reshape(n_groups, n_genes)
+    nz_counts = nz_counts.reshape(n_groups, n_genes)
+
+    group_sizes = np.bincount(codes, minlength=n_groups)[:, None]
+    rank_sums = nz_sums + (group_sizes - nz_counts) * zero_rank
+
+    tie_starts = col_s[new_tie]
+    ties = np.bincount(tie_starts, weights=tie_size.astype(np.float64) ** 3 - tie_size, minlength=n_genes)
+    ties += n_zero.astype(np.float64) ** 3 - n_zero
+    return rank_sums, ties
+
+
+class MarkerStats:
+    """
+    One-vs-rest statistics for every gene x group of one grouping, from a
+    single chunked pass over the CSC copy of X: per-group sums, sums of squares
+    and non-zero counts are sparse indicator products, so X is never densified.
+    """
+
+    def __init__(self, expr: ExpressionStore, grouping: GroupIndex, method: str):
+        self.genes = expr.var_names
+        self.levels = [lv[0] for lv in grouping.levels]
+        n_groups, n_genes = grouping.n_groups, expr.n_vars
+        indicator = grouping.indicator().astype(np.float64)
+
+        sums = np.zeros((n_groups, n_genes))
+        sq_sums = np.zeros((n_groups, n_genes))
+        nnz = np.zeros((n_groups, n_genes))
+        rank_sums = np.zeros((n_groups, n_genes))
+        ties = np.zeros(n_genes)
+        for j, block in _gene_chunks(expr):
+            cols = slice(j, j + block.shape[1])
+            sums[:, cols] = (indicator @ block).toarray()
+            sq_sums[:, cols] = (indicator @ block.multiply(block)).toarray()
+            nnz[:, cols] = (indicator @ (block > 0).astype(np.float64)).toarray()
+            if method == "wilcoxon":
+                rank_sums[:, cols], ties[cols] = _rank_sums(block, grouping.codes, n_groups)
+
+        n = float(expr.n_obs)
+        n_in = grouping.counts.astype(np.float64)[:, None]
+        n_out = n - n_in
+        self.n_cells = grouping.counts
+        self.mean_in = sums / n_in
+        self.mean_out = (sums.sum(axis=0) - sums) / np.maximum(n_out, 1)
+        self.frac_in = nnz / n_in
+        self.frac_out = (nnz.sum(axis=0) - nnz) / np.maximum(n_out, 1)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if method == "wilcoxon":
+                u = rank_sums - n_in * (n_in + 1) / 2
+                sigma = np.sqrt(n_in * n_out / 12 * ((n + 1) - ties / (n * (n - 1))))
+                self.score = (u - n_in * n_out / 2) / sigma
+                self.pvals = 2 * scipy_stats.norm.sf(np.abs(self.score))
+            else:
+                var_in = (sq_sums - n_in * self.mean_in ** 2) / np.maximum(n_in - 1, 1)
+                sq_out = sq_sums.sum(axis=0) - sq_sums
+                var_out = (sq_out - n_out * self.mean_out ** 2) / np.maximum(n_out - 1, 1)
+                se_in, se_out = np.maximum(var_in, 0) / n_in, np.maximum(var_out, 0) / n_out
+                self.score = (self.mean_in - self.mean_out) / np.sqrt(se_in + se_out)
+                df = (se_in + se_out) ** 2 / (se_in ** 2 / np.maximum(n_in - 1, 1) + se_out ** 2 / np.maximum(n_out - 1, 1))
+                self.pvals = 2 * scipy_stats.t.sf(np.abs(self.score), df)
+
+        self.score = np.nan_to_num(self.score, nan=0.0)
+        self.pvals = np.nan_to_num(self.pvals, nan=1.0)
+        self.qvals = np.vstack([multitest.multipletests(p, method="fdr_bh")[1] for p in self.pvals])
+
+    def top(self, g: int, k: int) -> np.ndarray:
+        """Indices of the k highest-scoring genes for group g, best first"""
+        k = min(k, len(self.genes))
+        idx = np.argpartition(-self.score[g], k - 1)[:k]
+        return idx[np.argsort(-self.score[g, idx], kind="stable")]
+
+
+def _load_markers(h5ad_id: str, group_col: str, method: str) -> MarkerStats | None:
+    """Cached marker statistics per (dataset, group column, method)"""
+
+    def load():
+        expr = _load_expression(h5ad_id)
+        grouping = _load_grouping(h5ad_id, [group_col])
+        if expr is None or grouping is None:
+            return None
+        return MarkerStats(expr, grouping, method)
+
+    return _load_once(_marker_cache, (h5ad_id, group_col, method), "markers", load)
+
+
+def register_marker_tools(mcp):
+
+    @mcp.tool()
+    def rank_marker_genes(
+        h5ad_id: str,
+        group_col: str = "cell_type",
+        groups: Optional[list[str]] = None,
+        method: Literal["t-test", "wilcoxon"] = "t-test",
+        top_k: int = 20,
+        min_fraction: float = 0.0,
+    ) -> dict:
+        """
+        Marker genes for every group (one-vs-rest) from adata.X: the genes that most
+        distinguish e.g. each cell type, with means, fraction of cells expressing,
+        test statistic and BH q-values (per group, across genes).
+
+        Args:
+            h5ad_id: Dataset ID of the H5AD file
+            group_col: Obs column defining the groups (e.g., 'cell_type')
+            groups: Only report these groups (default all)
+            method: 't-test' (Welch) or 'wilcoxon' (rank-sum, normal approximation with tie correction)
+            top_k: Markers per group
+            min_fraction: Only report genes expressed in at least this fraction of the group's cells
+        """
+        obs_cols = _obs_columns(h5ad_id)
+        if obs_cols is None:
+            return {"error": f"Dataset {h5ad_id} not found"}
+        if group_col not in obs_cols:
+            return {"error": f"Column {group_col} not found"}
+
+        stats = _load_markers(h5ad_id, group_col, method)
+        if stats is None:
+            return {"error": f"Dataset {h5ad_id} has no expression matrix"}
+        if groups:
+            missing = [g for g in groups if str(g) not in stats.levels]
+            if missing:
+                return {"error": f"Groups not found in {group_col}: {missing}", "available_groups": stats.levels}
+
+        results = []
+        for g, level in enumerate(stats.levels):
+            if groups and level not in {str(x) for x in groups}:
+                continue
+
+            candidates = stats.top(g, len(stats.genes) if min_fraction > 0 else top_k)
+            if min_fraction > 0:
+                candidates = candidates[stats.frac_in[g, candidates] >= min_fraction][:top_k]
+
+            results.append({
+                "group": level,
+                "n_cells": int(stats.n_cells[g]),
+                "markers": [
+                    {
+                        "gene": stats.genes[i],
+                        "score": float(stats.score[g, i]),
+                        "p_value": float(stats.pvals[g, i]),
+                        "q_value": float(stats.qvals[g, i]),
+                        "mean_in": float(stats.mean_in[g, i]),
+                        "mean_out": float(stats.mean_out[g, i]),
+                        "fraction_in": float(stats.frac_in[g, i]),
+                        "fraction_out": float(stats.frac_out[g, i]),
+                    }
+                    for i in candidates
+                ],
+            })
+
+        return {"group_col": group_col, "method": method, "groups": results}
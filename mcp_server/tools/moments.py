@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import numpy as np
+from .data import _load_obs, _load_obs_matrix, _load_once, _program_columns
+from .lazy import lazy_import
+
+pd = lazy_import("pandas")
+scipy_stats = lazy_import("scipy.stats")
+
+# Rows per block when accumulating the covariance (bounds float64 temporaries)
+CHUNK_ROWS = 65536
+
+_moments_cache: dict[tuple, "ProgramMoments"] = {}
+_ranks_cache: dict[tuple, np.ndarray] = {}
+
+
+class ProgramMoments:
+    """
+    Means, standard deviations and the full covariance of a set of activity
+    columns. Correlations between any subset are a sub-matrix of the covariance,
+    so the cell-level data is read once per dataset.
+    NaN activities are treated as the column mean.
+
+    With a covariate design matrix, the covariance is the partial covariance
+    given the covariates: Sxx - Sxd Sdd^+ Sdx (the covariance of the least-squares
+    residuals), computed from the same one-pass cross products.
+    """
+
+    def __init__(self, columns: list[str], x: np.ndarray, design: np.ndarray | None = None):
+        self.columns = list(columns)
+        self.index = {c: i for i, c in enumerate(self.columns)}
+        self.n = x.shape[0]
+        n_cols = len(self.columns)
+        if design is not None:
+            x = np.hstack([x, design.astype(x.dtype, copy=False)])
+
+        with np.errstate(invalid="ignore"):
+            mean = np.nanmean(x, axis=0, dtype=np.float64)
+        cross = np.zeros((x.shape[1], x.shape[1]))
+        for start in range(0, self.n, CHUNK_ROWS):
+            block = x[start:start + CHUNK_ROWS].astype(np.float64) - mean
+            block[np.isnan(block)] = 0.0
+            cross += block.T @ block
+        cov = cross / max(self.n - 1, 1)
+
+        self.mean = mean[:n_cols]
+        self.cov = cov[:n_cols, :n_cols]
+        if design is not None:
+            s_xd = cov[:n_cols, n_cols:]
+            self.cov = self.cov - s_xd @ np.linalg.pinv(cov[n_cols:, n_cols:]) @ s_xd.T
+        self.var = np.maximum(np.diag(self.cov), 0.0)
+        self.std = np.sqrt(self.var)
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.index
+
+    def corr(self, columns: list[str]) -> np.ndarray:
+        idx = [self.index[c] for c in columns]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr = self.cov[np.ix_(idx, idx)] / np.outer(self.std[idx], self.std[idx])
+        diag = np.arange(len(idx))
+        corr[diag, diag] = np.where(self.std[idx] > 0, 1.0, np.nan)
+        return np.clip(corr, -1.0, 1.0)
+
+    def top_variance(self, k: int) -> list[str]:
+        order = np.argsort(-self.var, kind="stable")
+        return [self.columns[i] for i in order[:k]]
+
+
+def rank_columns(x: np.ndarray) -> np.ndarray:
+    """Average ranks of every column (NaN stays NaN)"""
+    return scipy_stats.rankdata(x, axis=0, nan_policy="omit").astype(np.float32)
+
+
+def covariate_design(obs) -> np.ndarray:
+    """
+    Design matrix for residualization: numeric covariates as-is, categorical
+    ones as indicator columns (first level dropped; the intercept is implicit
+    because everything is centred).
+    """
+    blocks = []
+    for col in obs.columns:
+        values = obs[col]
+        if pd.api.types.is_numeric_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype):
+            blocks.append(np.asarray(values, dtype=np.float32)[:, None])
+            continue
+        codes = np.asarray(pd.Categorical(values.astype(str)).codes)
+        onehot = np.zeros((len(codes), max(codes.max(), 0)), dtype=np.float32)
+        keep = codes > 0
+        onehot[np.flatnonzero(keep), codes[keep] - 1] = 1.0
+        blocks.append(onehot)
+    return np.hstack(blocks) if blocks else np.empty((len(obs), 0), dtype=np.float32)
+
+
+def _load_ranks(dataset_id: str, rows: np.ndarray | None, sample_key: tuple | None) -> np.ndarray | None:
+    """
+    Cells x programs rank matrix, cached once per dataset / sketch. Rows without
+    a sample_key (e.g. a subset) are ranked without caching.
+    """
+
+    def load():
+        program_cols = _program_columns(dataset_id)
+        if not program_cols:
+            return None
+        return rank_columns(_load_obs_matrix(dataset_id, program_cols, rows))
+
+    if rows is not None and sample_key is None:
+        return load()
+    return _load_once(_ranks_cache, (dataset_id, sample_key), "ranks", load)
+
+
+def compute_moments(
+    dataset_id: str,
+    columns: list[str],
+    rows: np.ndarray | None = None,
+    method: str = "pearson",
+    covariates: tuple[str, ...] = (),
+) -> ProgramMoments:
+    """Uncached moments of arbitrary numeric obs columns"""
+    x = _load_obs_matrix(dataset_id, columns, rows)
+    if method == "spearman":
+        x = rank_columns(x)
+    design = covariate_design(_load_obs(dataset_id, list(covariates), rows)) if covariates else None
+    return ProgramMoments(columns, x, design)
+
+
+def _load_moments(
+    dataset_id: str,
+    rows: np.ndarray | None = None,
+    sample_key: tuple | None = None,
+    method: str = "pearson",
+    covariates: tuple[str, ...] = (),
+) -> ProgramMoments | None:
+    """
+    Cached moments of all program columns, per dataset, method ('pearson' or
+    'spearman', which reuses the cached ranks) and covariate set (and per sketch:
+    sample_key identifies the sketch when rows are given). Rows without a
+    sample_key (e.g. a subset) are computed without caching.
+    """
+    key = (dataset_id, sample_key, method, tuple(covariates))
+
+    def load():
+        program_cols = _program_columns(dataset_id)
+        if not program_cols:
+            return None
+        if method == "spearman":
+            x = _load_ranks(dataset_id, rows, sample_key)
+        else:
+            x = _load_obs_matrix(dataset_id, program_cols, rows)
+        design = covariate_design(_load_obs(dataset_id, list(covariates), rows)) if covariates else None
+        return ProgramMoments(program_cols, x, design)
+
+    if rows is not None and sample_key is None:
+        return load()
+    return _load_once(_moments_cache, key, "moments", load)
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import os
+
+import numpy as np
+from .data import _dataset_shape, _load_obs, _load_once, _virtual_columns
+
+# Upper bound on memory held by cached sort orders (further columns are sorted per call)
+ORDER_CACHE_BYTES = int(os.getenv("MCP_ORDER_CACHE_MB", "512")) * 2**20
+
+_order_cache: dict[tuple[str, str], np.ndarray] = {}
+
+
+def sort_order(x: np.ndarray) -> np.ndarray:
+    """Stable ascending argsort (NaN last), as int32 when the positions fit"""
+    order = np.argsort(x, kind="stable")
+    return order.astype(np.int32) if len(x) < 2**31 else order
+
+
+def _cache_has_room(n_cells: int) -> bool:
+    used = sum(o.nbytes for o in _order_cache.values())
+    return used + n_cells * 4 <= ORDER_CACHE_BYTES
+
+
+def _column_order(dataset_id: str, column: str, build: bool = True) -> np.ndarray | None:
+    """
+    Cached ascending order of all cells by a numeric obs column (argsort, computed
+    lazily once). With build=False only an already cached order is returned.
+    Virtual columns (gene-set scores) can change, so they are never cached.
+    """
+    key = (dataset_id, column)
+    if key in _order_cache or not build:
+        return _order_cache.get(key)
+
+    def load():
+        values = _load_obs(dataset_id, [column])
+        return sort_order(np.asarray(values[column], dtype=np.float64)) if values is not None else None
+
+    if column in _virtual_columns.get(dataset_id, {}) or not _cache_has_room(_dataset_shape(dataset_id)[0]):
+        return load()
+    return _load_once(_order_cache, key, "order", load)
+
+
+def _cell_order(
+    dataset_id: str, column: str, rows: np.ndarray | None = None, build: bool = True
+) -> np.ndarray | None:
+    """
+    Ascending order of the selected cells (positions into rows; all cells if rows
+    is None) derived from the cached full order without sorting again. None when
+    sorting the selection directly is cheaper (small subsets) or nothing is cached.
+    """
+    if rows is not None:
+        n_obs = _dataset_shape(dataset_id)[0]
+        if len(rows) * max(np.log2(max(len(rows), 2)), 1.0) < n_obs:
+            return None
+    order = _column_order(dataset_id, column, build)
+    if order is None or rows is None:
+        return order
+
+    position = np.full(len(order), -1, dtype=order.dtype)
+    position[rows] = np.arange(len(rows), dtype=order.dtype)
+    selected = position[order]
+    return selected[selected >= 0]
+
+
+def extreme_rows(values: np.ndarray, k: int, largest: bool = True, order: np.ndarray | None = None) -> np.ndarray:
+    """
+    Positions of the k largest (or smallest) non-NaN values, most extreme first.
+    Uses a precomputed ascending order when given, otherwise argpartition; both
+    break ties the same way (later rows first for largest, earlier for smallest).
+    """
+    n_valid = int(np.count_nonzero(~np.isnan(values)))
+    k = min(k, n_valid)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if order is not None:
+        return order[:n_valid][::-1][:k] if largest else order[:k]
+
+    valid = np.flatnonzero(~np.isnan(values))
+    key = -values[valid] if largest else values[valid]
+    kth = np.partition(key, k - 1)[k - 1]
+    strict = valid[key < kth]
+    ties = valid[key == kth]
+    ties = ties[::-1] if largest else ties
+    picked = np.concatenate([strict, ties[:k - len(strict)]])
+    ranked = np.lexsort((-picked if largest else picked, -values[picked] if largest else values[picked]))
+    return picked[ranked]
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable
+
+import numpy as np
+from .lazy import lazy_import
+
+scipy_stats = lazy_import("scipy.stats")
+
+# Worker processes for CPU-bound stats (0 or 1 disables the pool)
+STATS_WORKERS = int(os.getenv("MCP_STATS_WORKERS", str(os.cpu_count() or 1)))
+# Only use the pool when cells x programs is at least this large
+PARALLEL_MIN_VALUES = int(os.getenv("MCP_PARALLEL_MIN_VALUES", "5000000"))
+
+# comparison = (group code, other group code); REST compares against all other cells
+REST = -1
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def should_parallelize(n_cells: int, n_columns: int) -> bool:
+    return STATS_WORKERS > 1 and n_columns > 1 and n_cells * n_columns >= PARALLEL_MIN_VALUES
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Shared process pool, created on first use (spawned, so it is safe next to server threads)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=STATS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def mannwhitney_columns(
+    columns: list[np.ndarray],
+    codes: np.ndarray,
+    comparisons: list[tuple[int, int]],
+    alternative: str,
+    min_cells: int,
+    progress: Callable[[int, int], None] | None = None,
+    orders: list[np.ndarray | None] | None = None,
+) -> list[list[tuple[float, float, float, int, int]]]:
+    """
+    Mann-Whitney U for every column x comparison.
+    Returns, per column, one (u_stat, p_value, median_diff, n_in, n_out) per comparison.
+    Each column is sorted once (or uses its precomputed ascending order from
+    orders); every comparison then takes mid-ranks over its cells in that order
+    instead of re-ranking inside scipy. Comparisons with NaNs or with a group of
+    at most 8 cells (where scipy may use the exact distribution) go to scipy.
+    """
+    masks = []
+    for a, b in comparisons:
+        mask_a = codes == a
+        mask_b = ~mask_a if b == REST else codes == b
+        masks.append((mask_a, mask_b))
+
+    results = []
+    for i, column in enumerate(columns):
+        x_all = np.asarray(column, dtype=float)
+        order = orders[i] if orders is not None else None
+        per_column = []
+        for mask_a, mask_b in masks:
+            n_a, n_b = int(mask_a.sum()), int(mask_b.sum())
+
+            if n_a < min_cells or n_b < min_cells:
+                stat, p = 0.0, 1.0
+                med_diff = float("nan")
+            elif min(n_a, n_b) <= 8 or np.isnan(x_all[mask_a | mask_b]).any():
+                a, b = x_all[mask_a], x_all[mask_b]
+                stat, p = scipy_stats.mannwhitneyu(a, b, alternative=alternative)
+                med_diff = float(np.nanmedian(a) - np.nanmedian(b))
+            else:
+                if order is None:
+                    order = np.argsort(x_all, kind="stable")
+                stat, p, med_diff = _mwu_sorted(x_all, order, mask_a, mask_b, alternative)
+
+            per_column.append((float(stat), float(p), med_diff, n_a, n_b))
+        results.append(per_column)
+        if progress is not None:
+            progress(len(results), len(columns))
+    return results
+
+
+def _sorted_median(x: np.ndarray) -> float:
+    n = len(x)
+    return float((x[(n - 1) // 2] + x[n // 2]) / 2)
+
+
+def _mwu_sorted(
+    x: np.ndarray, order: np.ndarray, mask_a: np.ndarray, mask_b: np.ndarray, alternative: str
+) -> tuple[float, float, float]:
+    """(U of group a, p-value, median difference) from an ascending order of x (no NaNs in a or b)"""
+    in_a = mask_a[order]
+    keep = in_a | mask_b[order]
+    xs, in_a = x[order[keep]], in_a[keep]
+
+    starts = np.flatnonzero(np.concatenate([[True], xs[1:] != xs[:-1]]))
+    ties = np.diff(np.append(starts, len(xs)))
+    ranks = np.repeat(starts + (ties + 1) / 2, ties)
+
+    n_a = int(in_a.sum())
+    u = float(ranks[in_a].sum() - n_a * (n_a + 1) / 2)
+    tie_term = float(np.sum(ties.astype(float) ** 3 - ties))
+    p = _mwu_pvalue(u, n_a, len(xs) - n_a, tie_term, alternative)
+    return u, p, _sorted_median(xs[in_a]) - _sorted_median(xs[~in_a])
+
+
+def mannwhitney_paths(paths: list[str], *args) -> list:
+    """Worker entry point: memory-map the column files and test them"""
+    return mannwhitney_columns([np.load(p, mmap_mode="r") for p in paths], *args)
+
+
+def _mwu_pvalue(u: float, n_a: int, n_b: int, tie_term: float, alternative: str) -> float:
+    """Normal-approximation p-value with tie and continuity correction (as scipy's asymptotic method)"""
+    n = n_a + n_b
+    mu = n_a * n_b / 2
+    var = n_a * n_b / 12 * ((n + 1) - tie_term / (n * (n - 1)))
+    if var <= 0:
+        return 1.0
+    if alternative == "two-sided":
+        u = max(u, n_a * n_b - u)
+    elif alternative == "less":
+        u = n_a * n_b - u
+    p = float(scipy_stats.norm.sf((u - mu - 0.5) / np.sqrt(var)))
+    return min(2 * p, 1.0) if alternative == "two-sided" else p
+
+
+def mannwhitney_all_pairs(
+    columns: list[np.ndarray],
+    codes: np.ndarray,
+    n_groups: int,
+    alternative: str,
+    min_cells: int,
+    progress: Callable[[int, int], None] | None = None,
+    orders: list[np.ndarray | None] | None = None,
+) -> list[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Mann-Whitney U between every pair of groups (codes 0..n_groups-1; -1 is
+    ignored) for every column. Each group's values are sorted once per column
+    (split out of the column's precomputed ascending order when given in orders);
+    U for a pair is a merge of two sorted arrays (searchsorted), and the tie
+    correction comes from the per-group value counts, so nothing is re-ranked
+    per pair. NaNs are dropped. Pairs with a group of at most 8 cells use scipy
+    (which may pick the exact distribution).
+    Returns per column (u, p, median_diff, n): u, p and median_diff are
+    n_groups x n_groups with [a, b] testing group a against group b
+    (a > b for 'greater'); n holds the cells per group.
+    """
+    results = []
+    for i, column in enumerate(columns):
+        x = np.asarray(column, dtype=float)
+        order = orders[i] if orders is not None else None
+        if order is None:
+            keep = (codes >= 0) & ~np.isnan(x)
+            xk, ck = x[keep], codes[keep]
+            xs = xk[np.lexsort((xk, ck))]
+        else:
+            xo, co = x[order], codes[order]
+            keep = (co >= 0) & ~np.isnan(xo)
+            xo, ck = xo[keep], co[keep]
+            xs = xo[np.argsort(ck, kind="stable")]
+        counts = np.bincount(ck, minlength=n_groups)
+        groups = np.split(xs, np.cumsum(counts)[:-1])
+        uniques = [np.unique(g, return_counts=True) for g in groups]
+        ties = [float(np.sum(c.astype(float) ** 3 - c)) for _, c in uniques]
+
+        u = np.zeros((n_groups, n_groups))
+        p = np.ones((n_groups, n_groups))
+        med = np.full((n_groups, n_groups), np.nan)
+        for a in range(n_groups):
+            for b in range(a + 1, n_groups):
+                ga, gb = groups[a], groups[b]
+                n_a, n_b = ga.size, gb.size
+                if n_a < min_cells or n_b < min_cells or n_a == 0 or n_b == 0:
+                    continue
+
+                if min(n_a, n_b) <= 8:
+                    u_ab = float(scipy_stats.mannwhitneyu(ga, gb, alternative="greater").statistic)
+                    if alternative == "two-sided":
+                        p[a, b] = p[b, a] = float(scipy_stats.mannwhitneyu(ga, gb).pvalue)
+                    else:
+                        p[a, b] = float(scipy_stats.mannwhitneyu(ga, gb, alternative=alternative).pvalue)
+                        p[b, a] = float(scipy_stats.mannwhitneyu(gb, ga, alternative=alternative).pvalue)
+                else:
+                    left = np.searchsorted(gb, ga, side="left")
+                    right = np.searchsorted(gb, ga, side="right")
+                    u_ab = float(left.sum() + 0.5 * (right - left).sum())
+
+                    (ua, ca), (ub, cb) = uniques[a], uniques[b]
+                    idx = np.minimum(np.searchsorted(ub, ua), len(ub) - 1)
+                    common = ub[idx] == ua
+                    ta, tb = ca[common].astype(float), cb[idx[common]].astype(float)
+                    tie_term = ties[a] + ties[b] + float(np.sum(3 * ta * tb * (ta + tb)))
+
+                    p[a, b] = _mwu_pvalue(u_ab, n_a, n_b, tie_term, alternative)
+                    p[b, a] = p[a, b] if alternative == "two-sided" else _mwu_pvalue(n_a * n_b - u_ab, n_b, n_a, tie_term, alternative)
+
+                u[a, b], u[b, a] = u_ab, n_a * n_b - u_ab
+                med[a, b] = float(np.median(ga) - np.median(gb))
+                med[b, a] = -med[a, b]
+
+        results.append((u, p, med, counts))
+        if progress is not None:
+            progress(len(results), len(columns))
+    return results
+
+
+def mannwhitney_all_pairs_paths(paths: list[str], *args) -> list:
+    """Worker entry point for mannwhitney_all_pairs"""
+    return mannwhitney_all_pairs([np.load(p, mmap_mode="r") for p in paths], *args)
+
+
+def map_column_chunks(func, paths: list[str], *args, progress: Callable[[int, int], None] | None = None) -> list:
+    """
+    Split column files into one chunk per worker, run func(chunk_paths, *args)
+    on the pool, and concatenate the per-column results in the original order.
+    Workers memory-map the columns themselves, so no activity data is pickled.
+    """
+    n_chunks = min(STATS_WORKERS, len(paths))
+    chunks = [list(c) for c in np.array_split(np.asarray(paths, dtype=object), n_chunks) if len(c)]
+    futures = {get_pool().submit(func, chunk, *args): len(chunk) for chunk in chunks}
+
+    done = 0
+    try:
+        for future in as_completed(futures):
+            future.result()
+            done += futures[future]
+            if progress is not None:
+                progress(done, len(paths))
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+    results = []
+    for future in futures:
+        results.extend(future.result())
+    return results
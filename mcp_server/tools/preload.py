@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+from .data import (
+    COLUMNAR_DIR,
+    DATASETS_DIR,
+    _compile_json,
+    _expression_cache,
+    _ingest_h5ad,
+    _load_expression,
+    _loadings_cache,
+    _obs_store_cache,
+    _recent_datasets,
+)
+from .program_index import program_index
+from .vocab import _load_vocab
+
+logger = logging.getLogger(__name__)
+
+# Memory budget for preloaded datasets (estimated from file sizes)
+PRELOAD_BUDGET_MB = float(os.getenv("MCP_PRELOAD_BUDGET_MB", "4096"))
+# How many recently used / uploaded datasets to warm at startup
+PRELOAD_AT_STARTUP = int(os.getenv("MCP_PRELOAD_AT_STARTUP", "3"))
+# How often to look for new uploads in data/datasets
+PRELOAD_POLL_SECONDS = float(os.getenv("MCP_PRELOAD_POLL_SECONDS", "2"))
+
+# Rough in-memory size relative to the uploaded file
+_MEMORY_FACTOR = {"h5ad": 1.0, "json": 1.0}
+
+
+def _read_meta(meta_file: Path) -> dict | None:
+    """Read a dataset metadata file; None if it is missing or still being written"""
+    try:
+        with open(meta_file) as f:
+            meta = json.load(f)
+        return meta if "id" in meta and "fileName" in meta else None
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _kind(meta: dict) -> str | None:
+    name = meta["fileName"].lower()
+    if name.endswith(".h5ad"):
+        return "h5ad"
+    if name.endswith(".json"):
+        return "json"
+    return None
+
+
+def _estimated_mb(meta: dict) -> float:
+    return meta.get("fileSize", 0) / 1024 / 1024 * _MEMORY_FACTOR.get(_kind(meta), 1.0)
+
+
+def _store_mb(dataset_id: str) -> float:
+    """Size of an H5AD's memory-mapped stores (columnar obs and CSC X), the most they can occupy"""
+    total = 0
+    for store in (COLUMNAR_DIR / dataset_id, COLUMNAR_DIR / f"{dataset_id}.X_csc"):
+        if store.is_dir():
+            total += sum(f.stat().st_size for f in store.iterdir() if f.is_file())
+    return total / 1024 / 1024
+
+
+def _upload_time(meta: dict) -> int:
+    """Dataset ids look like ds_<epoch ms>_<random>"""
+    try:
+        return int(meta["id"].split("_")[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+class DatasetPreloader:
+    """
+    Background loader that warms the dataset caches in data.py.
+
+    At startup it queues the most recently used (or, failing that, most recently
+    uploaded) datasets; afterwards it polls data/datasets and queues every newly
+    uploaded dataset. Every loadings JSON not yet in the program search index
+    (see program_index.py) is also indexed, and its gene vocabulary built for
+    fuzzy lookups, on a separate thread. A single worker thread converts new H5AD uploads to the
+    columnar obs store, then opens the obs and CSC expression stores (tools never
+    read the AnnData itself), and compiles loadings JSON to binary arrays; queued
+    datasets are handled in order, skipping anything that would exceed the memory budget.
+    """
+
+    def __init__(self, budget_mb: float = PRELOAD_BUDGET_MB, poll_seconds: float = PRELOAD_POLL_SECONDS):
+        self.budget_mb = budget_mb
+        self.poll_seconds = poll_seconds
+        self.status: dict[str, dict] = {}
+        self._queue: queue.Queue[tuple[str, bool]] = queue.Queue()
+        self._index_queue: queue.Queue[str] = queue.Queue()
+        self._known: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._started = False
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        self._scan(startup=True)
+        threading.Thread(target=self._work, name="mcp-preload-worker", daemon=True).start()
+        threading.Thread(target=self._watch, name="mcp-preload-watcher", daemon=True).start()
+        threading.Thread(target=self._index_work, name="mcp-index-worker", daemon=True).start()
+
+    def request(self, dataset_id: str, force: bool = False) -> dict:
+        """Queue a dataset for warming; force ignores the memory budget"""
+        if dataset_id not in self._known:
+            self._scan()
+        if dataset_id not in self._known:
+            return {"dataset_id": dataset_id, "state": "not_found"}
+
+        if self._is_cached(dataset_id):
+            self._set_status(dataset_id, "loaded")
+        elif self.status.get(dataset_id, {}).get("state") not in ("queued", "ingesting", "loading"):
+            self._enqueue(dataset_id, force)
+        return {"dataset_id": dataset_id, **self.status[dataset_id]}
+
+    def cached_mb(self) -> float:
+        return sum(
+            _store_mb(ds) if _kind(m) == "h5ad" else _estimated_mb(m)
+            for ds, m in self._known.items() if self._is_cached(ds)
+        )
+
+    def snapshot(self) -> dict:
+        return {
+            "budget_mb": self.budget_mb,
+            "cached_mb_estimate": round(self.cached_mb(), 1),
+            "queue_depth": self._queue.qsize(),
+            "datasets": {ds: dict(s) for ds, s in self.status.items()},
+        }
+
+    def _is_cached(self, dataset_id: str) -> bool:
+        return (
+            dataset_id in _obs_store_cache and dataset_id in _expression_cache
+        ) or dataset_id in _loadings_cache
+
+    def _set_status(self, dataset_id: str, state: str, **extra) -> None:
+        self.status[dataset_id] = {"state": state, "updated": time.time(), **extra}
+
+    def _enqueue(self, dataset_id: str, force: bool = False) -> None:
+        self._set_status(dataset_id, "queued")
+        self._queue.put((dataset_id, force))
+
+    def _scan(self, startup: bool = False) -> None:
+        """Pick up new metadata files; queue new uploads (or recent ones at startup)"""
+        new = []
+        with self._scan_lock:
+            for meta_file in DATASETS_DIR.glob("*.json"):
+                if meta_file.stem in self._known:
+                    continue
+                meta = _read_meta(meta_file)
+                if meta is None or _kind(meta) is None:
+                    continue
+                self._known[meta["id"]] = meta
+                new.append(meta)
+                if _kind(meta) == "json":
+                    # every loadings upload goes into the program search index
+                    self._index_queue.put(meta["id"])
+
+        if startup:
+            recent = _recent_datasets()
+            new.sort(key=lambda m: (recent.get(m["id"], 0), _upload_time(m)), reverse=True)
+            new = new[:PRELOAD_AT_STARTUP]
+        else:
+            new.sort(key=_upload_time, reverse=True)
+
+        for meta in new:
+            self._enqueue(meta["id"])
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self._scan()
+            except Exception as e:
+                logger.warning(f"Preload scan failed: {e}")
+
+    def _work(self) -> None:
+        while True:
+            dataset_id, force = self._queue.get()
+            meta = self._known.get(dataset_id)
+            try:
+                if meta is None or self._is_cached(dataset_id):
+                    self._set_status(dataset_id, "loaded")
+                    continue
+
+                if _kind(meta) == "h5ad":
+                    # columnar obs copy first: most tools only need it
+                    self._set_status(dataset_id, "ingesting")
+                    _ingest_h5ad(dataset_id)
+
+                needed = _estimated_mb(meta)
+                if not force and self.cached_mb() + needed > self.budget_mb:
+                    self._set_status(dataset_id, "skipped", reason="memory budget exceeded", estimated_mb=round(needed, 1))
+                    continue
+
+                self._set_status(dataset_id, "loading")
+                start = time.perf_counter()
+                loaded = _load_expression(dataset_id) if _kind(meta) == "h5ad" else _compile_json(dataset_id)
+                if loaded is None:
+                    self._set_status(dataset_id, "failed", reason="file not found")
+                else:
+                    self._set_status(
+                        dataset_id, "loaded",
+                        seconds=round(time.perf_counter() - start, 2),
+                        estimated_mb=round(_store_mb(dataset_id) if _kind(meta) == "h5ad" else needed, 1),
+                    )
+            except Exception as e:
+                logger.warning(f"Preloading {dataset_id} failed: {e}")
+                self._set_status(dataset_id, "failed", reason=str(e))
+            finally:
+                self._queue.task_done()
+
+    def _index_work(self) -> None:
+        while True:
+            dataset_id = self._index_queue.get()
+            try:
+                program_index.add(dataset_id)
+                _load_vocab(dataset_id)
+            except Exception as e:
+                logger.warning(f"Indexing programs of {dataset_id} failed: {e}")
+            finally:
+                self._index_queue.task_done()
+
+
+preloader = DatasetPreloader()
+
+
+def register_preload_tools(mcp):
+    """Register dataset warming tools"""
+
+    @mcp.tool()
+    def warm_dataset(dataset_id: str, force: bool = False) -> dict:
+        """
+        Ask the server to load a dataset into memory in the background,
+        so later tool calls on it don't wait on a cold load.
+        Returns immediately with the preload state (queued / loading / loaded / skipped).
+
+        Args:
+            dataset_id: Dataset ID (H5AD or JSON)
+            force: Load even if it exceeds the preload memory budget (default: False)
+        """
+        preloader.start()
+        return preloader.request(dataset_id, force=force)
+
+    @mcp.tool()
+    def preload_status() -> dict:
+        """Show which datasets are preloaded, queued or skipped, and the memory budget"""
+        return preloader.snapshot()
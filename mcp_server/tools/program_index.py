@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+from .columnar import source_stamp
+from .data import DATA_DIR, _ensure_compiled, _json_path
+from .loadings import CompiledLoadings, compiled_dir
+from .lazy import lazy_import
+from .stats import _parse_program_number
+
+sparse = lazy_import("scipy.sparse")
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = DATA_DIR / "index"
+FORMAT_VERSION = 1
+# Random-projection dimensions used by approximate search
+SKETCH_DIM = int(os.getenv("MCP_INDEX_SKETCH_DIM", "128"))
+# Approximate search reranks this many candidates per requested hit exactly
+CANDIDATES_PER_HIT = 10
+SEED = 0
+
+
+class ProgramIndex:
+    """
+    Persistent index of every loadings JSON's programs as unit-norm vectors over
+    one shared, append-only gene vocabulary (upper-cased symbols).
+
+    Each dataset is a segment on disk (data/index/segments/<id>.npz: CSR rows
+    plus random-projection sketches), so adding an upload writes one file and
+    never rewrites the others. Searches run on the in-memory concatenation:
+    exact search is one sparse matrix-vector product; approximate search ranks
+    the dense sketches (Gaussian projections preserve cosines approximately)
+    and reranks the best candidates exactly.
+    """
+
+    def __init__(self, path: Path = INDEX_DIR, sketch_dim: int = SKETCH_DIM):
+        self.path = path
+        self.sketch_dim = sketch_dim
+        self._lock = threading.RLock()
+        self._loaded = False
+        self.genes: list[str] = []
+        self.gene_ids: dict[str, int] = {}
+        self.projection = np.empty((0, sketch_dim), dtype=np.float32)
+        self.manifest: dict[str, dict] = {}
+        self.segments: dict[str, dict] = {}
+        self._merged: dict | None = None
+
+    # -- persistence -------------------------------------------------------
+
+    def _load(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            index_file = self.path / "index.json"
+            if index_file.exists():
+                try:
+                    with open(index_file) as f:
+                        manifest = json.load(f)
+                    if manifest.get("version") == FORMAT_VERSION and manifest.get("sketch_dim") == self.sketch_dim:
+                        self.genes = np.load(self.path / "genes.npy").tolist()
+                        self.projection = np.load(self.path / "projection.npy")
+                        self.manifest = manifest["datasets"]
+                        for dataset_id in list(self.manifest):
+                            if _json_path(dataset_id) is not None:
+                                self.segments[dataset_id] = self._read_segment(dataset_id)
+                        self._prune()
+                except (OSError, ValueError, KeyError, json.JSONDecodeError) as e:
+                    logger.warning(f"Program index unreadable, rebuilding: {e}")
+                    self.genes, self.manifest, self.segments = [], {}, {}
+                    self.projection = np.empty((0, self.sketch_dim), dtype=np.float32)
+            self.gene_ids = {g: i for i, g in enumerate(self.genes)}
+            self._loaded = True
+
+    def _segment_path(self, dataset_id: str) -> Path:
+        return self.path / "segments" / f"{dataset_id}.npz"
+
+    def _read_segment(self, dataset_id: str) -> dict:
+        with np.load(self._segment_path(dataset_id)) as seg:
+            return {k: seg[k] for k in seg.files}
+
+    def _write(self, dataset_id: str, segment: dict) -> None:
+        seg_path = self._segment_path(dataset_id)
+        seg_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = seg_path.with_name(f"{seg_path.stem}.tmp.npz")
+        np.savez(tmp, **segment)
+        tmp.replace(seg_path)
+
+        for name, arr in (("genes.npy", np.asarray(self.genes, dtype=str)), ("projection.npy", self.projection)):
+            tmp = self.path / f"{name}.tmp.npy"
+            np.save(tmp, arr)
+            tmp.replace(self.path / name)
+
+        self._write_manifest()
+
+    def _write_manifest(self) -> None:
+        tmp = self.path / "index.json.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": FORMAT_VERSION, "sketch_dim": self.sketch_dim, "datasets": self.manifest}, f)
+        tmp.replace(self.path / "index.json")
+
+    def _prune(self) -> bool:
+        """Drop segments whose loadings upload was deleted; True if any were"""
+        gone = [d for d in self.manifest if _json_path(d) is None]
+        for dataset_id in gone:
+            del self.manifest[dataset_id]
+            self.segments.pop(dataset_id, None)
+            self._segment_path(dataset_id).unlink(missing_ok=True)
+        if gone:
+            self._merged = None
+            try:
+                self._write_manifest()
+            except OSError as e:
+                logger.warning(f"Could not update program index manifest: {e}")
+        return bool(gone)
+
+    # -- updates -----------------------------------------------------------
+
+    def _gene_positions(self, genes: np.ndarray) -> np.ndarray:
+        """Vocabulary ids of genes, appending unseen genes (and their projection rows)"""
+        new = [g for g in genes.tolist() if g not in self.gene_ids]
+        if new:
+            rng = np.random.default_rng([SEED, len(self.genes)])
+            rows = rng.standard_normal((len(new), self.sketch_dim)).astype(np.float32) / np.sqrt(self.sketch_dim)
+            self.projection = np.vstack([self.projection, rows])
+            for g in new:
+                self.gene_ids[g] = len(self.genes)
+                self.genes.append(g)
+        return np.fromiter((self.gene_ids[g] for g in genes.tolist()), dtype=np.int64, count=len(genes))
+
+    def is_current(self, dataset_id: str) -> bool:
+        self._load()
+        src = _json_path(dataset_id)
+        entry = self.manifest.get(dataset_id)
+        return src is not None and entry is not None and entry["stamp"] == source_stamp(src)
+
+    def add(self, dataset_id: str) -> bool:
+        """Index (or re-index) one loadings JSON; False if it is not a loadings upload"""
+        src = _json_path(dataset_id)
+        if src is None:
+            return False
+        with self._lock:
+            if self.is_current(dataset_id):
+                return True
+
+            _ensure_compiled(dataset_id, src)
+            loadings = CompiledLoadings(compiled_dir(src))
+            genes, unit = loadings.unit_rows()
+            cols = self._gene_positions(genes)
+
+            rows, nz = np.nonzero(unit)
+            matrix = sparse.csr_matrix(
+                (unit[rows, nz], (rows, cols[nz])), shape=(unit.shape[0], len(self.genes)), dtype=np.float32
+            )
+            sketch = unit @ self.projection[cols]
+            segment = {
+                "data": matrix.data.astype(np.float32),
+                "indices": matrix.indices.astype(np.int32),
+                "indptr": matrix.indptr.astype(np.int64),
+                "sketch": sketch / np.maximum(np.linalg.norm(sketch, axis=1, keepdims=True), 1e-12),
+                "programs": np.asarray(loadings.programs, dtype=str),
+            }
+            self.manifest[dataset_id] = {"stamp": source_stamp(src), "n_programs": len(loadings.programs)}
+            self.segments[dataset_id] = segment
+            self._merged = None
+            self._write(dataset_id, segment)
+            return True
+
+    # -- queries -----------------------------------------------------------
+
+    def merged(self) -> dict:
+        """All segments stacked: CSR matrix (rows x vocab), sketches and row labels"""
+        self._load()
+        with self._lock:
+            self._prune()
+            if self._merged is None:
+                n_vocab = len(self.genes)
+                ids = list(self.segments)
+                blocks = [
+                    sparse.csr_matrix((s["data"], s["indices"], s["indptr"]), shape=(len(s["programs"]), n_vocab))
+                    for s in (self.segments[i] for i in ids)
+                ]
+                self._merged = {
+                    "projection": self.projection,
+                    "matrix": sparse.vstack(blocks, format="csr") if blocks else sparse.csr_matrix((0, n_vocab)),
+                    "sketch": np.vstack([self.segments[i]["sketch"] for i in ids]) if ids else np.empty((0, self.sketch_dim)),
+                    "dataset": np.repeat(np.asarray(ids, dtype=str), [len(self.segments[i]["programs"]) for i in ids]),
+                    "program": np.concatenate([self.segments[i]["programs"] for i in ids]) if ids else np.empty(0, dtype=str),
+                    "offset": dict(zip(ids, np.cumsum([0] + [len(self.segments[i]["programs"]) for i in ids]).tolist())),
+                }
+            return self._merged
+
+    def vector(self, weights: dict[str, float]) -> tuple[np.ndarray, list[str]]:
+        """Unit query vector over the vocabulary (and the genes not in the vocabulary)"""
+        n_vocab = self.merged()["matrix"].shape[1]
+        q = np.zeros(n_vocab, dtype=np.float32)
+        missing = []
+        for gene, w in weights.items():
+            g = self.gene_ids.get(str(gene).upper())
+            if g is None or g >= n_vocab:
+                missing.append(gene)
+            else:
+                q[g] += w
+        norm = np.linalg.norm(q)
+        return (q / norm if norm > 0 else q), missing
+
+    def row(self, dataset_id: str, program: str) -> int | None:
+        merged = self.merged()
+        seg = self.segments.get(dataset_id)
+        if seg is None:
+            return None
+        hits = np.flatnonzero(seg["programs"] == program)
+        return merged["offset"][dataset_id] + int(hits[0]) if hits.size else None
+
+    def search(self, q: np.ndarray, k: int, approximate: bool = False, exclude: np.ndarray | None = None):
+        """(row ids, cosines) of the k most similar programs, best first"""
+        merged = self.merged()
+        matrix = merged["matrix"]
+        if approximate and matrix.shape[0] > k * CANDIDATES_PER_HIT:
+            sketch_q = q @ merged["projection"][:len(q)]
+            approx = merged["sketch"] @ sketch_q
+            if exclude is not None:
+                approx[exclude] = -np.inf
+            n_cand = k * CANDIDATES_PER_HIT
+            candidates = np.argpartition(-approx, n_cand - 1)[:n_cand]
+            scores = np.full(matrix.shape[0], -np.inf)
+            scores[candidates] = matrix[candidates] @ q
+        else:
+            scores = (matrix @ q).astype(np.float64)
+        if exclude is not None:
+            scores[exclude] = -np.inf
+
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return top, scores[top]
+
+
+program_index = ProgramIndex()
+
+
+def register_index_tools(mcp):
+
+    @mcp.tool()
+    def search_programs(
+        json_id: Optional[str] = None,
+        program: Optional[str] = None,
+        genes: Optional[Union[list[str], dict[str, float]]] = None,
+        top_k: int = 10,
+        approximate: bool = False,
+        exclude_same_dataset: bool = False,
+    ) -> dict:
+        """
+        Find the most similar programs across ALL uploaded loadings JSON datasets
+        (cosine of loading vectors), from a persistent index; no dataset files are read.
+        Query with an indexed program (json_id + program) or a gene list / {gene: weight} signature.
+
+        Args:
+            json_id: Loadings JSON dataset of the query program
+            program: Query program ('5' or 'new_program_5_activity_scaled')
+            genes: Query signature instead of a program: gene symbols or {gene: weight}
+            top_k: Number of programs to return
+            approximate: Rank by random-projection sketches, then rerank the best candidates exactly
+            exclude_same_dataset: Skip programs from json_id itself
+        """
+        if genes:
+            weights = genes if isinstance(genes, dict) else {g: 1.0 for g in genes}
+            q, not_found = program_index.vector(weights)
+            if not q.any():
+                return {"error": "None of the genes are in the program index", "not_found": not_found}
+            exclude_rows = None
+            query = {"genes": len(weights) - len(not_found), "not_found": not_found}
+        elif json_id and program is not None:
+            if not program_index.is_current(json_id) and not program_index.add(json_id):
+                return {"error": f"Dataset {json_id} not found"}
+            prog_num = _parse_program_number(program)
+            r = program_index.row(json_id, prog_num)
+            if r is None:
+                return {"error": f"Program {prog_num} not found"}
+            merged = program_index.merged()
+            q = merged["matrix"][r].toarray().ravel()
+            exclude_rows = np.flatnonzero(merged["dataset"] == json_id) if exclude_same_dataset else np.array([r])
+            query = {"json_id": json_id, "program": prog_num}
+        else:
+            return {"error": "Pass json_id and program, or genes"}
+
+        merged = program_index.merged()
+        rows, scores = program_index.search(q, top_k, approximate, exclude_rows)
+        return {
+            "query": query,
+            "n_indexed_programs": int(merged["matrix"].shape[0]),
+            "n_indexed_datasets": len(program_index.segments),
+            "approximate": approximate,
+            "results": [
+                {
+                    "json_id": str(merged["dataset"][r]),
+                    "program": str(merged["program"][r]),
+                    "cosine": float(s),
+                }
+                for r, s in zip(rows, scores)
+            ],
+        }
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Literal, Optional
+
+import numpy as np
+from .data import _load_once, _obs_columns
+from .grouping import GroupIndex, _load_cube
+from .lazy import lazy_import
+from .stats import _parse_program_number
+
+scipy_stats = lazy_import("scipy.stats")
+multitest = lazy_import("statsmodels.stats.multitest")
+
+_pseudobulk_cache: dict[tuple[str, str, str], "Pseudobulk"] = {}
+
+
+class Pseudobulk:
+    """Mean program activity per (sample, group), for every program (NaN cells ignored)"""
+
+    def __init__(self, grouping: GroupIndex, program_cols: list[str], means: np.ndarray):
+        self.grouping = grouping
+        self.program_cols = program_cols
+        self.means = means  # levels x programs
+
+    def replicates(self, group: str, min_cells: int) -> tuple[list[str], np.ndarray]:
+        """Samples with >= min_cells cells in group, and their mean activities"""
+        rows = [
+            i for i, (sample, g) in enumerate(self.grouping.levels)
+            if g == group and self.grouping.counts[i] >= min_cells
+        ]
+        samples = [self.grouping.levels[i][0] for i in rows]
+        return samples, self.means[rows]
+
+
+def _load_pseudobulk(h5ad_id: str, sample_col: str, group_col: str) -> Pseudobulk | None:
+    """Cached pseudobulk aggregates per (dataset, sample column, group column)"""
+
+    def load():
+        # the group-by cube's means are NaN-aware: one NaN cell does not void a replicate
+        cube = _load_cube(h5ad_id, [sample_col, group_col])
+        if cube is None:
+            return None
+        return Pseudobulk(cube.grouping, cube.program_cols, cube.mean)
+
+    return _load_once(_pseudobulk_cache, (h5ad_id, sample_col, group_col), "pseudobulk", load)
+
+
+def register_pseudobulk_tools(mcp):
+
+    @mcp.tool()
+    def program_pseudobulk_enrichment(
+        h5ad_id: str,
+        group_col: str,
+        group_a: str,
+        group_b: str,
+        sample_col: str = "donor",
+        program_info: Optional[Dict[str, Dict[str, Any]]] = None,
+        test: Literal["ttest", "mannwhitney"] = "ttest",
+        paired: bool = False,
+        alternative: Literal["two-sided", "greater", "less"] = "greater",
+        alpha: float = 0.05,
+        fdr_method: Literal["fdr_bh"] = "fdr_bh",
+        top_k_programs: int = 30,
+        min_cells_per_sample: int = 10,
+    ) -> dict:
+        """
+        Donor-level enrichment: average each program per (sample, group), then compare
+        group_a vs group_b treating samples (not cells) as replicates.
+        Prefer this over program_pairwise_enrichment when a donor/sample column exists,
+        since cells from one donor are not independent.
+
+        Args:
+            h5ad_id: Dataset ID of the H5AD file
+            group_col: Column with the groups to compare (e.g., 'disease_status')
+            group_a: First group (e.g., 'Active')
+            group_b: Second group (e.g., 'Ctrl')
+            sample_col: Column identifying donors/samples (e.g., 'donor', 'sample_id')
+            test: 'ttest' (Welch) or 'mannwhitney'; with paired=True, paired t-test or Wilcoxon signed-rank
+            paired: Pair samples present in both groups (e.g., two cell types within each donor)
+            min_cells_per_sample: Pseudobulk replicates with fewer cells are dropped
+        """
+        obs_cols = _obs_columns(h5ad_id)
+        if obs_cols is None:
+            return {"error": f"Dataset {h5ad_id} not found"}
+        for col in (group_col, sample_col):
+            if col not in obs_cols:
+                return {"error": f"Column {col} not found"}
+        if str(group_a) == str(group_b):
+            return {"error": "group_a and group_b must be different groups"}
+
+        pb = _load_pseudobulk(h5ad_id, sample_col, group_col)
+        if pb is None:
+            return {"error": "No program columns found (expected obs columns starting with 'new_program_')"}
+
+        samples_a, x_a = pb.replicates(str(group_a), min_cells_per_sample)
+        samples_b, x_b = pb.replicates(str(group_b), min_cells_per_sample)
+
+        if paired:
+            shared = sorted(set(samples_a) & set(samples_b))
+            x_a = x_a[[samples_a.index(s) for s in shared]]
+            x_b = x_b[[samples_b.index(s) for s in shared]]
+            samples_a = samples_b = shared
+
+        if len(samples_a) < 2 or len(samples_b) < 2:
+            return {
+                "error": f"Need at least 2 samples per group with >= {min_cells_per_sample} cells each.",
+                "n_samples_a": len(samples_a),
+                "n_samples_b": len(samples_b),
+            }
+
+        # every program is tested at once (axis=0 runs over replicates)
+        if paired and test == "ttest":
+            stat, pvals = scipy_stats.ttest_rel(x_a, x_b, axis=0, alternative=alternative)
+        elif paired:
+            stat, pvals = scipy_stats.wilcoxon(x_a - x_b, axis=0, alternative=alternative)
+        elif test == "ttest":
+            stat, pvals = scipy_stats.ttest_ind(x_a, x_b, axis=0, equal_var=False, alternative=alternative)
+        else:
+            stat, pvals = scipy_stats.mannwhitneyu(x_a, x_b, axis=0, alternative=alternative)
+
+        pvals = np.nan_to_num(np.asarray(pvals, dtype=float), nan=1.0)
+        _, qvals, _, _ = multitest.multipletests(pvals, method=fdr_method)
+        mean_a, mean_b = np.nanmean(x_a, axis=0), np.nanmean(x_b, axis=0)
+
+        rows = []
+        for i, pcol in enumerate(pb.program_cols):
+            prog_num = _parse_program_number(pcol)
+            info = (program_info or {}).get(prog_num, {})
+            diff = float(mean_a[i] - mean_b[i])
+            higher = str(group_a) if diff > 0 else str(group_b)
+            significant = bool(qvals[i] < alpha)
+            rows.append({
+                "program_number": prog_num,
+                "program_column": pcol,
+                "name": str(info.get("name", "")),
+                "description": str(info.get("description", "")),
+                "statistic": float(stat[i]),
+                "p_value": float(pvals[i]),
+                "q_value": float(qvals[i]),
+                "significant": significant,
+                "mean_a": float(mean_a[i]),
+                "mean_b": float(mean_b[i]),
+                "mean_diff": diff,
+                "higher_group": higher,
+                "higher_group_label": f'{higher}{"★" if significant else ""}',
+            })
+
+        rows.sort(key=lambda r: (r["q_value"], r["p_value"]))
+
+        return {
+            "group_col": group_col,
+            "group_a": group_a,
+            "group_b": group_b,
+            "sample_col": sample_col,
+            "test": test,
+            "paired": paired,
+            "alternative": alternative,
+            "n_samples_a": len(samples_a),
+            "n_samples_b": len(samples_b),
+            "alpha": alpha,
+            "fdr_method": fdr_method,
+            "results": rows[:top_k_programs],
+        }
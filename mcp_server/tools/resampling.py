@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import os
+from typing import Callable
+
+import numpy as np
+from .lazy import lazy_import
+from .parallel import REST
+
+special = lazy_import("scipy.special")
+
+# Largest permutation batch, in cells x permutations (float32 elements)
+BATCH_ELEMENTS = int(os.getenv("MCP_PERMUTATION_BATCH", str(1 << 24)))
+# A test stops early once this many permuted statistics reach the observed one
+EARLY_STOP_HITS = 20
+CI_LEVEL = 0.95
+# Random streams are seeded per comparison, so results do not depend on how
+# programs are split across pool workers
+SEED = 0
+
+
+def _exceed(perm: np.ndarray, observed: np.ndarray, alternative: str) -> np.ndarray:
+    """Per column count of permuted statistics at least as extreme as the observed one"""
+    if alternative == "greater":
+        return (perm >= observed).sum(axis=0)
+    if alternative == "less":
+        return (perm <= observed).sum(axis=0)
+    return (np.abs(perm) >= np.abs(observed)).sum(axis=0)
+
+
+def permutation_pvalues(
+    x: np.ndarray,
+    in_a: np.ndarray,
+    n_permutations: int,
+    alternative: str,
+    rng: np.random.Generator,
+    on_batch: Callable[[int], None] | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Permutation test on the difference in means (a - b) for every column of x.
+
+    Relabelling is done in batches: each batch draws one random subset of the
+    smaller group's size per permutation (the k smallest of random keys), and a
+    single (batch x cells) @ (cells x columns) product gives the group sums for
+    every column at once. A column stops once EARLY_STOP_HITS permuted
+    statistics reach the observed one, with the Besag-Clifford p-value
+    hits / permutations; otherwise p = (hits + 1) / (permutations + 1).
+
+    Returns (observed mean difference, p-value, permutations used) per column.
+    """
+    m, n_cols = x.shape
+    n_a = int(in_a.sum())
+    n_b = m - n_a
+    x = x - x.mean(axis=0)  # centred, so float32 sums stay accurate
+    total = x.sum(axis=0)
+
+    # draw the smaller side; the other side's sum is total - drawn
+    k, drawn_is_a = (n_a, True) if n_a <= n_b else (n_b, False)
+
+    def mean_diff(drawn_sums, tot):
+        sum_a = drawn_sums if drawn_is_a else tot - drawn_sums
+        return sum_a / n_a - (tot - sum_a) / n_b
+
+    labels = in_a if drawn_is_a else ~in_a
+    observed = mean_diff(labels.astype(np.float32) @ x, total)
+
+    hits = np.zeros(n_cols, dtype=np.int64)
+    used = np.zeros(n_cols, dtype=np.int64)
+    active = np.arange(n_cols)
+    batch = max(1, min(n_permutations, BATCH_ELEMENTS // max(m, 1)))
+
+    done = 0
+    while active.size and done < n_permutations:
+        size = min(batch, n_permutations - done)
+        keys = rng.random((size, m), dtype=np.float32)
+        # exactly k cells per permutation (float32 keys can tie at the k-th value)
+        drawn = np.zeros((size, m), dtype=np.float32)
+        np.put_along_axis(drawn, np.argpartition(keys, k - 1, axis=1)[:, :k], 1.0, axis=1)
+
+        perm = mean_diff(drawn @ x[:, active], total[active])
+
+        hits[active] += _exceed(perm, observed[active], alternative)
+        used[active] += size
+        done += size
+        active = active[hits[active] < EARLY_STOP_HITS]
+        if on_batch is not None:
+            on_batch(size)
+
+    stopped = (hits >= EARLY_STOP_HITS) & (used < n_permutations)
+    pvals = np.where(stopped, hits / np.maximum(used, 1), (hits + 1) / (used + 1))
+    return observed.astype(float), np.minimum(pvals, 1.0), used
+
+
+def bootstrap_medians(x: np.ndarray, n_bootstrap: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Bootstrap distribution of each column's median (n_bootstrap x columns), NaNs ignored.
+
+    The median of a bootstrap resample of n sorted values is the order statistic
+    at floor(n * U) for U the matching order statistic of n uniforms, so it is
+    drawn from Beta distributions instead of materialising any resample. The
+    same uniforms are used for every column (inverse CDF), which keeps each
+    column's draws independent of which other columns are in x.
+    """
+    xs = np.sort(x, axis=0)  # NaNs sort last
+    n = (~np.isnan(x)).sum(axis=0)
+    nn = np.maximum(n, 1)
+    k = (nn + 1) // 2  # lower median order (1-based)
+    v_low, v_high = rng.random((2, n_bootstrap, 1))
+
+    # U_(k) ~ Beta(k, n + 1 - k); U_(k+1) = U_(k) + (1 - U_(k)) * Beta(1, n - k)
+    u_low = special.betaincinv(k, nn + 1 - k, v_low)
+    u_high = u_low + (1 - u_low) * (1 - (1 - v_high) ** (1 / np.maximum(nn - k, 1)))
+    low = np.minimum((u_low * nn).astype(np.int64), nn - 1)
+    high = np.where(nn % 2 == 1, low, np.minimum((u_high * nn).astype(np.int64), nn - 1))
+
+    cols = np.arange(x.shape[1])
+    medians = 0.5 * (xs[low, cols] + xs[high, cols])
+    medians[:, n == 0] = np.nan
+    return medians
+
+
+def permutation_columns(
+    columns: list[np.ndarray],
+    codes: np.ndarray,
+    comparisons: list[tuple[int, int]],
+    alternative: str,
+    min_cells: int,
+    n_permutations: int,
+    n_bootstrap: int,
+    progress: Callable[[int, int], None] | None = None,
+) -> list[list[tuple]]:
+    """
+    Permutation tests and bootstrap median-difference CIs for every column x comparison.
+    Returns, per column, one (mean_diff, p_value, median_diff, n_in, n_out, ci_low,
+    ci_high, n_permutations_used) per comparison (see parallel.mannwhitney_columns).
+    NaN activities are imputed with the column mean for the permutation statistic.
+    """
+    x_all = np.column_stack([np.asarray(c, dtype=np.float32) for c in columns])
+    results = [[None] * len(comparisons) for _ in columns]
+
+    total_work = len(comparisons) * n_permutations
+    work_done = 0
+
+    def on_batch(size):
+        nonlocal work_done
+        work_done += size
+        if progress is not None:
+            progress(work_done, total_work)
+
+    for c_idx, (a, b) in enumerate(comparisons):
+        mask_a = codes == a
+        mask_b = ~mask_a if b == REST else codes == b
+        n_a, n_b = int(mask_a.sum()), int(mask_b.sum())
+
+        if n_a < min_cells or n_b < min_cells:
+            for r in results:
+                r[c_idx] = (0.0, 1.0, float("nan"), n_a, n_b, float("nan"), float("nan"), 0)
+            work_done += n_permutations
+            continue
+
+        xa, xb = x_all[mask_a], x_all[mask_b]
+        med_diff = np.nanmedian(xa, axis=0) - np.nanmedian(xb, axis=0)
+        rng = np.random.default_rng([SEED, c_idx])
+        boot = bootstrap_medians(xa, n_bootstrap, rng) - bootstrap_medians(xb, n_bootstrap, rng)
+        ci_low, ci_high = np.nanquantile(boot, [(1 - CI_LEVEL) / 2, (1 + CI_LEVEL) / 2], axis=0)
+
+        x = np.concatenate([xa, xb])
+        x = np.where(np.isnan(x), np.nanmean(x, axis=0), x).astype(np.float32)
+        in_a = np.arange(len(x)) < n_a
+        observed, pvals, used = permutation_pvalues(x, in_a, n_permutations, alternative, rng, on_batch)
+        work_done = (c_idx + 1) * n_permutations
+
+        for i, r in enumerate(results):
+            r[c_idx] = (
+                float(observed[i]), float(pvals[i]), float(med_diff[i]), n_a, n_b,
+                float(ci_low[i]), float(ci_high[i]), int(used[i]),
+            )
+    return results
+
+
+def permutation_paths(paths: list[str], *args) -> list:
+    """Worker entry point: memory-map the column files and test them"""
+    return permutation_columns([np.load(p, mmap_mode="r") for p in paths], *args)
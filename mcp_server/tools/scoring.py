@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+from .data import _load_expression, _load_loadings, _obs_columns, _set_virtual_column
+from .expression import ExpressionStore
+from .stats import _parse_program_number
+from .vocab import _find_gene, _suggestions
+
+# Expression bins and control genes per bin for background correction (as in Seurat / scanpy score_genes)
+N_BINS = 25
+CONTROL_SIZE = 50
+SEED = 0
+
+
+def control_weights(expr: ExpressionStore, genes: np.ndarray, weights: np.ndarray,
+                    n_bins: int = N_BINS, control_size: int = CONTROL_SIZE) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Background genes and their weights: genes are binned by mean expression and,
+    for each bin holding set genes, control_size other genes are drawn from the
+    same bin and share those set genes' total weight. Subtracting X @ control
+    weights removes the part of the score explained by expression level alone.
+    """
+    means = expr.gene_means()
+    ranks = np.argsort(np.argsort(means, kind="stable"), kind="stable")
+    bins = ranks * n_bins // max(len(means), 1)
+
+    rng = np.random.default_rng(SEED)
+    in_set = np.zeros(len(means), dtype=bool)
+    in_set[genes] = True
+    ctrl_genes, ctrl_weights = [], []
+    for b in np.unique(bins[genes]):
+        pool = np.flatnonzero((bins == b) & ~in_set)
+        if pool.size == 0:
+            continue
+        picked = rng.choice(pool, size=min(control_size, pool.size), replace=False)
+        ctrl_genes.append(picked)
+        ctrl_weights.append(np.full(picked.size, weights[bins[genes] == b].sum() / picked.size))
+
+    if not ctrl_genes:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    return np.concatenate(ctrl_genes), np.concatenate(ctrl_weights)
+
+
+def register_scoring_tools(mcp):
+
+    @mcp.tool()
+    def score_gene_set(
+        h5ad_id: str,
+        genes: Optional[list[str]] = None,
+        json_id: Optional[str] = None,
+        program: Optional[str] = None,
+        top_n_genes: int = 100,
+        name: Optional[str] = None,
+        control: bool = False,
+    ) -> dict:
+        """
+        Score every cell for a gene signature from adata.X and add the result as a new
+        obs column ('score_<name>') that boxplot, correlation_matrix and the enrichment
+        tools (programs=[...]) accept like any program column.
+        Either pass genes (score = mean expression of the set) or json_id + program
+        (score = loading-weighted expression of the program's top genes).
+
+        Args:
+            h5ad_id: Dataset ID of the H5AD file
+            genes: Gene symbols of the signature (matched case-insensitively)
+            json_id: Loadings JSON to take a program's genes and weights from
+            program: Program in json_id ('5' or 'new_program_5_activity_scaled')
+            top_n_genes: Genes used from the program (by |loading|)
+            name: Score name (default 'gene_set' or 'program_<n>')
+            control: Subtract the score of expression-matched background genes
+        """
+        if _obs_columns(h5ad_id) is None:
+            return {"error": f"Dataset {h5ad_id} not found"}
+        if not genes and not (json_id and program is not None):
+            return {"error": "Pass genes, or json_id and program"}
+
+        if genes:
+            symbols = [str(g) for g in genes]
+            loadings = np.ones(len(symbols))
+            name = name or "gene_set"
+        else:
+            compiled = _load_loadings(json_id)
+            if compiled is None:
+                return {"error": f"Dataset {json_id} not found"}
+            prog_num = _parse_program_number(program)
+            if prog_num not in compiled.program_index:
+                return {"error": f"Program {prog_num} not found"}
+            top = compiled.top_genes(prog_num, top_n_genes)
+            symbols = [g for g, _ in top]
+            loadings = np.array([v for _, v in top], dtype=np.float64)
+            name = name or f"program_{prog_num}"
+
+        expr = _load_expression(h5ad_id)
+        if expr is None:
+            return {"error": f"Dataset {h5ad_id} has no expression matrix"}
+
+        positions, found, not_found, resolved = {}, [], [], {}
+        for symbol, loading in zip(symbols, loadings):
+            j, was_resolved = _find_gene(expr, h5ad_id, symbol)
+            if j is None:
+                not_found.append(symbol)
+            elif j not in positions:
+                positions[j] = loading
+                found.append(expr.var_names[j])
+                if was_resolved:
+                    resolved[symbol] = expr.var_names[j]
+        if not positions:
+            return {
+                "error": f"None of the genes were found in {h5ad_id}",
+                "not_found": not_found,
+                "suggestions": _suggestions(h5ad_id, not_found),
+            }
+
+        gene_idx = np.fromiter(positions, dtype=np.int64)
+        weights = np.fromiter(positions.values(), dtype=np.float64)
+        weights /= np.abs(weights).sum()
+
+        if control:
+            ctrl_idx, ctrl_w = control_weights(expr, gene_idx, weights)
+            gene_idx = np.concatenate([gene_idx, ctrl_idx])
+            weights = np.concatenate([weights, -ctrl_w])
+
+        scores = expr.matvec(gene_idx, weights).astype(np.float32)
+        column = f"score_{name}"
+        _set_virtual_column(h5ad_id, column, scores)
+
+        return {
+            "column": column,
+            "n_genes": len(found),
+            "genes": found,
+            "not_found": not_found,
+            **({"resolved_from": resolved} if resolved else {}),
+            **({"suggestions": _suggestions(h5ad_id, not_found)} if not_found else {}),
+            "control": control,
+            "summary": {
+                "mean": float(scores.mean()),
+                "std": float(scores.std()),
+                "min": float(scores.min()),
+                "median": float(np.median(scores)),
+                "max": float(scores.max()),
+            },
+        }
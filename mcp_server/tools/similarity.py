@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+from .data import _load_loadings
+from .loadings import CompiledLoadings
+from .lazy import lazy_import
+
+optimize = lazy_import("scipy.optimize")
+
+
+def aligned_unit_rows(a: CompiledLoadings, b: CompiledLoadings) -> tuple[np.ndarray, np.ndarray, int]:
+    """
+    Unit-norm loadings of both datasets over one shared (upper-cased) gene
+    vocabulary, plus the number of genes the two have in common.
+    """
+    genes_a, unit_a = a.unit_rows()
+    genes_b, unit_b = b.unit_rows()
+    vocab = np.union1d(genes_a, genes_b)
+    aligned = []
+    for genes, unit in ((genes_a, unit_a), (genes_b, unit_b)):
+        full = np.zeros((unit.shape[0], len(vocab)), dtype=np.float32)
+        full[:, np.searchsorted(vocab, genes)] = unit
+        aligned.append(full)
+    n_shared = len(genes_a) + len(genes_b) - len(vocab)
+    return aligned[0], aligned[1], n_shared
+
+
+def register_similarity_tools(mcp):
+
+    @mcp.tool()
+    def program_similarity(
+        json_id_a: str,
+        json_id_b: Optional[str] = None,
+        top_k: int = 3,
+        one_to_one: bool = False,
+        min_similarity: float = 0.0,
+    ) -> dict:
+        """
+        Cosine similarity of program loading vectors, within one loadings JSON or
+        across two (e.g. to map programs between cohorts). Unlike jaccard_topk this
+        weighs genes by their loadings. Genes are matched case-insensitively.
+
+        Args:
+            json_id_a: Loadings JSON dataset ID
+            json_id_b: Second loadings JSON (default json_id_a: similar programs within one dataset)
+            top_k: Best matches reported per program of json_id_a
+            one_to_one: Also return the optimal one-to-one matching (maximum total similarity)
+            min_similarity: Drop matches below this cosine
+        """
+        same = json_id_b is None or json_id_b == json_id_a
+        a = _load_loadings(json_id_a)
+        if a is None:
+            return {"error": f"Dataset {json_id_a} not found"}
+        b = a if same else _load_loadings(json_id_b)
+        if b is None:
+            return {"error": f"Dataset {json_id_b} not found"}
+
+        unit_a, unit_b, n_shared = aligned_unit_rows(a, b)
+        sim = unit_a @ unit_b.T
+        if same:
+            np.fill_diagonal(sim, -np.inf)
+
+        k = min(top_k, sim.shape[1] - (1 if same else 0))
+        best = np.argmax(sim, axis=1)
+        reverse_best = np.argmax(sim, axis=0)
+        matches = []
+        for p, program in enumerate(a.programs):
+            row = sim[p]
+            idx = np.argpartition(-row, k - 1)[:k] if k > 0 else np.empty(0, dtype=np.int64)
+            idx = idx[np.argsort(-row[idx], kind="stable")]
+            matches.append({
+                "program": program,
+                "matches": [
+                    {"program": b.programs[q], "cosine": float(row[q])}
+                    for q in idx if row[q] >= min_similarity
+                ],
+                "reciprocal_best": bool(k > 0 and reverse_best[best[p]] == p),
+            })
+
+        result = {
+            "json_id_a": json_id_a,
+            "json_id_b": json_id_a if same else json_id_b,
+            "n_programs_a": len(a.programs),
+            "n_programs_b": len(b.programs),
+            "n_shared_genes": n_shared,
+            "matches": matches,
+        }
+
+        if one_to_one:
+            rows, cols = optimize.linear_sum_assignment(np.where(np.isfinite(sim), -sim, 2.0))
+            result["assignment"] = [
+                {"program_a": a.programs[p], "program_b": b.programs[q], "cosine": float(sim[p, q])}
+                for p, q in zip(rows, cols)
+                if (not same or p != q) and sim[p, q] >= min_similarity
+            ]
+        return result
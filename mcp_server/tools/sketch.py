@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import numpy as np
+from .columnar import source_stamp
+from .data import CACHE_DIR, _dataset_shape, _h5ad_path, _load_obs, _load_once, _obs_columns
+
+SKETCH_DIR = CACHE_DIR / "sketches"
+# Sketch sizes built by build_sketches when none are given
+DEFAULT_SIZES = (10_000, 50_000, 200_000)
+# Target size for approximate=True calls
+APPROX_CELLS = int(os.getenv("MCP_APPROX_CELLS", "50000"))
+# Rare groups keep at least this many cells (or all of them) so they stay testable
+MIN_PER_GROUP = 3
+DEFAULT_STRATIFY = "cell_type"
+
+_sketch_cache: dict[tuple[str, str, int], "Sketch"] = {}
+
+
+class Sketch:
+    """Sorted row positions of a stratified subsample of a dataset"""
+
+    def __init__(self, rows: np.ndarray, stratify_by: str, n_total: int):
+        self.rows = rows
+        self.stratify_by = stratify_by
+        self.n_total = n_total
+
+    def info(self) -> dict:
+        return {
+            "n_cells": int(len(self.rows)),
+            "of_cells": int(self.n_total),
+            "fraction": round(len(self.rows) / self.n_total, 4) if self.n_total else None,
+            "stratified_by": self.stratify_by or None,
+        }
+
+
+def stratified_rows(codes: np.ndarray, size: int, seed: int = 0) -> np.ndarray:
+    """
+    Sample `size` rows keeping each group's share of the cells (largest-remainder
+    rounding), with at least MIN_PER_GROUP rows per group. Returns sorted positions.
+    """
+    rng = np.random.default_rng(seed)
+    _, inverse, counts = np.unique(codes, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+
+    exact = counts * size / counts.sum()
+    quota = np.floor(exact).astype(np.int64)
+    remainder = size - quota.sum()
+    if remainder > 0:
+        quota[np.argsort(-(exact - quota), kind="stable")[:remainder]] += 1
+    quota = np.minimum(np.maximum(quota, MIN_PER_GROUP), counts)
+
+    # a random key per row, then the lowest-keyed `quota` rows of each group
+    keys = rng.random(len(codes))
+    order = np.lexsort((keys, inverse))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.arange(len(codes)) - np.repeat(starts, counts)
+    return np.sort(order[rank < np.repeat(quota, counts)])
+
+
+def _sketch_path(dataset_id: str, stratify_by: str, size: int) -> Path:
+    return SKETCH_DIR / dataset_id / f"{stratify_by or '_random'}_{size}.npz"
+
+
+def _load_sketch(dataset_id: str, stratify_by: str, size: int) -> Sketch | None:
+    """Cached sketch (memory, then data/cache/sketches if built from the current upload, then built from obs)"""
+    key = (dataset_id, stratify_by, size)
+
+    def load():
+        shape = _dataset_shape(dataset_id)
+        if shape is None:
+            return None
+        n_obs = shape[0]
+        src = _h5ad_path(dataset_id)
+        stamp = source_stamp(src) if src is not None else {}
+
+        # rows saved with the source file's stamp; a re-uploaded file invalidates them
+        path = _sketch_path(dataset_id, stratify_by, size)
+        try:
+            with np.load(path) as saved:
+                current = all(str(saved[k]) == str(v) for k, v in stamp.items())
+                rows = saved["rows"]
+            if current and len(rows) and rows[-1] < n_obs:
+                return Sketch(rows, stratify_by, n_obs)
+        except (OSError, ValueError, KeyError):
+            pass
+
+        if stratify_by:
+            codes = np.asarray(_load_obs(dataset_id, [stratify_by])[stratify_by].astype(str))
+        else:
+            codes = np.zeros(n_obs, dtype=np.int8)
+        rows = stratified_rows(codes, min(size, n_obs))
+
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp.npz")
+            np.savez(tmp, rows=rows, **{k: np.asarray(str(v)) for k, v in stamp.items()})
+            tmp.replace(path)
+        except OSError:
+            pass
+        return Sketch(rows, stratify_by, n_obs)
+
+    return _load_once(_sketch_cache, key, "sketch", load)
+
+
+def _approximate(dataset_id: str) -> Sketch | None:
+    """
+    Sketch used by approximate=True calls: the cached sketch closest to
+    APPROX_CELLS, or a new one stratified by cell_type (if present) at that size.
+    None when the dataset is small enough that exact runs are already fast.
+    """
+    shape = _dataset_shape(dataset_id)
+    if shape is None or shape[0] <= APPROX_CELLS:
+        return None
+
+    built = [k for k in _sketch_cache if k[0] == dataset_id]
+    if built:
+        _, stratify_by, size = min(built, key=lambda k: abs(k[2] - APPROX_CELLS))
+        return _sketch_cache[(dataset_id, stratify_by, size)]
+
+    obs_cols = _obs_columns(dataset_id) or []
+    stratify_by = DEFAULT_STRATIFY if DEFAULT_STRATIFY in obs_cols else ""
+    return _load_sketch(dataset_id, stratify_by, APPROX_CELLS)
+
+
+def _rows_for(dataset_id: str, approximate: bool) -> tuple[np.ndarray | None, dict | None]:
+    """(row positions, info for the result) for a tool call; (None, None) means all cells"""
+    if not approximate:
+        return None, None
+    sketch = _approximate(dataset_id)
+    if sketch is None:
+        shape = _dataset_shape(dataset_id)
+        n = shape[0] if shape else 0
+        return None, {"n_cells": n, "of_cells": n, "fraction": 1.0, "stratified_by": None}
+    return sketch.rows, sketch.info()
+
+
+def register_sketch_tools(mcp):
+
+    @mcp.tool()
+    def build_sketches(
+        h5ad_id: str,
+        stratify_by: str = DEFAULT_STRATIFY,
+        sizes: list[int] = list(DEFAULT_SIZES),
+    ) -> dict:
+        """
+        Build (and cache on disk) stratified subsamples of a dataset for fast exploration.
+        Each sketch keeps the proportions of stratify_by. Tools called with
+        approximate=True then run on the sketch closest to the default size.
+
+        Args:
+            h5ad_id: Dataset ID of the H5AD file
+            stratify_by: Obs column whose group proportions are preserved ('' for a plain random sample)
+            sizes: Sketch sizes in cells
+        """
+        obs_cols = _obs_columns(h5ad_id)
+        if obs_cols is None:
+            return {"error": f"Dataset {h5ad_id} not found"}
+        if stratify_by and stratify_by not in obs_cols:
+            return {"error": f"Column {stratify_by} not found"}
+
+        sketches = []
+        for size in sorted({int(s) for s in sizes if int(s) > 0}):
+            sketch = _load_sketch(h5ad_id, stratify_by, size)
+            sketches.append({"size": size, **sketch.info()})
+
+        return {"h5ad_id": h5ad_id, "sketches": sketches}
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+from typing import Literal, Optional
+
+import numpy as np
+from .data import _load_once, _obs_columns
+from .grouping import GroupCube, _load_cube
+from .stats import _parse_program_number, _resolve_programs
+
+# Groups with fewer cells are left out of the metrics (their means are noise)
+MIN_CELLS = 10
+# annotate_program's top_cell_types: groups with z above this, best first
+TOP_GROUP_Z = 1.0
+
+_specificity_cache: dict[tuple[str, str, int], "ProgramSpecificity"] = {}
+
+
+class ProgramSpecificity:
+    """
+    How concentrated each program's activity is across the groups of one
+    column, from the cached group x program mean matrix. Means are shifted so
+    each program's lowest group is 0 (activities are scaled and can be
+    negative); tau, entropy and Gini use the shifted means, z-scores the raw ones.
+
+    tau: 0 = even across groups, 1 = active in exactly one group
+    entropy: Shannon entropy (bits) of the shifted means as a distribution; low = specific
+    gini: 0 = even, towards 1 = concentrated
+    """
+
+    def __init__(self, cube: GroupCube, min_cells: int = MIN_CELLS):
+        keep = np.flatnonzero(cube.counts >= min_cells)
+        self.groups = [cube.grouping.levels[g][0] for g in keep]
+        self.counts = cube.counts[keep]
+        self.program_cols = cube.program_cols
+        means = cube.mean[keep]  # groups x programs
+        self.means = means
+        # groups with a finite mean, per program (a group can be all-NaN for a program)
+        n = np.count_nonzero(~np.isnan(means), axis=0)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            shifted = means - np.nanmin(means, axis=0)
+            peak = np.nanmax(shifted, axis=0)
+            self.tau = np.nansum(1 - shifted / peak, axis=0) / np.maximum(n - 1, 1)
+
+            share = shifted / np.nansum(shifted, axis=0)
+            self.entropy = -np.nansum(np.where(share > 0, share * np.log2(share), 0.0), axis=0)
+
+            # NaNs sort last, so each program's finite means take ranks 1..n
+            ranked = np.nan_to_num(np.sort(shifted, axis=0))
+            rank = np.arange(1, len(keep) + 1)[:, None]
+            weights = np.where(rank <= n, 2 * rank - n - 1, 0)
+            self.gini = (weights * ranked).sum(axis=0) / (n * np.nansum(shifted, axis=0))
+
+            spread = np.full(means.shape[1], np.nan)
+            spread[n > 1] = np.nanstd(means[:, n > 1], axis=0, ddof=1)
+            self.z = (means - np.nanmean(means, axis=0)) / spread
+
+        # a program with identical means everywhere is not specific at all
+        flat = ~(peak > 0)
+        self.tau[flat] = 0.0
+        self.gini[flat] = 0.0
+        self.entropy[flat] = np.log2(np.maximum(n[flat], 1))
+
+    def top_groups(self, column: str, z_min: float = TOP_GROUP_Z, k: int = 3) -> list[str]:
+        """Groups where the program is most active: z > z_min, or at least the single best group"""
+        z = self.z[:, self.program_cols.index(column)]
+        order = [g for g in np.argsort(-np.nan_to_num(z, nan=-np.inf), kind="stable") if not np.isnan(z[g])]
+        top = [self.groups[g] for g in order if z[g] > z_min][:k]
+        return top or [self.groups[g] for g in order[:1]]
+
+
+def _load_specificity(dataset_id: str, group_col: str, min_cells: int = MIN_CELLS) -> ProgramSpecificity | None:
+    """Cached specificity metrics per (dataset, group column, min_cells)"""
+
+    def load():
+        cube = _load_cube(dataset_id, [group_col])
+        return ProgramSpecificity(cube, min_cells) if cube is not None else None
+
+    return _load_once(_specificity_cache, (dataset_id, group_col, min_cells), "specificity", load)
+
+
+def _finite(value) -> float | None:
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def register_specificity_tools(mcp):
+
+    @mcp.tool()
+    def program_specificity(
+        h5ad_id: str,
+        group_col: str = "cell_type",
+        programs: Optional[list[str]] = None,
+        sort_by: Literal["tau", "gini", "entropy"] = "tau",
+        top_k_programs: Optional[int] = None,
+        min_cells: int = MIN_CELLS,
+    ) -> dict:
+        """
+        Specificity of every program across the groups of a column (e.g. which programs
+        are cell-type specific), from per-group mean activity: tau (0 even .. 1 one group),
+        Shannon entropy (low = specific), Gini, and per-group z-scores of the means.
+        Faster and easier to read than interpreting program_celltype_enrichment p-values.
+
+        Args:
+            h5ad_id: Dataset ID of the H5AD file
+            group_col: Obs column defining the groups (e.g., 'cell_type')
+            programs: Programs to report ('5' or 'new_program_5_activity_scaled'); default all
+            sort_by: Most specific first by 'tau', 'gini' or 'entropy'
+            top_k_programs: Limit the number of programs returned
+            min_cells: Ignore groups with fewer cells
+        """
+        obs_cols = _obs_columns(h5ad_id)
+        if obs_cols is None:
+            return {"error": f"Dataset {h5ad_id} not found"}
+        if group_col not in obs_cols:
+            return {"error": f"Column {group_col} not found"}
+
+        spec = _load_specificity(h5ad_id, group_col, min_cells)
+        if spec is None:
+            return {"error": "No program columns found (expected obs columns starting with 'new_program_')"}
+        if len(spec.groups) < 2:
+            return {"error": f"Need at least two groups with >= {min_cells} cells in {group_col}"}
+
+        columns = spec.program_cols
+        if programs:
+            columns, missing = _resolve_programs(programs, spec.program_cols)
+            if missing:
+                return {"error": f"Programs not found: {missing}"}
+        idx = [spec.program_cols.index(c) for c in columns]
+
+        key = {"tau": -spec.tau, "gini": -spec.gini, "entropy": spec.entropy}[sort_by]
+        idx.sort(key=lambda i: np.nan_to_num(key[i], nan=np.inf))
+        if top_k_programs:
+            idx = idx[:top_k_programs]
+
+        results = []
+        for i in idx:
+            z = spec.z[:, i]
+            best = int(np.nanargmax(z)) if not np.all(np.isnan(z)) else None
+            results.append({
+                "program_number": _parse_program_number(spec.program_cols[i]),
+                "program_column": spec.program_cols[i],
+                "tau": _finite(spec.tau[i]),
+                "entropy": _finite(spec.entropy[i]),
+                "gini": _finite(spec.gini[i]),
+                "top_group": spec.groups[best] if best is not None else None,
+                "z_scores": [_finite(v) for v in z],
+            })
+
+        return {
+            "group_col": group_col,
+            "groups": spec.groups,
+            "n_cells": spec.counts.tolist(),
+            "max_entropy": float(np.log2(len(spec.groups))),
+            "sort_by": sort_by,
+            "programs": results,
+        }
@@ -3,9 +3,17 @@ from __future__ import annotations
 from typing import Literal, List, Dict, Optional, Any
 import numpy as np
 import re
-from scipy.stats import mannwhitneyu
-from statsmodels.stats.multitest import multipletests
-from .data import _load_h5ad, _load_json
+from .data import _load_loadings, _load_obs, _load_obs_store, _obs_columns
+from .lazy import lazy_import
+from . import parallel, resampling
+from .jobs import report_progress
+from .moments import _load_moments, compute_moments
+from .ordering import _cell_order
+from .subset import SubsetError, _select_cells
+from .vocab import _load_vocab, _resolve_gene
+
+pd = lazy_import("pandas")
+multitest = lazy_import("statsmodels.stats.multitest")
 
 def _parse_program_number(s: str) -> str:
     """
@@ -15,6 +23,88 @@ def _parse_program_number(s: str) -> str:
     m = re.search(r"(\d+)", str(s))
     return m.group(1) if m else str(s)
 
+def _resolve_programs(
+    names: list[str], program_cols: list[str], extra_cols: list[str] = ()
+) -> tuple[list[str], list[str]]:
+    """
+    Map '5' / 'new_program_5_activity_scaled' style names to program columns;
+    names in extra_cols (e.g. gene-set score columns) are taken as-is.
+    """
+    by_number = {_parse_program_number(c): c for c in program_cols}
+    found, missing = [], []
+    for name in names:
+        col = name if name in program_cols or name in extra_cols else by_number.get(_parse_program_number(name))
+        (found if col else missing).append(col or name)
+    return found, missing
+
+def _group_codes(values, group_values: list[str]) -> np.ndarray:
+    """Integer code per cell for a group column (-1 for values outside group_values)"""
+    return np.asarray(pd.Categorical(values.astype(str), categories=group_values).codes)
+
+def _program_tests(
+    h5ad_id: str,
+    program_cols: List[str],
+    codes: np.ndarray,
+    comparisons: List[tuple],
+    alternative: str,
+    min_cells: int,
+    test: str = "mannwhitney",
+    n_permutations: int = 10000,
+    n_bootstrap: int = 1000,
+    rows: np.ndarray | None = None,
+) -> list:
+    """
+    Mann-Whitney tests (see parallel.mannwhitney_columns) or permutation tests with
+    bootstrap CIs (see resampling.permutation_columns) for every program x comparison.
+    Large datasets are partitioned by program columns across the stats process pool;
+    workers memory-map the columnar obs store instead of receiving pickled data.
+    Subsampled runs (rows given) stay in process.
+    """
+    if test == "permutation":
+        in_process, worker = resampling.permutation_columns, resampling.permutation_paths
+        args = (codes, comparisons, alternative, min_cells, n_permutations, n_bootstrap)
+        return _map_programs(h5ad_id, program_cols, rows, in_process, worker, args)
+
+    in_process, worker = parallel.mannwhitney_columns, parallel.mannwhitney_paths
+    args = (codes, comparisons, alternative, min_cells)
+    return _map_programs(h5ad_id, program_cols, rows, in_process, worker, args, ordered=True)
+
+def _map_programs(
+    h5ad_id: str, program_cols: List[str], rows, in_process, worker, args: tuple, ordered: bool = False
+) -> list:
+    """
+    in_process(columns, *args) over the program columns, or worker(paths, *args)
+    on the stats process pool for large datasets (full columnar store only).
+    With ordered=True, in-process runs get each column's cached sort order
+    (orders=..., see ordering._cell_order) so rank tests do not sort again.
+    """
+    store = _load_obs_store(h5ad_id)
+    n_cells = len(args[0])
+    if (
+        rows is None
+        and store is not None
+        and all(c in store for c in program_cols)
+        and parallel.should_parallelize(n_cells, len(program_cols))
+    ):
+        paths = [str(store.column_path(c)) for c in program_cols]
+        return parallel.map_column_chunks(worker, paths, *args, progress=report_progress)
+
+    obs = _load_obs(h5ad_id, program_cols, rows)
+    columns = [obs[c].values for c in program_cols]
+    if ordered:
+        orders = [_cell_order(h5ad_id, c, rows) for c in program_cols]
+        return in_process(columns, *args, progress=report_progress, orders=orders)
+    return in_process(columns, *args, progress=report_progress)
+
+def _resampling_fields(test_result: tuple) -> dict:
+    """Extra row fields for permutation tests (statistic is the difference in means)"""
+    mean_diff, _, _, _, _, ci_low, ci_high, used = test_result
+    return {
+        "mean_diff": mean_diff,
+        "median_diff_ci": [ci_low, ci_high],
+        "n_permutations": used,
+    }
+
 def register_stats_tools(mcp):
 
     @mcp.tool()
@@ -22,31 +112,42 @@ def register_stats_tools(mcp):
         """
         Lookup of gene in programs
         """
-        data = _load_json(json_id)
-        if data is None:
+        loadings = _load_loadings(json_id)
+        if loadings is None:
             return {"gene": gene, "found": False, "programs": []}
         
-        g = gene.upper()
+        col = loadings.gene_column(gene)
+        resolved_from = None
+        if col is None:
+            # a unique alias spelling (e.g. HLA.DRA for HLA-DRA) is looked up directly
+            resolved = _resolve_gene(json_id, gene)
+            if resolved is not None:
+                resolved_from, gene = gene, resolved
+                col = loadings.gene_column(gene)
         hits = []
-        for prog_idx, prog_data in data.items():
-            if isinstance(prog_data, dict) and "loadings" in prog_data:
-                genes_in_prog = [str(x).upper() for x in prog_data["loadings"].keys()]
-                if g in genes_in_prog:
-                    loading = float(prog_data["loadings"].get(gene, 0) or prog_data["loadings"].get(g, 0))
-                    hits.append({
-                        "program": prog_idx,
-                        "h5ad_column": f"new_program_{prog_idx}_activity_scaled",
-                        "loading": loading
-                    })
+        if col is not None:
+            for p in np.flatnonzero(~np.isnan(col)):
+                prog_idx = loadings.programs[p]
+                hits.append({
+                    "program": prog_idx,
+                    "h5ad_column": f"new_program_{prog_idx}_activity_scaled",
+                    "loading": float(col[p])
+                })
         
         hits.sort(key=lambda x: abs(x["loading"]), reverse=True)
         
-        return {
+        result = {
             "gene": gene,
             "found": len(hits) > 0,
             "n_programs": len(hits),
             "programs": hits
         }
+        if resolved_from is not None:
+            result["resolved_from"] = resolved_from
+        if not hits:
+            # a typo or ambiguous alias: offer close symbols instead of a bare miss
+            result["suggestions"] = _load_vocab(json_id).suggest(gene)
+        return result
     
     @mcp.tool()
     def program_top_genes(json_id: str, program: str, top_k: int = 30) -> dict:
@@ -54,27 +155,17 @@ def register_stats_tools(mcp):
         Return top genes (by absolute loading) in a given program from the loadings JSON.
         program can be '5' or 'new_program_5_activity_scaled' etc; we extract digits.
         """
-        data = _load_json(json_id)
-        if data is None:
+        loadings = _load_loadings(json_id)
+        if loadings is None:
             return {"error": f"Dataset {json_id} not found"}
 
         prog_num = _parse_program_number(program)
 
-        if prog_num not in data:
+        if prog_num not in loadings.program_index:
             return {"error": f"Program {prog_num} not found"}
 
-        prog_data = data[prog_num]
-        loadings = prog_data.get("loadings", prog_data)
-
-        items = []
-        for g, v in loadings.items():
-            try:
-                items.append((str(g), float(v)))
-            except Exception:
-                continue
-
-        items.sort(key=lambda x: abs(x[1]), reverse=True)
-        top = [{"gene": g, "loading": v} for g, v in items[:top_k]]
+        # genes are pre-sorted by |loading| at compile time, so this is a slice
+        top = [{"gene": g, "loading": v} for g, v in loadings.top_genes(prog_num, top_k)]
 
         return {"program_number": prog_num, "top_genes": top}
 
@@ -83,35 +174,26 @@ def register_stats_tools(mcp):
     def jaccard_topk(json_id: str, target_program: str, top_k: int = 20) -> list[dict]:
         """Jaccard similarity by overlap of gene sets"""
 
-        data = _load_json(json_id)
-        if data is None:
+        loadings = _load_loadings(json_id)
+        if loadings is None:
             return [{"error": f"Dataset {json_id} not found"}]
         
         clean_target = target_program.replace("new_program_", "").replace("_activity_scaled", "")
         
-        if clean_target not in data:
+        if clean_target not in loadings.program_index:
             return [{"error": f"Unknown target_program: {clean_target}"}]
 
-        target_data = data[clean_target]
-        if isinstance(target_data, dict) and "loadings" in target_data:
-            a = {str(x).upper() for x in target_data["loadings"].keys()}
-        else:
-            a = {str(x).upper() for x in target_data.keys()}
+        sets = loadings.upper_gene_sets()
+        t = loadings.program_index[clean_target]
+        sizes = sets.sum(axis=1)
+        inter = sets.astype(np.int32) @ sets[t].astype(np.int32)
+        union = sizes + sizes[t] - inter
         
         rows = []
-        for other, genes_data in data.items():
-            if other == clean_target:
+        for p, other in enumerate(loadings.programs):
+            if p == t:
                 continue
-            
-            if isinstance(genes_data, dict) and "loadings" in genes_data:
-                b = {str(x).upper() for x in genes_data["loadings"].keys()}
-            else:
-                b = {str(x).upper() for x in genes_data.keys()}
-            
-            inter = len(a & b)
-            union = len(a | b)
-            
-            rows.append({"program": other, "jaccard": (inter / union) if union else 0.0})
+            rows.append({"program": other, "jaccard": float(inter[p] / union[p]) if union[p] else 0.0})
 
         rows.sort(key=lambda r: r["jaccard"], reverse=True)
         return rows[:top_k]
@@ -120,31 +202,63 @@ def register_stats_tools(mcp):
     def correlation_matrix(
         h5ad_id: str,
         program_names: list[str] = None,
-        top_k: int = 20
+        top_k: int = 20,
+        approximate: bool = False,
+        method: Literal["pearson", "spearman"] = "pearson",
+        covariates: Optional[list[str]] = None,
+        subset: Optional[str] = None
     ) -> dict:
         """
         activity_by_program: shape [P][N] (P programs, N cells/samples)
         Returns a P x P correlation matrix.
+        method="spearman" gives rank correlations; covariates (e.g. ['cell_type'])
+        gives partial correlations controlling for those obs columns.
+        approximate=True computes it on a stratified subsample (see build_sketches).
+        subset restricts the cells, e.g. "cell_type == 'Epi' and disease_status in ['Active']".
         """
-        adata = _load_h5ad(h5ad_id)
-        if adata is None:
+        obs_cols = _obs_columns(h5ad_id)
+        if obs_cols is None:
             return {"error": f"Dataset {h5ad_id} not found"}
         
-        all_program_cols = [c for c in adata.obs.columns if c.startswith('new_program_')]
+        covariates = tuple(dict.fromkeys(covariates or []))
+        missing = [c for c in covariates if c not in obs_cols]
+        if missing:
+            return {"error": f"Covariate columns not found: {missing}"}
+        
+        try:
+            cells = _select_cells(h5ad_id, approximate, subset)
+        except SubsetError as e:
+            return {"error": str(e)}
+        cell_rows, sample_key = cells.rows, cells.key
         
         if program_names is None:
-            variances = [(col, adata.obs[col].var()) for col in all_program_cols]
-            variances.sort(key=lambda x: x[1], reverse=True)
-            program_names = [col for col, _ in variances[:top_k]]
+            # top-variance programs from the cached (plain) moments
+            base = _load_moments(h5ad_id, cell_rows, sample_key)
+            if base is None:
+                return {"error": "No program columns found (expected obs columns starting with 'new_program_')"}
+            program_names = base.top_variance(top_k)
+        else:
+            missing = [p for p in program_names if p not in obs_cols]
+            if missing:
+                return {"error": f"Programs not found: {missing}"}
         
-        activity_by_program = [adata.obs[prog].values for prog in program_names]
+        # cached covariance of all programs; any subset is a sub-matrix lookup
+        moments = _load_moments(h5ad_id, cell_rows, sample_key, method, covariates)
+        if moments is None or not all(p in moments for p in program_names):
+            # other numeric obs columns: one-off moments, not cached
+            cols = list(dict.fromkeys(program_names))
+            moments = compute_moments(h5ad_id, cols, cell_rows, method, covariates)
         
-        X = np.asarray(activity_by_program, dtype=float)
-        corr = np.corrcoef(X)
-        return {"programs": program_names, "corr": corr.tolist()}
+        corr = moments.corr(program_names)
+        result = {"programs": program_names, "corr": corr.tolist()}
+        if method != "pearson" or covariates:
+            result["method"] = method
+            result["covariates"] = list(covariates)
+        result.update(cells.info)
+        return result
 
     def _one_vs_rest_enrichment(
-        adata,
+        h5ad_id: str,
         program_cols: List[str],
         group_col: str,
         program_info: Optional[Dict[str, Dict[str, Any]]] = None,
@@ -155,18 +269,42 @@ def register_stats_tools(mcp):
         top_k_programs: int = 30,
         top_k_groups: int = 5,
         min_cells_per_group: int = 3,
+        test: Literal["mannwhitney", "permutation"] = "mannwhitney",
+        n_permutations: int = 10000,
+        n_bootstrap: int = 1000,
+        approximate: bool = False,
+        subset: Optional[str] = None,
     ) -> dict:
         """Generic one-vs-rest enrichment over any group_col."""
-        if group_col not in adata.obs.columns:
+        if group_col not in _obs_columns(h5ad_id):
             return {"error": f"Column {group_col} not found"}
 
-        groups = adata.obs[group_col].astype(str)
+        try:
+            cells = _select_cells(h5ad_id, approximate, subset)
+        except SubsetError as e:
+            return {"error": str(e)}
+        cell_rows = cells.rows
+        groups = _load_obs(h5ad_id, [group_col], cell_rows)[group_col].astype(str)
         group_values = sorted(groups.unique().tolist())
+        codes = _group_codes(groups, group_values)
+
+        tests = _program_tests(
+            h5ad_id,
+            program_cols,
+            codes,
+            [(g, parallel.REST) for g in range(len(group_values))],
+            alternative,
+            min_cells_per_group,
+            test,
+            n_permutations,
+            n_bootstrap,
+            cell_rows,
+        )
 
         all_test_rows: List[dict] = []
         programs: List[dict] = []
 
-        for pcol in program_cols:
+        for pcol, pcol_tests in zip(program_cols, tests):
             prog_num = _parse_program_number(pcol)
 
             name = ""
@@ -175,38 +313,26 @@ def register_stats_tools(mcp):
                 name = str(program_info[prog_num].get("name", ""))
                 description = str(program_info[prog_num].get("description", ""))
 
-            x_all = np.asarray(adata.obs[pcol].values, dtype=float)
-
             per_rows = []
-            for gv in group_values:
-                mask_in = (groups == gv).values
-                mask_out = ~mask_in
-
-                a = x_all[mask_in]
-                b = x_all[mask_out]
-
-                if a.size < min_cells_per_group or b.size < min_cells_per_group:
-                    stat, p = 0.0, 1.0
-                    med_diff = float("nan")
-                else:
-                    stat, p = mannwhitneyu(a, b, alternative=alternative)
-                    med_diff = float(np.nanmedian(a) - np.nanmedian(b))
-
+            for gv, test_result in zip(group_values, pcol_tests):
+                stat, p, med_diff, n_in, n_out = test_result[:5]
                 row = {
                     "program_column": pcol,
                     "program_number": prog_num,
                     "group_value": str(gv),
                     "group_value_label": str(gv),  # filled after FDR
 
-                    "u_stat": float(stat),
+                    "u_stat": float(stat) if test == "mannwhitney" else None,
                     "p_value": float(p),
                     "q_value": 1.0,
                     "significant": False,
 
                     "median_diff": med_diff,
-                    "n_in": int(a.size),
-                    "n_out": int(b.size),
+                    "n_in": n_in,
+                    "n_out": n_out,
                 }
+                if test == "permutation":
+                    row.update(_resampling_fields(test_result))
                 per_rows.append(row)
                 all_test_rows.append(row)
 
@@ -221,7 +347,7 @@ def register_stats_tools(mcp):
         # FDR correction
         if fdr_scope == "global":
             pvals = [r["p_value"] for r in all_test_rows]
-            _, qvals, _, _ = multipletests(pvals, method=fdr_method)
+            _, qvals, _, _ = multitest.multipletests(pvals, method=fdr_method)
             for r, q in zip(all_test_rows, qvals):
                 r["q_value"] = float(q)
                 r["significant"] = bool(r["q_value"] < alpha)
@@ -229,7 +355,7 @@ def register_stats_tools(mcp):
         else:
             for prog in programs:
                 pvals = [r["p_value"] for r in prog["tests"]]
-                _, qvals, _, _ = multipletests(pvals, method=fdr_method)
+                _, qvals, _, _ = multitest.multipletests(pvals, method=fdr_method)
                 for r, q in zip(prog["tests"], qvals):
                     r["q_value"] = float(q)
                     r["significant"] = bool(r["q_value"] < alpha)
@@ -270,6 +396,7 @@ def register_stats_tools(mcp):
                         "median_diff": r["median_diff"],
                         "n_in": r["n_in"],
                         "n_out": r["n_out"],
+                        **{k: r[k] for k in ("mean_diff", "median_diff_ci", "n_permutations") if k in r},
                     }
                     for r in enriched[:top_k_groups]
                 ],
@@ -277,14 +404,17 @@ def register_stats_tools(mcp):
 
         results.sort(key=lambda r: r["best_p_value"])
 
-        return {
+        response = {
             "group_col": group_col,
+            "test": test,
             "alternative": alternative,
             "alpha": alpha,
             "fdr_method": fdr_method,
             "fdr_scope": fdr_scope,
             "results": results[:top_k_programs],
         }
+        response.update(cells.info)
+        return response
 
 
     @mcp.tool()
@@ -299,21 +429,36 @@ def register_stats_tools(mcp):
         top_k_programs: int = 30,
         top_k_celltypes: int = 5,
         min_cells_per_group: int = 3,
+        test: Literal["mannwhitney", "permutation"] = "mannwhitney",
+        n_permutations: int = 10000,
+        n_bootstrap: int = 1000,
+        approximate: bool = False,
+        programs: Optional[List[str]] = None,
+        subset: Optional[str] = None,
     ) -> dict:
         """
         Cell-type enrichment: for each program, test each cell type vs all other cell types (one-vs-rest).
         This is the tool you want for: "Cell types the program is enriched in (vs all other cell types)".
+        test="permutation" uses permutation p-values on the mean difference and adds
+        bootstrap 95% CIs for the median difference.
+        approximate=True runs on a stratified subsample (see build_sketches).
+        programs restricts the test to these programs or score columns (see score_gene_set).
+        subset restricts the cells, e.g. "cell_type == 'Epi' and disease_status != 'Ctrl'".
         """
-        adata = _load_h5ad(h5ad_id)
-        if adata is None:
+        obs_cols = _obs_columns(h5ad_id)
+        if obs_cols is None:
             return {"error": f"Dataset {h5ad_id} not found"}
 
-        program_cols = [c for c in adata.obs.columns if c.startswith("new_program_")]
+        program_cols = [c for c in obs_cols if c.startswith("new_program_")]
+        if programs:
+            program_cols, missing = _resolve_programs(programs, program_cols, obs_cols)
+            if missing:
+                return {"error": f"Programs not found: {missing}"}
         if not program_cols:
             return {"error": "No program columns found (expected obs columns starting with 'new_program_')"}
 
         return _one_vs_rest_enrichment(
-            adata=adata,
+            h5ad_id=h5ad_id,
             program_cols=program_cols,
             group_col=cell_type_col,
             program_info=program_info,
@@ -324,6 +469,11 @@ def register_stats_tools(mcp):
             top_k_programs=top_k_programs,
             top_k_groups=top_k_celltypes,
             min_cells_per_group=min_cells_per_group,
+            test=test,
+            n_permutations=n_permutations,
+            n_bootstrap=n_bootstrap,
+            approximate=approximate,
+            subset=subset,
         )
 
 
@@ -339,23 +489,46 @@ def register_stats_tools(mcp):
         fdr_method: Literal["fdr_bh"] = "fdr_bh",
         top_k_programs: int = 30,
         min_cells_per_group: int = 3,
+        test: Literal["mannwhitney", "permutation"] = "mannwhitney",
+        n_permutations: int = 10000,
+        n_bootstrap: int = 1000,
+        approximate: bool = False,
+        programs: Optional[List[str]] = None,
+        subset: Optional[str] = None,
     ) -> dict:
         """
         Pairwise enrichment: compare group_a vs group_b for each program (e.g., Active vs Ctrl).
         This is the tool you want for: "enriched in Active compared to Ctrl".
+        test="permutation" uses permutation p-values on the mean difference and adds
+        bootstrap 95% CIs for the median difference.
+        approximate=True runs on a stratified subsample (see build_sketches).
+        programs restricts the test to these programs or score columns (see score_gene_set).
+        subset restricts the cells, e.g. "cell_type == 'Epi' and disease_status != 'Ctrl'".
         """
-        adata = _load_h5ad(h5ad_id)
-        if adata is None:
+        obs_cols = _obs_columns(h5ad_id)
+        if obs_cols is None:
             return {"error": f"Dataset {h5ad_id} not found"}
 
-        if group_col not in adata.obs.columns:
+        if group_col not in obs_cols:
             return {"error": f"Column {group_col} not found"}
 
-        program_cols = [c for c in adata.obs.columns if c.startswith("new_program_")]
+        program_cols = [c for c in obs_cols if c.startswith("new_program_")]
+        if programs:
+            program_cols, missing = _resolve_programs(programs, program_cols, obs_cols)
+            if missing:
+                return {"error": f"Programs not found: {missing}"}
         if not program_cols:
             return {"error": "No program columns found (expected obs columns starting with 'new_program_')"}
 
-        groups = adata.obs[group_col].astype(str)
+        if str(group_a) == str(group_b):
+            return {"error": "group_a and group_b must be different groups"}
+
+        try:
+            cells = _select_cells(h5ad_id, approximate, subset)
+        except SubsetError as e:
+            return {"error": str(e)}
+        cell_rows = cells.rows
+        groups = _load_obs(h5ad_id, [group_col], cell_rows)[group_col].astype(str)
         mask_a = (groups == str(group_a)).values
         mask_b = (groups == str(group_b)).values
 
@@ -366,10 +539,17 @@ def register_stats_tools(mcp):
                 "n_b": int(mask_b.sum()),
             }
 
+        codes = _group_codes(groups, [str(group_a), str(group_b)])
+        tests = _program_tests(
+            h5ad_id, program_cols, codes, [(0, 1)], alternative, min_cells_per_group,
+            test, n_permutations, n_bootstrap, cell_rows,
+        )
+
         rows = []
         pvals = []
 
-        for pcol in program_cols:
+        for pcol, (test_result,) in zip(program_cols, tests):
+            stat, p, med_diff, n_a, n_b = test_result[:5]
             prog_num = _parse_program_number(pcol)
 
             name = ""
@@ -378,17 +558,6 @@ def register_stats_tools(mcp):
                 name = str(program_info[prog_num].get("name", ""))
                 description = str(program_info[prog_num].get("description", ""))
 
-            x_all = np.asarray(adata.obs[pcol].values, dtype=float)
-            a = x_all[mask_a]
-            b = x_all[mask_b]
-
-            if a.size < min_cells_per_group or b.size < min_cells_per_group:
-                stat, p = 0.0, 1.0
-                med_diff = float("nan")
-            else:
-                stat, p = mannwhitneyu(a, b, alternative=alternative)
-                med_diff = float(np.nanmedian(a) - np.nanmedian(b))
-
             # "Higher group" label is useful for UI while hiding p/q
             if np.isnan(med_diff):
                 higher = ""
@@ -401,24 +570,26 @@ def register_stats_tools(mcp):
                 "name": name,
                 "description": description,
 
-                "u_stat": float(stat),
+                "u_stat": float(stat) if test == "mannwhitney" else None,
                 "p_value": float(p),
                 "q_value": 1.0,
                 "significant": False,
 
                 "median_diff": med_diff,
-                "n_a": int(a.size),
-                "n_b": int(b.size),
+                "n_a": n_a,
+                "n_b": n_b,
 
                 "higher_group": higher,
                 "higher_group_label": higher,  # add ★ after FDR
             }
+            if test == "permutation":
+                row.update(_resampling_fields(test_result))
 
             rows.append(row)
             pvals.append(p)
 
         # FDR across programs
-        _, qvals, _, _ = multipletests(pvals, method=fdr_method)
+        _, qvals, _, _ = multitest.multipletests(pvals, method=fdr_method)
         for r, q in zip(rows, qvals):
             r["q_value"] = float(q)
             r["significant"] = bool(r["q_value"] < alpha)
@@ -428,12 +599,141 @@ def register_stats_tools(mcp):
         # sort by q then p (stable)
         rows.sort(key=lambda r: (r["q_value"], r["p_value"]))
 
-        return {
+        response = {
             "group_col": group_col,
             "group_a": group_a,
             "group_b": group_b,
+            "test": test,
             "alternative": alternative,
             "alpha": alpha,
             "fdr_method": fdr_method,
             "results": rows[:top_k_programs],
-        }
\ No newline at end of file
+        }
+        response.update(cells.info)
+        return response
+
+    @mcp.tool()
+    def program_all_pairs_enrichment(
+        h5ad_id: str,
+        group_col: str,
+        groups: Optional[List[str]] = None,
+        program_info: Optional[Dict[str, Dict[str, Any]]] = None,
+        alternative: Literal["two-sided", "greater", "less"] = "two-sided",
+        alpha: float = 0.05,
+        fdr_method: Literal["fdr_bh"] = "fdr_bh",
+        top_k_programs: int = 30,
+        min_cells_per_group: int = 3,
+        approximate: bool = False,
+        programs: Optional[List[str]] = None,
+        subset: Optional[str] = None,
+    ) -> dict:
+        """
+        Every pair of groups at once (e.g. all disease statuses or all cell types against
+        each other) for each program, instead of one program_pairwise_enrichment call per pair.
+        Mann-Whitney tests with FDR across the whole family (all programs x pairs).
+        Matrices are indexed [row group][column group]: p_value[a][b] tests a vs b
+        (a > b for 'greater') and median_diff[a][b] = median(a) - median(b).
+        groups limits the comparison to these group values (default all).
+        """
+        obs_cols = _obs_columns(h5ad_id)
+        if obs_cols is None:
+            return {"error": f"Dataset {h5ad_id} not found"}
+
+        if group_col not in obs_cols:
+            return {"error": f"Column {group_col} not found"}
+
+        program_cols = [c for c in obs_cols if c.startswith("new_program_")]
+        if programs:
+            program_cols, missing = _resolve_programs(programs, program_cols, obs_cols)
+            if missing:
+                return {"error": f"Programs not found: {missing}"}
+        if not program_cols:
+            return {"error": "No program columns found (expected obs columns starting with 'new_program_')"}
+
+        try:
+            cells = _select_cells(h5ad_id, approximate, subset)
+        except SubsetError as e:
+            return {"error": str(e)}
+        values = _load_obs(h5ad_id, [group_col], cells.rows)[group_col].astype(str)
+        present = sorted(values.unique().tolist())
+        if groups:
+            missing = [g for g in groups if str(g) not in present]
+            if missing:
+                return {"error": f"Groups not found in {group_col}: {missing}", "available_groups": present}
+        # repeated groups would be duplicate categories: keep the first of each
+        group_values = list(dict.fromkeys(str(g) for g in groups)) if groups else present
+        if len(group_values) < 2:
+            return {"error": "Need at least two groups to compare"}
+
+        codes = _group_codes(values, group_values)
+        tests = _map_programs(
+            h5ad_id, program_cols, cells.rows,
+            parallel.mannwhitney_all_pairs, parallel.mannwhitney_all_pairs_paths,
+            (codes, len(group_values), alternative, min_cells_per_group),
+            ordered=True,
+        )
+
+        # family: unordered pairs for two-sided tests, ordered pairs otherwise
+        k = len(group_values)
+        a_idx, b_idx = np.triu_indices(k, 1) if alternative == "two-sided" else np.nonzero(~np.eye(k, dtype=bool))
+        pvals = np.concatenate([p[a_idx, b_idx] for _, p, _, _ in tests])
+        _, qvals, _, _ = multitest.multipletests(pvals, method=fdr_method)
+        qvals = qvals.reshape(len(program_cols), -1)
+
+        def matrix(x) -> list:
+            return [[None if np.isnan(v) else float(v) for v in row] for row in x]
+
+        results = []
+        for pcol, (_, p, med, counts), q_flat in zip(program_cols, tests, qvals):
+            prog_num = _parse_program_number(pcol)
+            q = np.ones((k, k))
+            q[a_idx, b_idx] = q_flat
+            if alternative == "two-sided":
+                q[b_idx, a_idx] = q_flat
+            np.fill_diagonal(p, np.nan)
+            np.fill_diagonal(q, np.nan)
+
+            significant = []
+            for a, b, q_ab in zip(a_idx, b_idx, q_flat):
+                if q_ab < alpha:
+                    if alternative == "less":
+                        hi, lo = b, a
+                    elif alternative == "greater" or not med[a, b] < 0:
+                        hi, lo = a, b
+                    else:
+                        hi, lo = b, a
+                    significant.append({
+                        "higher": group_values[hi],
+                        "lower": group_values[lo],
+                        "q_value": float(q_ab),
+                        "median_diff": float(med[hi, lo]),
+                    })
+            significant.sort(key=lambda r: r["q_value"])
+
+            info = (program_info or {}).get(prog_num, {})
+            results.append({
+                "program_number": prog_num,
+                "program_column": pcol,
+                "name": str(info.get("name", "")),
+                "description": str(info.get("description", "")),
+                "best_q_value": float(q_flat.min()) if q_flat.size else 1.0,
+                "n_cells": counts.tolist(),
+                "p_value": matrix(p),
+                "q_value": matrix(q),
+                "median_diff": matrix(med),
+                "significant_pairs": significant,
+            })
+
+        results.sort(key=lambda r: r["best_q_value"])
+        response = {
+            "group_col": group_col,
+            "groups": group_values,
+            "test": "mannwhitney",
+            "alternative": alternative,
+            "alpha": alpha,
+            "fdr_method": fdr_method,
+            "n_tests": int(pvals.size),
+            "results": results[:top_k_programs],
+        }
+        response.update(cells.info)
+        return response
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import ast
+import re
+
+import numpy as np
+from .data import _dataset_shape, _load_obs, _obs_columns, _virtual_columns
+from .grouping import _load_grouping
+from .lazy import lazy_import
+from .sketch import _rows_for
+
+pd = lazy_import("pandas")
+
+# Packed (np.packbits) cell masks: per (dataset, column, op, value) leaf and per whole expression
+_bitmap_cache: dict[tuple, np.ndarray] = {}
+
+_COMPARE = {
+    ast.Eq: "==", ast.NotEq: "!=", ast.In: "in", ast.NotIn: "not in",
+    ast.Lt: "<", ast.LtE: "<=", ast.Gt: ">", ast.GtE: ">=",
+}
+# `5 < n_counts` is `n_counts > 5`
+_FLIPPED = {"<": ">", "<=": ">=", ">": "<", ">=": "<=", "==": "==", "!=": "!="}
+
+
+class SubsetError(ValueError):
+    """Invalid subset expression"""
+
+
+class CellSelection:
+    """
+    Cells a tool call runs on: row positions (None = all), a cache key for them
+    (None for subsets, which are open-ended and may use rewritable virtual
+    columns, so results on them are not cached), and response fields
+    """
+
+    def __init__(self, rows: np.ndarray | None, key: tuple | None, info: dict):
+        self.rows = rows
+        self.key = key
+        self.info = info
+
+
+def parse_subset(expr: str) -> tuple[ast.AST, dict[str, str]]:
+    """
+    Parse a filter such as
+        cell_type == 'Epi' and disease_status in ['Active', 'Remission'] and n_counts >= 500
+    Supports ==, !=, in, not in, <, <=, >, >= (also chained, e.g. 0 < x <= 2),
+    and / or / not and parentheses. Column names that are not identifiers go in
+    backticks. Anything else (calls, attributes, arithmetic) is rejected.
+    """
+    columns: dict[str, str] = {}
+
+    def quote(m):
+        name = f"_col{len(columns)}"
+        columns[name] = m.group(1)
+        return name
+
+    try:
+        tree = ast.parse(re.sub(r"`([^`]+)`", quote, expr.strip()), mode="eval").body
+    except SyntaxError as e:
+        raise SubsetError(f"Invalid subset expression: {e.msg}") from None
+
+    def check(node):
+        if isinstance(node, ast.BoolOp):
+            for v in node.values:
+                check(v)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            check(node.operand)
+        elif isinstance(node, ast.Compare):
+            operands = [node.left, *node.comparators]
+            for op, left, right in zip(node.ops, operands, operands[1:]):
+                if type(op) not in _COMPARE:
+                    raise SubsetError(f"Unsupported comparison in subset: {ast.unparse(node)}")
+                if isinstance(left, ast.Name) == isinstance(right, ast.Name):
+                    raise SubsetError(f"Comparisons need one column and one value: {ast.unparse(node)}")
+                value = right if isinstance(left, ast.Name) else left
+                try:
+                    ast.literal_eval(value)
+                except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+                    raise SubsetError(f"Not a literal value: {ast.unparse(value)}") from None
+        else:
+            raise SubsetError(f"Unsupported subset syntax: {ast.unparse(node)}")
+
+    check(tree)
+    return tree, columns
+
+
+def _leaf_bitmap(dataset_id: str, column: str, op: str, value) -> np.ndarray:
+    """Packed mask of cells where `column op value` holds (cached)"""
+    if op in ("!=", "not in"):
+        return np.invert(_leaf_bitmap(dataset_id, column, "==" if op == "!=" else "in", value))
+    if op == "in":
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        if not values:
+            return np.zeros((_dataset_shape(dataset_id)[0] + 7) // 8, dtype=np.uint8)
+        return np.bitwise_or.reduce([_leaf_bitmap(dataset_id, column, "==", v) for v in values])
+
+    # virtual columns (gene-set scores) can be recomputed under the same name: never cached
+    cacheable = column not in _virtual_columns.get(dataset_id, {})
+    number = isinstance(value, (int, float)) and not isinstance(value, bool)
+    key = (dataset_id, column, op, value if number else str(value))
+    if cacheable and key in _bitmap_cache:
+        return _bitmap_cache[key]
+
+    values = _load_obs(dataset_id, [column])[column]
+    # flag columns (e.g. is_doublet == True) are matched like categories
+    numeric = (
+        pd.api.types.is_numeric_dtype(values)
+        and not pd.api.types.is_bool_dtype(values)
+        and not isinstance(values.dtype, pd.CategoricalDtype)
+    )
+    if op == "==" and not (numeric and number):
+        # categorical equality: compare codes of the cached grouping
+        grouping = _load_grouping(dataset_id, [column])
+        level = grouping.level_index.get((str(value),))
+        mask = grouping.codes == level if level is not None else np.zeros(len(grouping.codes), dtype=bool)
+    else:
+        if not numeric or not number:
+            raise SubsetError(f"'{column} {op} {value!r}' needs a numeric column and a numeric value")
+        x = np.asarray(values, dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            mask = {"==": x == value, "<": x < value, "<=": x <= value, ">": x > value, ">=": x >= value}[op]
+
+    bits = np.packbits(mask)
+    if cacheable:
+        _bitmap_cache[key] = bits
+    return bits
+
+
+def _evaluate(dataset_id: str, node: ast.AST, columns: dict[str, str], obs_cols: set[str]) -> np.ndarray:
+    if isinstance(node, ast.BoolOp):
+        parts = [_evaluate(dataset_id, v, columns, obs_cols) for v in node.values]
+        return (np.bitwise_and if isinstance(node.op, ast.And) else np.bitwise_or).reduce(parts)
+    if isinstance(node, ast.UnaryOp):
+        return np.invert(_evaluate(dataset_id, node.operand, columns, obs_cols))
+
+    parts = []
+    operands = [node.left, *node.comparators]
+    for op, left, right in zip(node.ops, operands, operands[1:]):
+        op = _COMPARE[type(op)]
+        if isinstance(left, ast.Name):
+            name, value = left.id, ast.literal_eval(right)
+        else:
+            if op in ("in", "not in"):
+                raise SubsetError(f"Write membership as `column in [...]`: {ast.unparse(node)}")
+            name, value, op = right.id, ast.literal_eval(left), _FLIPPED[op]
+        column = columns.get(name, name)
+        if column not in obs_cols:
+            raise SubsetError(f"Column {column} not found")
+        parts.append(_leaf_bitmap(dataset_id, column, op, value))
+    return np.bitwise_and.reduce(parts)
+
+
+def _subset_bitmap(dataset_id: str, expr: str) -> np.ndarray:
+    """Packed mask of the cells matching a subset expression (cached per canonical expression)"""
+    tree, columns = parse_subset(expr)
+    key = (dataset_id, ast.dump(tree), tuple(sorted(columns.items())))
+    if key in _bitmap_cache:
+        return _bitmap_cache[key]
+
+    bits = _evaluate(dataset_id, tree, columns, set(_obs_columns(dataset_id)))
+    names = {columns.get(n.id, n.id) for n in ast.walk(tree) if isinstance(n, ast.Name)}
+    if not names & set(_virtual_columns.get(dataset_id, {})):
+        _bitmap_cache[key] = bits
+    return bits
+
+
+def _select_cells(dataset_id: str, approximate: bool = False, subset: str | None = None) -> CellSelection:
+    """
+    Cells for a tool call: the sketch (approximate=True) and/or the cells matching
+    a subset expression. Raises SubsetError for invalid or empty subsets.
+    """
+    rows, sample_info = _rows_for(dataset_id, approximate)
+    info = {"approximate": sample_info} if sample_info else {}
+    key = (sample_info["stratified_by"], sample_info["n_cells"]) if rows is not None else None
+    if not subset or not subset.strip():
+        return CellSelection(rows, key, info)
+
+    n_obs = _dataset_shape(dataset_id)[0]
+    mask = np.unpackbits(_subset_bitmap(dataset_id, subset), count=n_obs).view(bool)
+    selected = np.flatnonzero(mask)
+    if rows is not None:
+        selected = rows[mask[rows]]
+    if selected.size == 0:
+        raise SubsetError(f"Subset matches no cells: {subset}")
+
+    info["subset"] = {"expression": subset, "n_cells": int(selected.size), "of_cells": n_obs}
+    return CellSelection(selected, None, info)
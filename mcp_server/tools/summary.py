@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from typing import Literal, Optional, Union
+
+import numpy as np
+from .data import _obs_columns
+from .grouping import _load_cube
+from .stats import _parse_program_number, _resolve_programs
+
+Stat = Literal["mean", "std", "var", "q25", "median", "q75"]
+
+
+def _finite(value) -> float | None:
+    """JSON-safe float (None for NaN, e.g. variance of a single-cell group)"""
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def register_summary_tools(mcp):
+
+    @mcp.tool()
+    def grouped_summary(
+        h5ad_id: str,
+        group_by: list[str],
+        programs: Optional[list[str]] = None,
+        where: Optional[dict[str, Union[str, list[str]]]] = None,
+        stats: list[Stat] = ["mean", "median"],
+        min_cells: int = 1,
+    ) -> dict:
+        """
+        Program activity summarised by any combination of metadata columns in one call,
+        e.g. mean/median of every program per cell type within each disease status.
+        Use this instead of many boxplot or enrichment calls.
+
+        Args:
+            h5ad_id: Dataset ID of the H5AD file
+            group_by: Obs columns to group by (e.g., ['cell_type', 'disease_status'])
+            programs: Programs to report ('5' or 'new_program_5_activity_scaled'); default all
+            where: Keep only these group values, e.g. {'disease_status': 'Active'} or {'cell_type': ['T', 'B']}
+            stats: Statistics to report: mean, std, var, q25, median, q75
+            min_cells: Skip groups with fewer cells
+        """
+        obs_cols = _obs_columns(h5ad_id)
+        if obs_cols is None:
+            return {"error": f"Dataset {h5ad_id} not found"}
+        if not group_by:
+            return {"error": "group_by needs at least one column"}
+        missing = [c for c in group_by if c not in obs_cols]
+        if missing:
+            return {"error": f"Columns not found: {missing}"}
+        where = where or {}
+        if any(c not in group_by for c in where):
+            return {"error": "where can only filter on group_by columns"}
+
+        cube = _load_cube(h5ad_id, group_by)
+        if cube is None:
+            return {"error": "No program columns found (expected obs columns starting with 'new_program_')"}
+
+        if programs:
+            program_cols, missing = _resolve_programs(programs, cube.program_cols)
+            if missing:
+                return {"error": f"Programs not found: {missing}"}
+        else:
+            program_cols = cube.program_cols
+        p_idx = [cube.program_index[p] for p in program_cols]
+
+        allowed = {
+            group_by.index(c): {str(v) for v in (vals if isinstance(vals, list) else [vals])}
+            for c, vals in where.items()
+        }
+        rows = [
+            g for g, level in enumerate(cube.grouping.levels)
+            if cube.counts[g] >= min_cells and all(level[j] in vals for j, vals in allowed.items())
+        ]
+
+        values = {s: cube.stat(s)[np.ix_(rows, p_idx)] for s in stats}
+
+        groups = []
+        for r, g in enumerate(rows):
+            entry = dict(zip(group_by, cube.grouping.levels[g]))
+            entry["n_cells"] = int(cube.counts[g])
+            entry["programs"] = {
+                p: {s: _finite(values[s][r, i]) for s in stats}
+                for i, p in enumerate(program_cols)
+            }
+            groups.append(entry)
+
+        return {
+            "group_by": group_by,
+            "where": where,
+            "stats": stats,
+            "n_groups": len(groups),
+            "groups": groups,
+        }
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
 import numpy as np
-import plotly.graph_objects as go
-import plotly.express as px
-from .data import _load_h5ad
+from .data import _load_obs, _obs_columns, _load_obsm, _list_obsm_keys
+from .lazy import lazy_import
+from .subset import SubsetError, _select_cells
+
+pd = lazy_import("pandas")
+go = lazy_import("plotly.graph_objects")
+px = lazy_import("plotly.express")
 
 def register_visual_tools(mcp):
 
@@ -12,7 +16,9 @@ def register_visual_tools(mcp):
         h5ad_id: str,
         program_name: str,
         group_by: str,
-        title: str = ""
+        title: str = "",
+        approximate: bool = False,
+        subset: str = ""
     ) -> dict:
         """
         Create boxplot using summary statistics (no raw data transfer).
@@ -23,32 +29,40 @@ def register_visual_tools(mcp):
             program_name: Program column (e.g., 'new_program_5_activity_scaled')
             group_by: Metadata column to group by (e.g., 'disease_status')
             title: Chart title (optional)
+            approximate: Use a stratified subsample of cells (see build_sketches)
+            subset: Only cells matching a filter, e.g. "cell_type == 'Epi' and n_counts >= 500"
         """
-        adata = _load_h5ad(h5ad_id)
-        if adata is None:
+        obs_cols = _obs_columns(h5ad_id)
+        if obs_cols is None:
             return {"error": f"Dataset {h5ad_id} not found"}
         
-        if program_name not in adata.obs.columns:
+        if program_name not in obs_cols:
             return {"error": f"Program {program_name} not found"}
         
-        if group_by not in adata.obs.columns:
+        if group_by not in obs_cols:
             return {"error": f"Column {group_by} not found"}
         
+        try:
+            cells = _select_cells(h5ad_id, approximate, subset)
+        except SubsetError as e:
+            return {"error": str(e)}
+        obs = _load_obs(h5ad_id, list(dict.fromkeys([program_name, group_by])), cells.rows)
+        
         if not title:
             title = f"{program_name} by {group_by}"
         
         fig = go.Figure()
         
-        all_values = adata.obs[program_name].values
+        all_values = obs[program_name].values
         data_min = float(np.min(all_values))
         data_max = float(np.max(all_values))
         data_range = data_max - data_min
         y_min = data_min - (data_range * 0.25)
         y_max = data_max + (data_range * 0.25)
         
-        for group_val in sorted(adata.obs[group_by].unique()):
-            mask = adata.obs[group_by] == group_val
-            values = adata.obs.loc[mask, program_name].values
+        for group_val in sorted(obs[group_by].unique()):
+            mask = obs[group_by] == group_val
+            values = obs.loc[mask, program_name].values
             
             # compute stats
             min_val = float(np.min(values))
@@ -82,14 +96,18 @@ def register_visual_tools(mcp):
             height=600
         )
         
-        return {"type": "plotly", "spec": fig.to_dict()}
+        result = {"type": "plotly", "spec": fig.to_dict()}
+        result.update(cells.info)
+        return result
 
     @mcp.tool()
     def boxplot_batch(
         h5ad_id: str,
         program_names: list[str],
         group_by: str,
-        title_prefix: str = "Program"
+        title_prefix: str = "Program",
+        approximate: bool = False,
+        subset: str = ""
     ) -> dict:
         """
         Create multiple boxplots at once (max 5).
@@ -100,26 +118,171 @@ def register_visual_tools(mcp):
             program_names: List of program columns (e.g., ['new_program_3_activity_scaled', ...])
             group_by: Metadata column to group by (e.g., 'disease_status')
             title_prefix: Prefix for chart titles (default: "Program")
+            approximate: Use a stratified subsample of cells (see build_sketches)
+            subset: Only cells matching a filter, e.g. "disease_status in ['Active', 'Remission']"
         """
         if len(program_names) > 5:
             program_names = program_names[:5]
         
         plots = []
+        cell_info = {}
+        errors = []
         for program_name in program_names:
             result = boxplot(
                 h5ad_id=h5ad_id,
                 program_name=program_name,
                 group_by=group_by,
-                title=f"{title_prefix} {program_name.replace('new_program_', '').replace('_activity_scaled', '')}"
+                title=f"{title_prefix} {program_name.replace('new_program_', '').replace('_activity_scaled', '')}",
+                approximate=approximate,
+                subset=subset
             )
             
             if "error" not in result:
                 plots.append(result["spec"])
+                cell_info.update({k: result[k] for k in ("approximate", "subset") if k in result})
+            else:
+                errors.append(result["error"])
         
         if len(plots) == 0:
-            return {"error": "No valid plots generated"}
+            return {"error": "No valid plots generated", "details": errors}
         
-        return {"type": "plotly_batch", "plots": plots}
+        result = {"type": "plotly_batch", "plots": plots}
+        result.update(cell_info)
+        return result
+
+    @mcp.tool()
+    def embedding_density(
+        h5ad_id: str,
+        basis: str = "X_umap",
+        color_by: str = "",
+        bins: int = 100,
+        title: str = "",
+        approximate: bool = False,
+        subset: str = ""
+    ) -> dict:
+        """
+        Plot a UMAP/t-SNE embedding as a binned 2D density (no raw coordinates transferred).
+        Cells are aggregated server-side into a bins x bins grid, so the spec size
+        does not depend on the number of cells.
+
+        Args:
+            h5ad_id: Dataset ID for H5AD file
+            basis: obsm key (e.g., 'X_umap', 'umap', 'X_tsne')
+            color_by: Optional obs column. Numeric columns (e.g., 'new_program_5_activity_scaled')
+                      show mean value per bin; categorical columns (e.g., 'cell_type')
+                      show the majority category per bin. Empty shows cell counts.
+            bins: Grid resolution per axis (10-300)
+            title: Chart title (optional)
+            approximate: Use a stratified subsample of cells (see build_sketches)
+            subset: Only cells matching a filter, e.g. "cell_type in ['T', 'B']"
+        """
+        coords = _load_obsm(h5ad_id, basis)
+        if coords is None:
+            available = _list_obsm_keys(h5ad_id)
+            if not available:
+                return {"error": f"Dataset {h5ad_id} not found or has no embeddings"}
+            return {"error": f"Embedding {basis} not found", "available_embeddings": available}
+
+        try:
+            cells = _select_cells(h5ad_id, approximate, subset)
+        except SubsetError as e:
+            return {"error": str(e)}
+        cell_rows = cells.rows
+        if cell_rows is not None:
+            coords = coords[cell_rows]
+
+        bins = int(min(max(bins, 10), 300))
+        x = np.asarray(coords[:, 0], dtype=float)
+        y = np.asarray(coords[:, 1], dtype=float)
+        finite = np.isfinite(x) & np.isfinite(y)
+        if not finite.any():
+            return {"error": f"No finite coordinates in {basis}"}
+
+        x_min, x_max = float(x[finite].min()), float(x[finite].max())
+        y_min, y_max = float(y[finite].min()), float(y[finite].max())
+        xi = np.clip(((x - x_min) / ((x_max - x_min) or 1.0) * bins).astype(int), 0, bins - 1)
+        yi = np.clip(((y - y_min) / ((y_max - y_min) or 1.0) * bins).astype(int), 0, bins - 1)
+        flat = (yi * bins + xi)[finite]
+
+        n_bins = bins * bins
+        counts = np.bincount(flat, minlength=n_bins)
+        empty = counts == 0
+
+        x_centers = (x_min + (np.arange(bins) + 0.5) * (x_max - x_min) / bins).round(4).tolist()
+        y_centers = (y_min + (np.arange(bins) + 0.5) * (y_max - y_min) / bins).round(4).tolist()
+        label = basis.replace("X_", "").upper()
+
+        if not title:
+            title = f"{label} colored by {color_by}" if color_by else f"{label} cell density"
+
+        heatmap_args = {}
+        if not color_by:
+            z = np.log10(counts.astype(float) + 1)
+            mode = "count"
+            heatmap_args = dict(colorscale="Viridis", colorbar=dict(title="log10(cells + 1)"))
+        else:
+            if color_by not in _obs_columns(h5ad_id):
+                return {"error": f"Column {color_by} not found"}
+            col = _load_obs(h5ad_id, [color_by], cell_rows)[color_by]
+
+            if pd.api.types.is_numeric_dtype(col):
+                values = np.asarray(col.values, dtype=float)[finite]
+                ok = ~np.isnan(values)
+                sums = np.bincount(flat[ok], weights=values[ok], minlength=n_bins)
+                n_ok = np.bincount(flat[ok], minlength=n_bins)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    z = sums / n_ok
+                empty |= n_ok == 0
+                mode = "mean"
+                heatmap_args = dict(colorscale="RdBu_r", colorbar=dict(title=color_by))
+            else:
+                cat = col.astype(str).astype("category")
+                categories = [str(c) for c in cat.cat.categories]
+                codes = np.asarray(cat.cat.codes)[finite]
+                k = len(categories)
+                per_cat = np.bincount(flat * k + codes, minlength=n_bins * k).reshape(n_bins, k)
+                z = per_cat.argmax(axis=1).astype(float)
+                mode = "majority"
+
+                palette = px.colors.qualitative.Alphabet
+                colorscale = []
+                for i in range(k):
+                    color = palette[i % len(palette)]
+                    colorscale += [[i / k, color], [(i + 1) / k, color]]
+                heatmap_args = dict(
+                    colorscale=colorscale,
+                    zmin=-0.5,
+                    zmax=k - 0.5,
+                    colorbar=dict(
+                        tickvals=list(range(k)),
+                        ticktext=categories,
+                        title=color_by
+                    ),
+                    text=np.asarray(categories, dtype=object)[per_cat.argmax(axis=1)].reshape(bins, bins).tolist(),
+                    hovertemplate="%{text}<extra></extra>",
+                )
+
+        z = np.where(empty, np.nan, z).reshape(bins, bins)
+        z_list = [[None if np.isnan(v) else round(float(v), 4) for v in row] for row in z]
+
+        fig = go.Figure(go.Heatmap(x=x_centers, y=y_centers, z=z_list, hoverongaps=False, **heatmap_args))
+        fig.update_layout(
+            title=title,
+            xaxis=dict(title=f"{label}1", showgrid=False, zeroline=False),
+            yaxis=dict(title=f"{label}2", showgrid=False, zeroline=False, scaleanchor="x"),
+            template="plotly_white",
+            height=600
+        )
+
+        result = {
+            "type": "plotly",
+            "spec": fig.to_dict(),
+            "mode": mode,
+            "n_cells": int(finite.sum()),
+            "bins": bins
+        }
+        result.update(cells.info)
+        return result
 
     @mcp.tool()
     def correlation_heatmap(programs: list[str], corr: list[list[float]], title: str = "Program–program correlation") -> dict:
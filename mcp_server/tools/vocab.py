@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import re
+
+import numpy as np
+from .data import _load_loadings, _load_once, _var_names
+from .lazy import lazy_import
+
+sparse = lazy_import("scipy.sparse")
+
+# Candidates from the trigram index that are re-ranked by edit distance
+FUZZY_CANDIDATES = 50
+# Fuzzy matches below this similarity (1 - edit distance / length) are dropped
+MIN_SIMILARITY = 0.5
+
+_vocab_cache: dict[str, "GeneVocab"] = {}
+
+
+def _trigrams(word: str) -> set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def alias_key(gene: str) -> str:
+    """Spelling-insensitive key: upper case without punctuation or an Ensembl version (HLA-DRA ~ hla.dra ~ HLADRA)"""
+    key = re.sub(r"^(ENS[A-Z]*\d+)\.\d+$", r"\1", str(gene).upper())
+    return re.sub(r"[^A-Z0-9]", "", key)
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Edit distance counting insertions, deletions, substitutions and adjacent swaps as one edit"""
+    prev2, prev = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            d = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if prev2 is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                d = min(d, prev2[j - 2] + 1)
+            cur.append(d)
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class GeneVocab:
+    """
+    Gene symbols of one dataset for autocomplete and typo-tolerant lookup:
+    a sorted upper-cased array (prefix matches are a searchsorted range) and a
+    symbols x trigrams sparse matrix (fuzzy candidates share the most trigrams
+    with the query, then are re-ranked by edit distance).
+    """
+
+    def __init__(self, genes: list[str]):
+        symbols: dict[str, str] = {}
+        for g in genes:
+            symbols.setdefault(str(g).upper(), str(g))
+        self.keys = np.array(sorted(symbols), dtype=str)
+        self.symbols = [symbols[k] for k in self.keys.tolist()]
+        self.aliases: dict[str, list[str]] = {}
+        for symbol in self.symbols:
+            self.aliases.setdefault(alias_key(symbol), []).append(symbol)
+
+        trigram_ids: dict[str, int] = {}
+        rows, cols = [], []
+        for i, key in enumerate(self.keys.tolist()):
+            for t in _trigrams(key):
+                rows.append(i)
+                cols.append(trigram_ids.setdefault(t, len(trigram_ids)))
+        self.trigram_ids = trigram_ids
+        self.trigrams = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(len(self.keys), len(trigram_ids))
+        )
+        self.n_trigrams = np.asarray(self.trigrams.sum(axis=1)).ravel()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def exact(self, gene: str) -> str | None:
+        key = gene.upper()
+        i = int(np.searchsorted(self.keys, key))
+        return self.symbols[i] if i < len(self.keys) and self.keys[i] == key else None
+
+    def resolve(self, gene: str) -> str | None:
+        """The one symbol a query unambiguously means: a case-insensitive match, else a unique alias_key match"""
+        hit = self.exact(gene)
+        if hit is not None:
+            return hit
+        matches = self.aliases.get(alias_key(gene), [])
+        return matches[0] if len(matches) == 1 else None
+
+    def prefix(self, prefix: str, k: int = 10) -> list[str]:
+        key = prefix.upper()
+        lo = int(np.searchsorted(self.keys, key, side="left"))
+        hi = int(np.searchsorted(self.keys, key + "\uffff", side="left"))
+        return self.symbols[lo:min(hi, lo + k)]
+
+    def fuzzy(self, gene: str, k: int = 10) -> list[dict]:
+        key = gene.upper()
+        query = [self.trigram_ids[t] for t in _trigrams(key) if t in self.trigram_ids]
+        if not query:
+            return []
+        shared = np.asarray(self.trigrams[:, query].sum(axis=1)).ravel()
+        jaccard = shared / (self.n_trigrams + len(_trigrams(key)) - shared)
+        n_cand = min(FUZZY_CANDIDATES, int((shared > 0).sum()))
+        if n_cand == 0:
+            return []
+        candidates = np.argpartition(-jaccard, n_cand - 1)[:n_cand]
+
+        scored = []
+        for i in candidates.tolist():
+            other = self.keys[i]
+            similarity = 1 - edit_distance(key, other) / max(len(key), len(other))
+            if similarity >= MIN_SIMILARITY:
+                scored.append((-similarity, -jaccard[i], other, i))
+        scored.sort()
+        return [{"gene": self.symbols[i], "similarity": round(-s, 3)} for s, _, _, i in scored[:k]]
+
+    def suggest(self, gene: str, k: int = 5) -> list[str]:
+        """Best guesses for a symbol that was not found: prefix completions, then fuzzy matches"""
+        hits = self.prefix(gene, k) if len(gene) >= 2 else []
+        for m in self.fuzzy(gene, k):
+            if m["gene"] not in hits:
+                hits.append(m["gene"])
+        return hits[:k]
+
+
+def _load_vocab(dataset_id: str) -> GeneVocab | None:
+    """Cached gene vocabulary of a loadings JSON (its genes) or an H5AD (adata.var_names)"""
+
+    def load():
+        loadings = _load_loadings(dataset_id)
+        if loadings is not None:
+            return GeneVocab(loadings.genes.tolist())
+        genes = _var_names(dataset_id)
+        return GeneVocab(genes) if genes is not None else None
+
+    return _load_once(_vocab_cache, dataset_id, "vocab", load)
+
+
+def _resolve_gene(dataset_id: str, gene: str) -> str | None:
+    """Unambiguous dataset symbol for a query that missed an exact lookup (None if there is none)"""
+    vocab = _load_vocab(dataset_id)
+    return vocab.resolve(gene) if vocab is not None else None
+
+
+def _find_gene(expr, dataset_id: str, gene: str) -> tuple[int | None, bool]:
+    """Position of a gene in an ExpressionStore, via _resolve_gene if the direct lookup misses; and whether it was resolved"""
+    j = expr.find(gene)
+    if j is not None:
+        return j, False
+    resolved = _resolve_gene(dataset_id, gene)
+    return (expr.find(resolved), True) if resolved is not None else (None, False)
+
+
+def _suggestions(dataset_id: str, genes: list[str], k: int = 5) -> dict[str, list[str]]:
+    """{gene: suggestions} for genes that were not found (empty when there is no vocabulary)"""
+    vocab = _load_vocab(dataset_id)
+    if vocab is None:
+        return {}
+    return {g: vocab.suggest(g, k) for g in genes}
+
+
+def register_vocab_tools(mcp):
+
+    @mcp.tool()
+    def suggest_genes(dataset_id: str, query: str, top_k: int = 10) -> dict:
+        """
+        Autocomplete and fuzzy-match a gene symbol against a dataset's genes
+        (loadings JSON genes or H5AD var_names). Use it when a gene lookup
+        returned not found, or to list genes starting with a prefix.
+
+        Args:
+            dataset_id: Dataset ID (JSON or H5AD)
+            query: Gene symbol, partial symbol or misspelling (case-insensitive)
+            top_k: Maximum suggestions per kind
+        """
+        vocab = _load_vocab(dataset_id)
+        if vocab is None:
+            return {"error": f"Dataset {dataset_id} not found"}
+
+        return {
+            "query": query,
+            "exact": vocab.exact(query),
+            "resolved": vocab.resolve(query),
+            "prefix_matches": vocab.prefix(query, top_k),
+            "fuzzy_matches": vocab.fuzzy(query, top_k),
+            "n_genes": len(vocab),
+        }